@@ -0,0 +1,196 @@
+### PIPELINE BENCHMARK ###
+# Times the prompt -> code -> image pipeline of main.py without the network or the Mermaid CLI.
+# The Claude client and mmdc are replaced with local stubs that just wait for a configurable time,
+# so the numbers show the overhead of our own code and how it behaves under concurrency.
+#
+# Usage:
+#   python benchmark.py --runs 50 --concurrency 8 --api-latency 0.8 --render-latency 1.5
+#   python benchmark.py --json > results.json
+
+# Imports
+import argparse
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Keep the benchmark away from the real caches and don't try to start node render workers
+BENCHMARK_CACHE_DIR = tempfile.mkdtemp(prefix="mermaid_benchmark_")
+os.environ["MERMAID_RENDER_CACHE_DIR"] = os.path.join(BENCHMARK_CACHE_DIR, "renders")
+os.environ["MERMAID_PROMPT_CACHE_PATH"] = os.path.join(BENCHMARK_CACHE_DIR, "responses.sqlite3")
+os.environ["MERMAID_RENDER_WORKERS"] = "0"
+
+from PIL import Image
+
+import main
+
+
+class StubUsage:
+    def __init__(self, input_tokens, output_tokens):
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+
+
+class StubResponse:
+    def __init__(self, text, usage):
+        self.content = [type("TextBlock", (), {"text": text})()]
+        self.usage = usage
+
+
+class StubStream:
+    # Mimics the anthropic MessageStream: first token after `first_token_latency`, then one chunk per line
+    def __init__(self, chunks, first_token_latency, chunk_latency, usage):
+        self.chunks = chunks
+        self.first_token_latency = first_token_latency
+        self.chunk_latency = chunk_latency
+        self.usage = usage
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    @property
+    def text_stream(self):
+        time.sleep(self.first_token_latency)
+        for index, chunk in enumerate(self.chunks):
+            if index:
+                time.sleep(self.chunk_latency)
+            yield chunk
+
+    def get_final_message(self):
+        return StubResponse("".join(self.chunks), self.usage)
+
+
+class StubClient:
+    # Stands in for anthropic.Anthropic. Every prompt gets its own diagram so caches don't hide the work.
+    def __init__(self, latency, chunk_latency, nodes):
+        self.messages = self
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.nodes = nodes
+
+    def make_response(self, request):
+        seed = abs(hash(request["messages"][0]["content"])) % 100000
+        lines = [f"    N{seed}_{index}[Step {index}] --> N{seed}_{index + 1}[Step {index + 1}]\n"
+                 for index in range(self.nodes)]
+        return ["```mermaid\n", "graph TD\n"] + lines + ["```"]
+
+    def create(self, **request):
+        time.sleep(self.latency)
+        chunks = self.make_response(request)
+        return StubResponse("".join(chunks), StubUsage(60, 20 * len(chunks)))
+
+    def stream(self, **request):
+        chunks = self.make_response(request)
+        return StubStream(chunks, self.latency, self.chunk_latency, StubUsage(60, 20 * len(chunks)))
+
+
+class BenchmarkGenerator(main.MermaidDiagramGenerator):
+    # The real pipeline, with mmdc swapped for a sleep that returns a blank diagram-sized PNG
+    def __init__(self, client, render_latency, image_size):
+        super().__init__(None, client=client)
+        self.render_latency = render_latency
+
+        image_buffer = io.BytesIO()
+        Image.new("RGB", image_size, "white").save(image_buffer, "PNG")
+        self.stub_image = image_buffer.getvalue()
+
+    def run_mmdc(self, mermaid_code, options):
+        time.sleep(self.render_latency)
+        return self.stub_image
+
+
+def run_once(generator, prompt, display_size):
+    started = time.perf_counter()
+    mermaid_code = generator.get_mermaid_from_claude(prompt)
+    image_data = generator.generate_mermaid_image(mermaid_code)
+    generator.prepare_image(image_data, display_size)
+    return time.perf_counter() - started
+
+
+def run_benchmark(generator, runs, concurrency, display_size, label):
+    prompts = [f"{label} benchmark diagram {index}" for index in range(runs)]
+
+    started = time.perf_counter()
+    if concurrency <= 1:
+        durations = [run_once(generator, prompt, display_size) for prompt in prompts]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            durations = list(executor.map(lambda prompt: run_once(generator, prompt, display_size), prompts))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "runs": runs,
+        "concurrency": concurrency,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_second": round(runs / elapsed, 3),
+        "p50_seconds": main.percentile(durations, 0.5),
+        "p95_seconds": main.percentile(durations, 0.95),
+        "p99_seconds": main.percentile(durations, 0.99),
+    }
+
+
+def print_report(results):
+    for name in ("single_shot", "concurrent"):
+        result = results[name]
+        print(f"{name} ({result['runs']} runs, concurrency {result['concurrency']}): "
+              f"{result['throughput_per_second']}/s, p50 {result['p50_seconds']:.3f}s, "
+              f"p95 {result['p95_seconds']:.3f}s, p99 {result['p99_seconds']:.3f}s")
+
+    print("\nstage                                   count      p50       p95       p99")
+    for name, histogram in sorted(results["stages"]["histograms"].items()):
+        print(f"{name:<38} {histogram['count']:>6} {histogram['p50']:>9.4f} {histogram['p95']:>9.4f} "
+              f"{histogram['p99']:>9.4f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the diagram pipeline against local stubs.")
+    parser.add_argument("--runs", type=int, default=20, help="Diagrams per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="Parallel diagrams in the concurrent scenario")
+    parser.add_argument("--api-latency", type=float, default=0.5, help="Stub Claude time to first token (s)")
+    parser.add_argument("--chunk-latency", type=float, default=0.005, help="Stub delay between streamed chunks (s)")
+    parser.add_argument("--render-latency", type=float, default=1.0, help="Stub mmdc run time (s)")
+    parser.add_argument("--nodes", type=int, default=10, help="Nodes in each generated diagram")
+    parser.add_argument("--image-size", type=int, nargs=2, default=(1600, 1200), help="Stub render size")
+    parser.add_argument("--display-size", type=int, nargs=2, default=(760, 560), help="Preview area size")
+    parser.add_argument("--no-streaming", action="store_true", help="Use messages.create instead of streaming")
+    parser.add_argument("--reuse-decoded", action="store_true",
+                        help="Keep decoded images between runs (every stub render is identical, so by default "
+                             "the decode cache is disabled to measure a real decode per diagram)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--prometheus", action="store_true", help="Print stage metrics as Prometheus text")
+    return parser.parse_args()
+
+
+# Run
+if __name__ == "__main__":
+    args = parse_args()
+    client = StubClient(args.api_latency, args.chunk_latency, args.nodes)
+    generator = BenchmarkGenerator(client, args.render_latency, tuple(args.image_size))
+    generator.use_streaming = not args.no_streaming
+    if not args.reuse_decoded:
+        main.PYRAMID_CACHE_SIZE = 0
+
+    try:
+        results = {
+            "single_shot": run_benchmark(generator, args.runs, 1, tuple(args.display_size), "single"),
+            "concurrent": run_benchmark(generator, args.runs, args.concurrency, tuple(args.display_size),
+                                        "concurrent"),
+            "stages": generator.metrics.snapshot(),
+        }
+    finally:
+        generator.close()
+        shutil.rmtree(BENCHMARK_CACHE_DIR, ignore_errors=True)
+
+    if args.prometheus:
+        sys.stdout.write(generator.metrics.to_prometheus())
+    elif args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
@@ -14,31 +14,885 @@
 ### CODE ###
 
 # Imports
+import argparse
+import difflib
+import hashlib
+import io
+import json
+import logging
 import os
+import random
+import re
+import sqlite3
+import string
 import subprocess
-import tempfile
+import threading
+import time
 import tkinter as tk
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from tkinter import scrolledtext, messagebox
 
 import anthropic
 from PIL import Image, ImageTk
 
+# Only needed to display SVG renders
+try:
+    import cairosvg
+except ImportError:
+    cairosvg = None
+
+# Validation, render workers and the render cache don't need any of the above, so they live in their own module
+from mermaid_render import (CACHE_ROOT, RENDER_CACHE_DIR, RENDER_CACHE_MAX_MB, RENDER_WORKER_MAX_RENDERS,
+                            RENDER_WORKERS, MermaidRenderCache, MermaidRenderError, MermaidRenderPool,
+                            RenderPoolUnavailable, check_mermaid_corpus, percentile, validate_mermaid)
+
+
+logger = logging.getLogger(__name__)
+
+
+# Output format for renders: png, or svg to keep large diagrams small (displaying svg needs cairosvg)
+RENDER_FORMAT = os.environ.get("MERMAID_RENDER_FORMAT", "png")
+SVG_RASTER_SCALE = 2
+
+# Decoded diagrams kept in memory for redisplay, and the smallest pyramid level worth building
+PYRAMID_CACHE_SIZE = 8
+PYRAMID_MIN_SIZE = 64
+
+# Claude request settings
+CLAUDE_MODEL = "claude-3-5-sonnet-20240620"  # Use appropriate model
+CLAUDE_MAX_TOKENS = 1024
+
+# Prompt -> mermaid response cache settings (no fuzzy threshold means exact normalized matches only)
+PROMPT_CACHE_PATH = os.environ.get("MERMAID_PROMPT_CACHE_PATH", os.path.join(CACHE_ROOT, "responses.sqlite3"))
+PROMPT_CACHE_TTL_SECONDS = int(os.environ.get("MERMAID_PROMPT_CACHE_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+PROMPT_CACHE_MAX_ENTRIES = int(os.environ.get("MERMAID_PROMPT_CACHE_MAX_ENTRIES", "10000"))
+PROMPT_CACHE_FUZZY_THRESHOLD = float(os.environ.get("MERMAID_PROMPT_CACHE_FUZZY_THRESHOLD", "0")) or None
+# How often expired responses are deleted, and how far below max entries a trim goes so it doesn't run every insert
+PROMPT_CACHE_EXPIRE_INTERVAL_SECONDS = 60
+PROMPT_CACHE_TRIM_FRACTION = 0.9
+
+# Diagram history: every generated diagram with a small thumbnail, browsable and searchable in the side panel.
+# Full renders are capped separately (in megabytes); past the cap the oldest are dropped and re-rendered on demand.
+HISTORY_DB_PATH = os.environ.get("MERMAID_HISTORY_PATH", os.path.join(CACHE_ROOT, "history.sqlite3"))
+HISTORY_MAX_ENTRIES = int(os.environ.get("MERMAID_HISTORY_MAX_ENTRIES", "50000"))
+HISTORY_MAX_IMAGE_MB = int(os.environ.get("MERMAID_HISTORY_MAX_IMAGE_MB", "500"))
+HISTORY_THUMBNAIL_SIZE = (96, 72)
+HISTORY_THUMBNAIL_QUALITY = 75
+HISTORY_THUMBNAIL_CACHE_SIZE = 200
+HISTORY_ROW_HEIGHT = 80
+HISTORY_PANEL_WIDTH = 300
+HISTORY_SEARCH_DELAY_MS = 250
+
+# Histogram bucket bounds (seconds) and how many raw samples each histogram keeps for percentiles
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+METRICS_MAX_SAMPLES = 10000
+
+# Batch mode settings
+BATCH_MANIFEST_NAME = "manifest.jsonl"
+BATCH_RETRY_STATUS_CODES = {429, 500, 502, 503, 504, 529}
+# Ids become file names in the output directory, so they are limited to characters that are safe in one
+BATCH_ID_RE = re.compile(r"[A-Za-z0-9_.-]+")
+
 
 # Definitions, OOP, etc.
+class PipelineMetrics:
+    # Counters and latency histograms for each stage of the pipeline (Claude call, render, decode, resize, Tk
+    # update). Exportable as JSON or Prometheus text. Histograms also keep a bounded window of raw samples so
+    # we can report p50/p95/p99 without guessing from bucket bounds.
+    def __init__(self, buckets=METRICS_BUCKETS, max_samples=METRICS_MAX_SAMPLES):
+        self.buckets = buckets
+        self.max_samples = max_samples
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = {"buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0,
+                             "samples": deque(maxlen=self.max_samples)}
+                self.histograms[name] = histogram
+
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][index] += 1
+                    break
+            histogram["count"] += 1
+            histogram["sum"] += value
+            histogram["samples"].append(value)
+
+    @contextmanager
+    def time(self, stage):
+        # Records <stage>_seconds, and counts <stage>_errors_total if the block raises
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.increment(f"{stage}_errors_total")
+            raise
+        finally:
+            self.observe(f"{stage}_seconds", time.perf_counter() - started)
+
+    def snapshot(self):
+        with self._lock:
+            histograms = {}
+            for name, histogram in self.histograms.items():
+                samples = list(histogram["samples"])
+                histograms[name] = {
+                    "count": histogram["count"],
+                    "sum": round(histogram["sum"], 6),
+                    "p50": percentile(samples, 0.5),
+                    "p95": percentile(samples, 0.95),
+                    "p99": percentile(samples, 0.99),
+                    "buckets": dict(zip([str(bound) for bound in self.buckets], histogram["buckets"])),
+                }
+            return {"counters": dict(self.counters), "histograms": histograms}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix="mermaid_"):
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}{name} counter")
+                lines.append(f"{prefix}{name} {value}")
+
+            for name, histogram in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram["buckets"]):
+                    cumulative += count
+                    lines.append(f'{prefix}{name}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}{name}_bucket{{le="+Inf"}} {histogram["count"]}')
+                lines.append(f"{prefix}{name}_sum {histogram['sum']}")
+                lines.append(f"{prefix}{name}_count {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        # .prom files get Prometheus text, anything else JSON
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(self.to_prometheus() if path.endswith(".prom") else self.to_json())
+
+
+# Words that don't change which diagram you get back
+PROMPT_FILLER_WORDS = {"a", "an", "the"}
+PROMPT_PUNCTUATION = str.maketrans(string.punctuation, " " * len(string.punctuation))
+
+
+def normalize_prompt(prompt):
+    # "Flowchart of the login process." and "flowchart of login process" normalize to the same key
+    words = prompt.lower().translate(PROMPT_PUNCTUATION).split()
+    return " ".join(word for word in words if word not in PROMPT_FILLER_WORDS)
+
+
+class PromptResponseCache:
+    # SQLite backed cache of prompt -> mermaid code, sitting in front of the Claude API.
+    # Keys are the normalized prompt plus the model and a hash of the system prompt, so changing either
+    # never serves stale answers. Optionally falls back to the closest cached prompt above fuzzy_threshold.
+    # Lookups skip expired rows; deleting them, and trimming to max_entries, only happens now and then.
+    def __init__(self, db_path, ttl_seconds, max_entries, fuzzy_threshold=None, fuzzy_candidates=500,
+                 expire_interval=PROMPT_CACHE_EXPIRE_INTERVAL_SECONDS):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.fuzzy_threshold = fuzzy_threshold
+        self.fuzzy_candidates = fuzzy_candidates
+        self.expire_interval = expire_interval
+        self._next_expiry = 0
+
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self.latency_saved_seconds = 0.0
+
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                system_hash TEXT NOT NULL,
+                normalized_prompt TEXT NOT NULL,
+                mermaid_code TEXT NOT NULL,
+                api_seconds REAL NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_scope ON responses (model, system_hash, last_used);
+            CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+        """)
+        self._connection.commit()
+        self._entries = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(normalized_prompt, model, system_hash):
+        return hashlib.sha256(f"{model}\0{system_hash}\0{normalized_prompt}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def hash_system_prompt(system_prompt):
+        return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+
+    def get(self, prompt, model, system_prompt):
+        normalized = normalize_prompt(prompt)
+        system_hash = self.hash_system_prompt(system_prompt)
+        key = self.make_key(normalized, model, system_hash)
+        now = time.time()
+
+        with self._lock:
+            self._expire(now)
+            row = self._connection.execute(
+                "SELECT key, mermaid_code, api_seconds FROM responses WHERE key = ? AND created >= ?",
+                (key, now - self.ttl_seconds)).fetchone()
+
+            if row is None and self.fuzzy_threshold:
+                row = self._find_similar(normalized, model, system_hash, now - self.ttl_seconds)
+                if row is not None:
+                    self.fuzzy_hits += 1
+
+            if row is None:
+                self.misses += 1
+                self._connection.commit()
+                return None
+
+            self.hits += 1
+            self.latency_saved_seconds += row[2]
+            self._connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, row[0]))
+            self._connection.commit()
+            return row[1]
+
+    def _find_similar(self, normalized, model, system_hash, oldest):
+        # Only compare against the most recently used prompts, this is a linear scan
+        candidates = self._connection.execute(
+            "SELECT key, mermaid_code, api_seconds, normalized_prompt FROM responses "
+            "WHERE model = ? AND system_hash = ? AND created >= ? ORDER BY last_used DESC LIMIT ?",
+            (model, system_hash, oldest, self.fuzzy_candidates)).fetchall()
+
+        best_row = None
+        best_ratio = self.fuzzy_threshold
+        matcher = difflib.SequenceMatcher(b=normalized)
+        for candidate in candidates:
+            matcher.set_seq1(candidate[3])
+            if matcher.real_quick_ratio() < best_ratio or matcher.quick_ratio() < best_ratio:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= best_ratio:
+                best_ratio = ratio
+                best_row = candidate[:3]
+        return best_row
+
+    def put(self, prompt, model, system_prompt, mermaid_code, api_seconds):
+        normalized = normalize_prompt(prompt)
+        system_hash = self.hash_system_prompt(system_prompt)
+        key = self.make_key(normalized, model, system_hash)
+        now = time.time()
+
+        with self._lock:
+            exists = self._connection.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, system_hash, normalized, mermaid_code, api_seconds, now, now))
+            if exists is None:
+                self._entries += 1
+
+            # Over max_entries, drop the least recently used down to a bit below it
+            if self._entries > self.max_entries:
+                excess = self._entries - int(self.max_entries * PROMPT_CACHE_TRIM_FRACTION)
+                self._entries -= self._connection.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY last_used LIMIT ?)", (excess,)).rowcount
+            self._expire(now)
+            self._connection.commit()
+
+    def _expire(self, now):
+        # Delete responses past their TTL, at most once every expire_interval. Called with the lock held.
+        if now < self._next_expiry:
+            return
+        self._next_expiry = now + self.expire_interval
+        self._entries -= self._connection.execute(
+            "DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,)).rowcount
+
+    def stats(self):
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return {
+                "hits": self.hits,
+                "fuzzy_hits": self.fuzzy_hits,
+                "misses": self.misses,
+                "entries": entries,
+                "latency_saved_seconds": round(self.latency_saved_seconds, 3),
+            }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class DiagramHistoryStore:
+    # SQLite backed history of every diagram generated in the app: prompt, mermaid code, timings, a small
+    # thumbnail for the history panel and the full render, so a past diagram can be shown again without
+    # calling Claude or rendering. Renders live in their own table, so listing and searching never read them.
+    # Renders are capped at max_image_bytes in total; past that the oldest renders are dropped (the entry, its
+    # thumbnail and its code stay) and get() returns None for the image, so the caller renders it again.
+    # Prompt search goes through an FTS5 index when SQLite has it, and falls back to a LIKE scan otherwise.
+    def __init__(self, db_path, max_entries, max_image_bytes):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_image_bytes = max_image_bytes
+
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS diagrams (
+                id INTEGER PRIMARY KEY,
+                prompt TEXT NOT NULL,
+                mermaid_code TEXT NOT NULL,
+                image_format TEXT NOT NULL,
+                thumbnail BLOB NOT NULL,
+                time_to_code REAL,
+                time_to_render REAL,
+                cache_hit INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS diagram_images (
+                id INTEGER PRIMARY KEY REFERENCES diagrams (id) ON DELETE CASCADE,
+                image BLOB NOT NULL
+            );
+        """)
+
+        # Keep the full text index in step with the table through triggers, so every write path is covered
+        try:
+            self._connection.executescript("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS diagrams_search
+                    USING fts5(prompt, content='diagrams', content_rowid='id');
+                CREATE TRIGGER IF NOT EXISTS diagrams_search_insert AFTER INSERT ON diagrams BEGIN
+                    INSERT INTO diagrams_search (rowid, prompt) VALUES (new.id, new.prompt);
+                END;
+                CREATE TRIGGER IF NOT EXISTS diagrams_search_delete AFTER DELETE ON diagrams BEGIN
+                    INSERT INTO diagrams_search (diagrams_search, rowid, prompt) VALUES ('delete', old.id, old.prompt);
+                END;
+            """)
+            self.full_text_search = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5
+            self.full_text_search = False
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        self._connection.commit()
+
+        # Running total of the stored renders, so add() never has to sum the table
+        self.image_bytes = self._connection.execute(
+            "SELECT COALESCE(SUM(length(image)), 0) FROM diagram_images").fetchone()[0]
+
+    @staticmethod
+    def make_match_query(text):
+        # Every word has to appear, and the last one may still be half typed
+        words = text.translate(PROMPT_PUNCTUATION).split()
+        if not words:
+            return None
+        terms = [f'"{word}"' for word in words]
+        terms[-1] += "*"
+        return " ".join(terms)
+
+    def _where(self, text):
+        # (join + WHERE clause, parameters) selecting the diagrams whose prompt matches text
+        text = (text or "").strip()
+        if not text:
+            return "", ()
+        if self.full_text_search:
+            match_query = self.make_match_query(text)
+            if match_query is None:
+                return "", ()
+            return ("JOIN diagrams_search ON diagrams_search.rowid = diagrams.id WHERE diagrams_search MATCH ?",
+                    (match_query,))
+        pattern = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return "WHERE diagrams.prompt LIKE ? ESCAPE '\\'", (pattern,)
+
+    def add(self, prompt, mermaid_code, image_data, image_format, thumbnail, timings):
+        # Returns the new entry's id
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT INTO diagrams (prompt, mermaid_code, image_format, thumbnail, time_to_code, time_to_render, "
+                "cache_hit, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (prompt, mermaid_code, image_format, thumbnail, timings.get("time_to_code"),
+                 timings.get("time_to_render"), int(bool(timings.get("cache_hit"))), time.time()))
+            entry_id = cursor.lastrowid
+            self._connection.execute("INSERT INTO diagram_images (id, image) VALUES (?, ?)", (entry_id, image_data))
+            self.image_bytes += len(image_data)
+
+            # Keep only the newest max_entries. Ids only grow and pruning always takes the oldest, so that's a
+            # range delete on the primary key (their renders go with them through the foreign key)
+            cutoff = entry_id - self.max_entries
+            if cutoff > 0:
+                self.image_bytes -= self._connection.execute(
+                    "SELECT COALESCE(SUM(length(image)), 0) FROM diagram_images WHERE id <= ?", (cutoff,)).fetchone()[0]
+                self._connection.execute("DELETE FROM diagrams WHERE id <= ?", (cutoff,))
+
+            if self.image_bytes > self.max_image_bytes:
+                self._prune_images()
+            self._connection.commit()
+            return entry_id
+
+    def _prune_images(self):
+        # Drop the oldest renders until the rest fit under max_image_bytes; length() reads only the blob header
+        cutoff = None
+        rows = self._connection.execute("SELECT id, length(image) FROM diagram_images ORDER BY id")
+        for image_id, size in rows:
+            if self.image_bytes <= self.max_image_bytes:
+                break
+            self.image_bytes -= size
+            cutoff = image_id
+        rows.close()
+        if cutoff is not None:
+            self._connection.execute("DELETE FROM diagram_images WHERE id <= ?", (cutoff,))
+
+    def count(self, text=None):
+        where, parameters = self._where(text)
+        with self._lock:
+            return self._connection.execute(f"SELECT COUNT(*) FROM diagrams {where}", parameters).fetchone()[0]
+
+    def search(self, text=None, offset=0, limit=50):
+        # Newest first: [{"id", "prompt", "created", "time_to_code", "time_to_render", "cache_hit"}]
+        where, parameters = self._where(text)
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT diagrams.id, diagrams.prompt, diagrams.created, diagrams.time_to_code, "
+                f"diagrams.time_to_render, diagrams.cache_hit FROM diagrams {where} "
+                "ORDER BY diagrams.id DESC LIMIT ? OFFSET ?", parameters + (limit, offset)).fetchall()
+        return [{"id": row[0], "prompt": row[1], "created": row[2], "time_to_code": row[3],
+                 "time_to_render": row[4], "cache_hit": bool(row[5])} for row in rows]
+
+    def thumbnail(self, entry_id):
+        with self._lock:
+            row = self._connection.execute("SELECT thumbnail FROM diagrams WHERE id = ?", (entry_id,)).fetchone()
+        return row[0] if row else None
+
+    def get(self, entry_id):
+        # Everything needed to show the diagram again, or None if it has been pruned. "image" is None when only
+        # the full render was pruned; the mermaid code is still there to render it again.
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT diagrams.prompt, diagrams.mermaid_code, diagrams.image_format, diagram_images.image "
+                "FROM diagrams LEFT JOIN diagram_images ON diagram_images.id = diagrams.id WHERE diagrams.id = ?",
+                (entry_id,)).fetchone()
+        if row is None:
+            return None
+        return {"id": entry_id, "prompt": row[0], "mermaid_code": row[1], "image_format": row[2], "image": row[3]}
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def make_thumbnail(pil_image, size=None):
+    # Small JPEG for the history panel; transparent diagrams are flattened onto white first
+    thumbnail = pil_image.copy()
+    thumbnail.thumbnail(size or HISTORY_THUMBNAIL_SIZE, Image.LANCZOS)
+    if thumbnail.mode != "RGB":
+        background = Image.new("RGB", thumbnail.size, "white")
+        background.paste(thumbnail, mask=thumbnail.getchannel("A") if "A" in thumbnail.getbands() else None)
+        thumbnail = background
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, "JPEG", quality=HISTORY_THUMBNAIL_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+class MermaidFenceScanner:
+    # Pulls the mermaid code out of a (possibly still streaming) Claude response.
+    # feed() returns the code as soon as the closing ``` fence arrives, so rendering can start early.
+    def __init__(self):
+        self.text = ""
+        self.code = None
+        self._code_start = None
+
+    def feed(self, chunk):
+        self.text += chunk
+        if self.code is not None:
+            return None
+
+        # Find the opening fence, i.e. ```mermaid (or a bare ```) followed by a newline
+        if self._code_start is None:
+            stripped = self.text.lstrip()
+            if not stripped.startswith("```"):
+                return None
+            newline = stripped.find("\n")
+            if newline == -1:
+                return None
+            self._code_start = len(self.text) - len(stripped) + newline + 1
+
+        closing = self.text.find("```", self._code_start)
+        if closing == -1:
+            return None
+
+        self.code = self.text[self._code_start:closing].strip()
+        return self.code
+
+    def finish(self):
+        if self.code is not None:
+            return self.code
+
+        # No complete fence, so treat the whole response as code (dropping a dangling fence if any)
+        mermaid_code = self.text.strip()
+        if mermaid_code.startswith("```mermaid"):
+            mermaid_code = mermaid_code.replace("```mermaid", "").replace("```", "").strip()
+        elif mermaid_code.startswith("```"):
+            mermaid_code = mermaid_code.replace("```", "").strip()
+        return mermaid_code
+
+
+def extract_mermaid_code(response_text):
+    scanner = MermaidFenceScanner()
+    scanner.feed(response_text)
+    return scanner.finish()
+
+
+def decode_image(image_data):
+    # PNG bytes straight from the renderer, or SVG rasterised at SVG_RASTER_SCALE so downscales stay sharp
+    if image_data.lstrip()[:5] in (b"<svg ", b"<?xml"):
+        if cairosvg is None:
+            raise Exception("Displaying SVG renders needs cairosvg. Install it using: pip install cairosvg")
+        image_data = cairosvg.svg2png(bytestring=image_data, scale=SVG_RASTER_SCALE)
+
+    pil_image = Image.open(io.BytesIO(image_data))
+    pil_image.load()
+
+    # reduce() doesn't work on palette images
+    if pil_image.mode not in ("RGB", "RGBA"):
+        pil_image = pil_image.convert("RGBA")
+    return pil_image
+
+
+class ImagePyramid:
+    # A decoded diagram plus successively halved copies of it, built on demand.
+    # Resizing picks the smallest level that is still at least as big as the target and only does a cheap
+    # bilinear scale from there, instead of a full LANCZOS resize of the original every time.
+    def __init__(self, pil_image):
+        self.levels = [pil_image]
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self.levels[0].size
+
+    def fit(self, max_size):
+        # Largest size within max_size that keeps the aspect ratio, never enlarging
+        max_width, max_height = max_size
+        width, height = self.size
+        if width <= max_width and height <= max_height:
+            return width, height
+        ratio = min(max_width / width, max_height / height)
+        return max(1, int(width * ratio)), max(1, int(height * ratio))
+
+    def scaled(self, max_size):
+        target = self.fit(max_size)
+        level = self.level_for(target)
+        if level.size == target:
+            return level
+        return level.resize(target, Image.BILINEAR)
+
+    def level_for(self, target):
+        with self._lock:
+            # Halve until the next level would be smaller than the target
+            while True:
+                smallest = self.levels[-1]
+                if (smallest.width // 2 < max(target[0], PYRAMID_MIN_SIZE)
+                        or smallest.height // 2 < max(target[1], PYRAMID_MIN_SIZE)):
+                    break
+                self.levels.append(smallest.reduce(2))
+
+            for level in reversed(self.levels):
+                if level.width >= target[0] and level.height >= target[1]:
+                    return level
+            return self.levels[0]
+
+
+class JobCancelled(Exception):
+    # Raised inside a pipeline stage once a newer request has superseded its job
+    pass
+
+
+class DiagramJob:
+    # One prompt -> code -> image run. Every stage gets its own future so a newer job can cancel whatever is pending.
+    def __init__(self, prompt, max_size):
+        self.prompt = prompt
+        self.max_size = max_size
+        self.cancel_event = threading.Event()
+        self.futures = {}
+        self.early_render_code = None
+        self.mermaid_code = None
+        self.image_data = None
+        self.timings = {}
+        self.done = False
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+        for future in list(self.futures.values()):
+            future.cancel()
+
+
+class HistoryPanel:
+    # Scrollable list of past diagrams, newest first. Only enough rows to fill the canvas exist; scrolling
+    # re-fills them with the entries now in view, so the panel costs the same with ten entries or fifty thousand.
+    # Thumbnails are read and decoded on a worker thread as their rows come into view, and the decoded ones are
+    # kept in a small LRU so scrolling back doesn't decode them again.
+    def __init__(self, parent, store, executor, on_open):
+        self.store = store
+        self.executor = executor
+        self.on_open = on_open
+
+        self.query = ""
+        self.total = 0
+        self.first = 0
+        self.entries = []
+        self.slots = []
+        self.thumbnails = OrderedDict()
+        self.loading = set()
+        self.search_after_id = None
+
+        self.frame = tk.LabelFrame(parent, text="History")
+        self.frame.columnconfigure(0, weight=1)
+        self.frame.rowconfigure(1, weight=1)
+
+        # Searching waits for a pause in typing instead of querying on every key
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add("write", self.on_search_changed)
+        self.search_entry = tk.Entry(self.frame, textvariable=self.search_var)
+        self.search_entry.grid(row=0, column=0, columnspan=2, sticky="ew", padx=5, pady=5)
+
+        self.canvas = tk.Canvas(self.frame, width=HISTORY_PANEL_WIDTH, bg="#222222", highlightthickness=0)
+        self.canvas.grid(row=1, column=0, sticky="nsew", padx=(5, 0), pady=5)
+        self.scrollbar = tk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.scrollbar.grid(row=1, column=1, sticky="ns", padx=(0, 5), pady=5)
+
+        self.count_label = tk.Label(self.frame, text="", anchor="w")
+        self.count_label.grid(row=2, column=0, columnspan=2, sticky="ew", padx=5, pady=(0, 5))
+
+        self.canvas.bind("<Configure>", self.on_canvas_resize)
+        self.canvas.bind("<Button-1>", self.on_click)
+        self.canvas.bind("<MouseWheel>", lambda event: self.scroll_to(self.first - (1 if event.delta > 0 else -1)))
+        self.canvas.bind("<Button-4>", lambda event: self.scroll_to(self.first - 1))
+        self.canvas.bind("<Button-5>", lambda event: self.scroll_to(self.first + 1))
+
+        self.refresh()
+
+    def visible_rows(self):
+        # Rows that fit in the canvas, counting a partly visible one at the bottom
+        return max(1, -(-self.canvas.winfo_height() // HISTORY_ROW_HEIGHT))
+
+    def on_canvas_resize(self, event):
+        # One (background, thumbnail, text) set of canvas items per row that fits
+        rows = self.visible_rows()
+        while len(self.slots) > rows:
+            for item in self.slots.pop():
+                self.canvas.delete(item)
+        while len(self.slots) < rows:
+            top = len(self.slots) * HISTORY_ROW_HEIGHT
+            self.slots.append((
+                self.canvas.create_rectangle(0, top, 0, top + HISTORY_ROW_HEIGHT - 2, fill="#2e2e2e", width=0),
+                self.canvas.create_image(6, top + HISTORY_ROW_HEIGHT // 2, anchor="w"),
+                self.canvas.create_text(HISTORY_THUMBNAIL_SIZE[0] + 14, top + 6, anchor="nw", fill="white"),
+            ))
+        for background, image, text in self.slots:
+            x0, y0, x1, y1 = self.canvas.coords(background)
+            self.canvas.coords(background, 0, y0, event.width, y1)
+            self.canvas.itemconfig(text, width=max(1, event.width - HISTORY_THUMBNAIL_SIZE[0] - 20))
+        self.scroll_to(self.first)
+
+    def refresh(self):
+        # Re-count and re-read the rows in view, e.g. after a new diagram was added
+        self.total = self.store.count(self.query)
+        self.count_label.config(text=f"{self.total} diagram{'' if self.total == 1 else 's'}")
+        self.scroll_to(self.first)
+
+    def scroll_to(self, first):
+        self.first = max(0, min(first, self.total - self.visible_rows() + 1))
+        self.entries = self.store.search(self.query, self.first, len(self.slots)) if self.slots else []
+
+        for index, (background, image, text) in enumerate(self.slots):
+            if index >= len(self.entries):
+                for item in (background, image, text):
+                    self.canvas.itemconfig(item, state="hidden")
+                continue
+
+            entry = self.entries[index]
+            prompt = entry["prompt"] if len(entry["prompt"]) <= 90 else entry["prompt"][:87] + "..."
+            details = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["created"]))
+            if entry["time_to_render"] is not None:
+                details += f"  ({entry['time_to_render']:.1f}s{', cached' if entry['cache_hit'] else ''})"
+            self.canvas.itemconfig(background, state="normal")
+            self.canvas.itemconfig(text, state="normal", text=f"{prompt}\n{details}")
+
+            thumbnail = self.thumbnails.get(entry["id"])
+            if thumbnail is not None:
+                self.thumbnails.move_to_end(entry["id"])
+            else:
+                self.request_thumbnail(entry["id"])
+            self.canvas.itemconfig(image, state="normal", image=thumbnail or "")
+
+        # Scrollbar position in entries, not pixels: the canvas itself never scrolls
+        if self.total:
+            self.scrollbar.set(self.first / self.total, min(1.0, (self.first + len(self.slots)) / self.total))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * self.total))
+        elif unit == "pages":
+            self.scroll_to(self.first + int(amount) * max(1, len(self.slots) - 1))
+        else:
+            self.scroll_to(self.first + int(amount))
+
+    def request_thumbnail(self, entry_id):
+        if entry_id in self.loading:
+            return
+        self.loading.add(entry_id)
+        future = self.executor.submit(self.load_thumbnail, entry_id)
+        future.add_done_callback(lambda done: self.frame.after(0, self.show_thumbnail, entry_id, done))
+
+    def load_thumbnail(self, entry_id):
+        # Worker thread: read and decode only, PhotoImages have to be made on the Tk thread
+        data = self.store.thumbnail(entry_id)
+        if data is None:
+            return None
+        pil_image = Image.open(io.BytesIO(data))
+        pil_image.load()
+        return pil_image
+
+    def show_thumbnail(self, entry_id, future):
+        self.loading.discard(entry_id)
+        if future.cancelled() or future.exception() is not None or future.result() is None:
+            return
+
+        thumbnail = ImageTk.PhotoImage(future.result())
+        self.thumbnails[entry_id] = thumbnail
+        while len(self.thumbnails) > HISTORY_THUMBNAIL_CACHE_SIZE:
+            self.thumbnails.popitem(last=False)
+
+        # The row may have scrolled away while this was loading
+        for index, entry in enumerate(self.entries):
+            if entry["id"] == entry_id:
+                self.canvas.itemconfig(self.slots[index][1], image=thumbnail)
+
+    def on_click(self, event):
+        index = int(event.y // HISTORY_ROW_HEIGHT)
+        if index < len(self.entries):
+            self.on_open(self.entries[index]["id"])
+
+    def on_search_changed(self, *args):
+        if self.search_after_id is not None:
+            self.frame.after_cancel(self.search_after_id)
+        self.search_after_id = self.frame.after(HISTORY_SEARCH_DELAY_MS, self.apply_search)
+
+    def apply_search(self):
+        self.search_after_id = None
+        self.query = self.search_var.get().strip()
+        self.first = 0
+        self.refresh()
+
+
 class MermaidDiagramGenerator:
-    def __init__(self, root):
+    # client can be any object with the anthropic client interface (messages.create / messages.stream),
+    # e.g. a fake for running offline. By default a real client is created on first use.
+    def __init__(self, root, client=None, api_key=None, api_max_retries=None):
         self.root = root
+
+        # Claude API key, asked for in the window if it isn't set. Not needed when a client is passed in.
+        self.api_key = api_key or os.environ.get("ANTHROPIC_API_KEY")
+        if not self.api_key and client is None and self.root is not None:
+            self.api_key = tk.simpledialog.askstring("API Key", "Enter your Anthropic API Key:", show="*")
+
+        # One Claude client for the lifetime of the app, so connections get reused. api_max_retries overrides the
+        # SDK's own retries (None keeps its default).
+        self.client = client
+        self.api_max_retries = api_max_retries
+        self.client_lock = threading.Lock()
+
+        # Stream responses so the code shows up as it is written, and rendering starts at the closing fence
+        self.use_streaming = True
+
+        # Ask Claude once to fix code that fails validation, instead of just reporting the error
+        self.auto_repair = True
+
+        # Near-identical prompts are answered from here instead of paying for another API call
+        self.prompt_cache = PromptResponseCache(PROMPT_CACHE_PATH, PROMPT_CACHE_TTL_SECONDS,
+                                                PROMPT_CACHE_MAX_ENTRIES, PROMPT_CACHE_FUZZY_THRESHOLD)
+
+        # Per-stage counters and latency histograms, see PipelineMetrics
+        self.metrics = PipelineMetrics()
+
+        # Store the current mermaid code
+        self.current_mermaid_code = ""
+
+        # Options passed to mmdc; these are part of the render cache key
+        self.render_options = {
+            "format": RENDER_FORMAT,
+            "theme": "default",
+            "background": "white",
+            "width": 800,
+            "height": 600,
+        }
+        self.render_cache = MermaidRenderCache(RENDER_CACHE_DIR, RENDER_CACHE_MAX_MB * 1024 * 1024)
+
+        # Warm render workers, started in the background so the window opens straight away.
+        # Until they are ready (or if node isn't available) renders go through mmdc.
+        self.render_pool = MermaidRenderPool(RENDER_WORKERS, RENDER_WORKER_MAX_RENDERS)
+        self.render_executor = ThreadPoolExecutor(max_workers=max(1, RENDER_WORKERS))
+        pool_thread = threading.Thread(target=self.render_pool.start)
+        pool_thread.daemon = True
+        pool_thread.start()
+
+        # Decoded images by content hash, and the one currently on screen (so window resizes can refit it)
+        self.pyramids = OrderedDict()
+        self.pyramid_lock = threading.Lock()
+        self.current_pyramid = None
+        self.displayed_size = None
+        self.resize_after_id = None
+
+        # Claude calls and image decoding run here, never on the Tk thread
+        self.pipeline_executor = ThreadPoolExecutor(max_workers=2)
+        self.current_job = None
+
+        # Every diagram shown in the window goes into the history, so it can be opened again later without
+        # another API call or render. Batch runs have their own manifest and don't use it.
+        self.history = None
+        self.history_panel = None
+        self.history_request = 0
+        if self.root is not None:
+            self.history = DiagramHistoryStore(HISTORY_DB_PATH, HISTORY_MAX_ENTRIES, HISTORY_MAX_IMAGE_MB * 1024 * 1024)
+
+        # root is None when running headless (batch mode), in which case there is no window to build
+        if self.root is not None:
+            self.setup_ui()
+            self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def setup_ui(self):
         self.root.title("Mermaid Diagram Generator")
-        self.root.geometry("800x800")
+        self.root.geometry("1100x800")
 
         # Configure main window
         self.root.columnconfigure(0, weight=1)
         self.root.rowconfigure(0, weight=1)
 
         # Split the window into two frames
-        self.main_frame = tk.Frame(root)
+        self.main_frame = tk.Frame(self.root)
         self.main_frame.grid(row=0, column=0, sticky="nsew", padx=10, pady=10)
         self.main_frame.columnconfigure(0, weight=1)
+        self.main_frame.columnconfigure(1, weight=0)
         self.main_frame.rowconfigure(0, weight=1)
         self.main_frame.rowconfigure(1, weight=0)
 
@@ -52,6 +906,7 @@ class MermaidDiagramGenerator:
                                    bg=bg_color, fg="white",  # Dark background, white text
                                    highlightthickness=0, bd=0)  # Remove border
         self.image_label.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.image_frame.bind("<Configure>", self.on_preview_resize)
 
         # Create the input area
         self.input_frame = tk.LabelFrame(self.main_frame, text="Diagram Description")
@@ -70,14 +925,24 @@ class MermaidDiagramGenerator:
         self.generate_button = tk.Button(self.button_frame, text="Generate Diagram", command=self.generate_diagram)
         self.generate_button.pack(side=tk.RIGHT, padx=5)
 
-        # Claude API key
-        #self.api_key = os.environ.get("ANTHROPIC_API_KEY", "")
-        self.api_key = "123XYZ"
-        if not self.api_key:
-            self.api_key = tk.simpledialog.askstring("API Key", "Enter your Anthropic API Key:", show="*")
+        # Past diagrams down the right hand side
+        self.history_panel = HistoryPanel(self.main_frame, self.history, self.pipeline_executor,
+                                          self.open_history_entry)
+        self.history_panel.frame.grid(row=0, column=1, rowspan=2, sticky="ns", padx=5, pady=5)
 
-        # Store the current mermaid code
-        self.current_mermaid_code = ""
+    def close(self):
+        if self.current_job is not None:
+            self.current_job.cancel()
+        self.render_pool.close()
+        self.render_executor.shutdown(wait=False)
+        self.pipeline_executor.shutdown(wait=False)
+        self.prompt_cache.close()
+        if self.history is not None:
+            self.history.close()
+
+    def on_close(self):
+        self.close()
+        self.root.destroy()
 
     def generate_diagram(self):
         prompt = self.input_text.get("1.0", tk.END).strip()
@@ -85,30 +950,220 @@ class MermaidDiagramGenerator:
             messagebox.showwarning("Warning", "Please enter a description for the diagram you want to create.")
             return
 
-        try:
-            # Show waiting message
-            self.image_label.config(text="Generating diagram, please wait...")
-            self.root.update()
+        # Clicking Generate again for the prompt that is already being worked on just waits for that job
+        job = self.current_job
+        if job is not None and not job.done:
+            if job.prompt == prompt:
+                return
+            # A different prompt supersedes whatever is still in flight
+            job.cancel()
+
+        # Size the image for the preview area as it is now; Tk must only be touched from this thread
+        max_size = (self.image_frame.winfo_width() - 20, self.image_frame.winfo_height() - 20)
+        job = DiagramJob(prompt, max_size)
+        self.current_job = job
+        self.history_request += 1
+
+        # Show waiting message
+        self.image_label.config(image="", text="Generating diagram, please wait...")
+        self.image_label.image = None
+
+        # Stage 1: generate mermaid code using Claude API
+        self.start_stage(job, "code", self.pipeline_executor, self.run_code_stage, job)
+
+    def start_stage(self, job, stage, executor, function, *args):
+        future = executor.submit(function, *args)
+        self.watch_stage(job, stage, future)
+
+    def watch_stage(self, job, stage, future):
+        job.futures[stage] = future
+        future.add_done_callback(lambda done: self.on_stage_done(job, stage, done))
+
+    def run_code_stage(self, job):
+        def on_text(response_text):
+            self.root.after(0, self.show_partial_code, job, response_text)
+
+        def on_code(code):
+            # Start rendering as soon as the code block is complete, while the rest of the response streams in
+            job.early_render_code = code
+            self.watch_stage(job, "early_render", self.render_executor.submit(self.generate_mermaid_image, code))
+
+        mermaid_code = self.get_mermaid_from_claude(job.prompt, on_text=on_text, on_code=on_code,
+                                                    cancel_event=job.cancel_event, timings=job.timings)
+        return self.validate_or_repair(mermaid_code, job.cancel_event)
+
+    def validate_or_repair(self, mermaid_code, cancel_event=None, before_repair=None):
+        error = validate_mermaid(mermaid_code)
+        if error is None:
+            return mermaid_code
+        if not self.auto_repair:
+            raise error
+
+        # One round trip to Claude with the error; if that doesn't fix it, give up
+        if before_repair:
+            before_repair()
+        repaired_code = self.repair_mermaid_code(mermaid_code, error, cancel_event)
+        repaired_error = validate_mermaid(repaired_code)
+        if repaired_error is not None:
+            raise repaired_error
+        return repaired_code
+
+    def repair_mermaid_code(self, mermaid_code, error, cancel_event=None):
+        repair_prompt = (f"a corrected version of the following Mermaid code, which fails to parse with "
+                         f"\"{str(error)}\":\n{mermaid_code}")
+        # Not through the prompt cache: normalizing would make repairs of slightly different code share a key
+        return self.get_mermaid_from_claude(repair_prompt, cancel_event=cancel_event, use_cache=False)
+
+    def on_stage_done(self, job, stage, future):
+        # Runs on whichever thread finished the stage, so UI work goes through root.after
+        if future.cancelled():
+            return
+
+        error = future.exception()
+        if job.cancelled:
+            return
+
+        if stage == "early_render":
+            # Picked up by the image stage below
+            return
+
+        if error is not None:
+            self.root.after(0, self.finish_job, job, error)
+            return
 
-            # Generate mermaid code using Claude API
-            mermaid_code = self.get_mermaid_from_claude(prompt)
+        if stage == "code":
+            mermaid_code = future.result()
+            job.mermaid_code = mermaid_code
+            self.root.after(0, self.set_current_code, job, mermaid_code)
+
+            # Stage 2: generate image from mermaid code, reusing the early render if it was of the same code
+            early_render = job.futures.get("early_render")
+            if early_render is not None and job.early_render_code == mermaid_code:
+                self.watch_stage(job, "image", early_render)
+            else:
+                self.start_stage(job, "image", self.render_executor, self.generate_mermaid_image, mermaid_code)
+
+        elif stage == "image":
+            job.timings["time_to_render"] = time.perf_counter() - job.timings["started"]
+            job.image_data = future.result()
+
+            # Stage 3: decode and resize off the Tk thread
+            self.start_stage(job, "display", self.pipeline_executor, self.prepare_image,
+                             job.image_data, job.max_size)
+
+        elif stage == "display":
+            self.root.after(0, self.finish_job, job, None, future.result())
+
+    def set_current_code(self, job, mermaid_code):
+        if job is self.current_job:
             self.current_mermaid_code = mermaid_code
 
-            # Generate image from mermaid code
-            image_path = self.generate_mermaid_image(mermaid_code)
+    def finish_job(self, job, error, prepared=None):
+        job.done = True
+        if job is not self.current_job or job.cancelled:
+            return
+
+        if error is not None:
+            self.image_label.config(text="No diagram generated yet")
+            messagebox.showerror("Error", f"An error occurred: {str(error)}")
+            return
 
-            # Display the image
-            self.display_image(image_path)
+        # Display the image
+        self.current_pyramid, pil_image = prepared
+        self.displayed_size = job.max_size
+        self.show_image(pil_image)
+        self.record_history(job)
 
-            # Show success message
-            messagebox.showinfo("Success", "Diagram generated successfully!")
+        # Show success message
+        messagebox.showinfo("Success", "Diagram generated successfully!")
 
-        except Exception as e:
-            messagebox.showerror("Error", f"An error occurred: {str(e)}")
+    def record_history(self, job):
+        if self.history is None:
+            return
+        future = self.pipeline_executor.submit(self.save_to_history, job, self.current_pyramid, dict(job.timings))
+        future.add_done_callback(lambda done: self.root.after(0, self.on_history_recorded, done))
+
+    def save_to_history(self, job, pyramid, timings):
+        # The thumbnail comes from the already decoded pyramid, so this is a small resize and a SQLite insert
+        thumbnail = make_thumbnail(pyramid.scaled(HISTORY_THUMBNAIL_SIZE))
+        return self.history.add(job.prompt, job.mermaid_code, job.image_data, self.render_options["format"],
+                                thumbnail, timings)
+
+    def on_history_recorded(self, future):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            # Not worth interrupting the user over; the diagram itself is on screen
+            logger.warning("Could not save diagram to history: %s", future.exception())
+            return
+        self.history_panel.refresh()
+
+    def open_history_entry(self, entry_id):
+        # Show a past diagram straight from the history store: no Claude call, and no render unless its full
+        # render has been pruned
+        job = self.current_job
+        if job is not None and not job.done:
+            job.cancel()
+        self.current_job = None
+
+        self.history_request += 1
+        request = self.history_request
+        max_size = (self.image_frame.winfo_width() - 20, self.image_frame.winfo_height() - 20)
+        self.image_label.config(image="", text="Loading diagram...")
+        self.image_label.image = None
+
+        future = self.pipeline_executor.submit(self.load_history_entry, entry_id, max_size)
+        future.add_done_callback(lambda done: self.root.after(0, self.show_history_entry, request, max_size, done))
 
-    def get_mermaid_from_claude(self, prompt):
-        # Initialize the Claude client
-        client = anthropic.Anthropic(api_key=self.api_key)
+    def load_history_entry(self, entry_id, max_size):
+        entry = self.history.get(entry_id)
+        if entry is None:
+            raise Exception("That diagram is no longer in the history")
+        if entry["image"] is None:
+            entry["image"] = self.generate_mermaid_image(entry["mermaid_code"])
+        return entry, self.prepare_image(entry["image"], max_size)
+
+    def show_history_entry(self, request, max_size, future):
+        # A newer click or a new generation makes this one stale
+        if request != self.history_request or future.cancelled():
+            return
+        if future.exception() is not None:
+            self.image_label.config(text="No diagram generated yet")
+            messagebox.showerror("Error", f"An error occurred: {str(future.exception())}")
+            return
+
+        entry, (pyramid, pil_image) = future.result()
+        self.metrics.increment("history_opens_total")
+        self.current_pyramid = pyramid
+        self.displayed_size = max_size
+        self.show_image(pil_image)
+        self.current_mermaid_code = entry["mermaid_code"]
+        self.input_text.delete("1.0", tk.END)
+        self.input_text.insert("1.0", entry["prompt"])
+
+    def show_partial_code(self, job, response_text):
+        # Live preview of the response while it streams in
+        if job is not self.current_job or job.cancelled:
+            return
+        self.image_label.config(image="", text=response_text)
+        self.image_label.image = None
+
+    def get_client(self):
+        with self.client_lock:
+            if self.client is None:
+                if not self.api_key:
+                    raise Exception("No Anthropic API key, set ANTHROPIC_API_KEY or pass --api-key")
+                # Initialize the Claude client
+                options = {} if self.api_max_retries is None else {"max_retries": self.api_max_retries}
+                self.client = anthropic.Anthropic(api_key=self.api_key, **options)
+            return self.client
+
+    def get_mermaid_from_claude(self, prompt, on_text=None, on_code=None, cancel_event=None, timings=None,
+                                use_cache=True):
+        # timings, if given, is filled in with this call's timings (seconds since the call started). It belongs to
+        # the caller: the generator is shared between threads in batch mode, so nothing per call lives on self.
+        # use_cache=False neither reads nor writes the prompt cache.
+        client = self.get_client()
 
         # Create a system prompt to guide Claude to generate Mermaid diagrams
         system_prompt = """
@@ -121,94 +1176,513 @@ class MermaidDiagramGenerator:
         # Create the complete prompt for Claude
         complete_prompt = f"Based on this description, generate Mermaid diagram code: {prompt}"
 
-        # Make the API call
+        request = {
+            "model": CLAUDE_MODEL,
+            "max_tokens": CLAUDE_MAX_TOKENS,
+            "system": system_prompt,
+            "messages": [
+                {"role": "user", "content": complete_prompt}
+            ]
+        }
+
+        if timings is None:
+            timings = {}
+        timings["started"] = time.perf_counter()
+
+        # Answer from the cache if we've been asked (nearly) the same thing before
+        mermaid_code = self.prompt_cache.get(prompt, CLAUDE_MODEL, system_prompt) if use_cache else None
+        if mermaid_code is not None:
+            self.metrics.increment("prompt_cache_hits_total")
+            timings["cache_hit"] = True
+            timings["time_to_code"] = time.perf_counter() - timings["started"]
+            if on_text:
+                on_text(mermaid_code)
+            if on_code:
+                on_code(mermaid_code)
+            return mermaid_code
+
+        if use_cache:
+            self.metrics.increment("prompt_cache_misses_total")
+
+        # Make the API call. Claude's own latency counts from here, not from before the cache lookup.
+        request_started = time.perf_counter()
         try:
-            response = client.messages.create(
-                model="claude-3-5-sonnet-20240620",  # Use appropriate model
-                max_tokens=1024,
-                system=system_prompt,
-                messages=[
-                    {"role": "user", "content": complete_prompt}
-                ]
-            )
+            with self.metrics.time("claude_request"):
+                if self.use_streaming:
+                    mermaid_code = self.stream_mermaid_from_claude(client, request, timings, on_text, on_code,
+                                                                   cancel_event)
+                else:
+                    response = client.messages.create(**request)
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise JobCancelled()
+                    timings["time_to_first_token"] = time.perf_counter() - timings["started"]
+                    self.record_usage(getattr(response, "usage", None))
 
-            # Extract mermaid code from response
-            mermaid_code = response.content[0].text.strip()
+                    # Extract mermaid code from response, cleaning up any markdown formatting
+                    mermaid_code = extract_mermaid_code(response.content[0].text)
+                    timings["time_to_code"] = time.perf_counter() - timings["started"]
+                    if on_code:
+                        on_code(mermaid_code)
 
-            # Clean up code if it has markdown formatting
-            if mermaid_code.startswith("```mermaid"):
-                mermaid_code = mermaid_code.replace("```mermaid", "").replace("```", "").strip()
+            if "time_to_first_token" in timings:
+                self.metrics.observe("claude_time_to_first_token_seconds",
+                                     timings["time_to_first_token"] - (request_started - timings["started"]))
 
+            # Broken code would just be served up again next time
+            api_seconds = timings["time_to_code"]
+            if use_cache and validate_mermaid(mermaid_code) is None:
+                self.prompt_cache.put(prompt, CLAUDE_MODEL, system_prompt, mermaid_code, api_seconds)
             return mermaid_code
 
+        except JobCancelled:
+            raise
         except Exception as e:
-            raise Exception(f"Error calling Claude API: {str(e)}")
+            raise Exception(f"Error calling Claude API: {str(e)}") from e
+
+    def record_usage(self, usage):
+        # Token counts from the API response, if it has any (fakes used offline may not)
+        if usage is None:
+            return
+        self.metrics.increment("claude_input_tokens_total", getattr(usage, "input_tokens", 0) or 0)
+        self.metrics.increment("claude_output_tokens_total", getattr(usage, "output_tokens", 0) or 0)
+
+    def stream_mermaid_from_claude(self, client, request, timings, on_text=None, on_code=None, cancel_event=None):
+        started = timings["started"]
+        scanner = MermaidFenceScanner()
+
+        with client.messages.stream(**request) as stream:
+            for text in stream.text_stream:
+                # Leaving the with block closes the connection, so a cancelled job stops costing tokens
+                if cancel_event is not None and cancel_event.is_set():
+                    raise JobCancelled()
+
+                if "time_to_first_token" not in timings:
+                    timings["time_to_first_token"] = time.perf_counter() - started
+
+                code = scanner.feed(text)
+                if on_text:
+                    on_text(scanner.text)
+
+                # The code block just closed, no need to wait for the rest of the response
+                if code is not None:
+                    timings["time_to_code"] = time.perf_counter() - started
+                    if on_code:
+                        on_code(code)
+
+            get_final_message = getattr(stream, "get_final_message", None)
+            if get_final_message is not None:
+                self.record_usage(getattr(get_final_message(), "usage", None))
+
+        # No fence in the response, so the code is only complete now
+        if scanner.code is None:
+            mermaid_code = scanner.finish()
+            timings["time_to_code"] = time.perf_counter() - started
+            if on_code:
+                on_code(mermaid_code)
+            return mermaid_code
+
+        return scanner.code
 
     def generate_mermaid_image(self, mermaid_code):
-        # Create temporary files for input and output
-        with tempfile.NamedTemporaryFile(suffix='.mmd', delete=False, mode='w') as mmd_file:
-            mmd_file.write(mermaid_code)
-            mmd_file_path = mmd_file.name
+        with self.metrics.time("render"):
+            return self.render_mermaid_image(mermaid_code)
 
-        output_path = mmd_file_path.replace('.mmd', '.png')
+    def render_mermaid_image(self, mermaid_code):
+        # Returns the rendered image as bytes (PNG, or SVG if render_options says so); nothing touches a temp file
+        options = self.render_options
+        extension = options["format"]
 
+        # Reuse a previous render of the same code + options if we have one
+        cache_key = self.render_cache.make_key(mermaid_code, options)
+        image_data = self.render_cache.get(cache_key, extension)
+        if image_data is not None:
+            self.metrics.increment("render_cache_hits_total")
+            return image_data
+        self.metrics.increment("render_cache_misses_total")
+
+        # Catch broken code in milliseconds instead of waiting for the renderer to reject it
+        with self.metrics.time("validate"):
+            error = validate_mermaid(mermaid_code)
+        if error is not None:
+            self.metrics.increment("validation_failures_total")
+            raise error
+
+        # Use a warm worker if the pool is up; anything other than a diagram error falls back to mmdc
+        if self.render_pool.ready:
+            try:
+                with self.metrics.time("render_pool"):
+                    image_data = self.render_pool.render(mermaid_code, options)
+            except MermaidRenderError as e:
+                raise Exception(f"Mermaid CLI error: {str(e)}")
+            except RenderPoolUnavailable:
+                image_data = None
+
+        if image_data is None:
+            with self.metrics.time("mmdc"):
+                image_data = self.run_mmdc(mermaid_code, options)
+
+        # Keep a copy for next time
+        self.render_cache.put(cache_key, extension, image_data)
+        return image_data
+
+    @staticmethod
+    def run_mmdc(mermaid_code, options):
         try:
-            # Use mmdc (Mermaid CLI) to generate the image
+            # Use mmdc (Mermaid CLI) to generate the image, piping the code in and the image out
             result = subprocess.run(
-                ['mmdc', '-i', mmd_file_path, '-o', output_path],
+                ['mmdc', '-q', '-i', '-', '-o', '-', '-e', options["format"],
+                 '-t', options["theme"], '-b', options["background"],
+                 '-w', str(options["width"]), '-H', str(options["height"])],
+                input=mermaid_code.encode('utf-8'),
                 check=True,
-                capture_output=True,
-                text=True
+                capture_output=True
             )
-
-            # Clean up the temporary mermaid file
-            try:
-                os.unlink(mmd_file_path)
-            except:
-                pass
-
-            return output_path
+            return result.stdout
 
         except subprocess.CalledProcessError as e:
-            raise Exception(f"Mermaid CLI error: {e.stderr}")
+            raise Exception(f"Mermaid CLI error: {e.stderr.decode('utf-8', errors='replace')}")
         except FileNotFoundError:
             raise Exception(
                 "Mermaid CLI (mmdc) not found. Please install it using: npm install -g @mermaid-js/mermaid-cli")
 
-    def display_image(self, image_path):
+    def display_image(self, image_data):
+        max_size = (self.image_frame.winfo_width() - 20, self.image_frame.winfo_height() - 20)
+        pyramid, pil_image = self.prepare_image(image_data, max_size)
+        self.current_pyramid = pyramid
+        self.show_image(pil_image)
+
+    def prepare_image(self, image_data, max_size):
+        # Decoding and resizing is the slow part, and it doesn't need Tk so it can run on a worker thread
         try:
-            # Load the image using PIL
-            pil_image = Image.open(image_path)
+            pyramid = self.get_pyramid(image_data)
 
             # Resize while maintaining aspect ratio
-            max_width = self.image_frame.winfo_width() - 20
-            max_height = self.image_frame.winfo_height() - 20
+            with self.metrics.time("resize"):
+                return pyramid, pyramid.scaled(max_size)
+
+        except Exception as e:
+            raise Exception(f"Error displaying image: {str(e)}")
+
+    def get_pyramid(self, image_data):
+        # Decoded diagrams are kept around, so showing one again (or resizing the window) skips the decode
+        key = hashlib.sha256(image_data).hexdigest()
+        with self.pyramid_lock:
+            pyramid = self.pyramids.get(key)
+            if pyramid is not None:
+                self.pyramids.move_to_end(key)
+                return pyramid
+
+        with self.metrics.time("decode"):
+            pyramid = ImagePyramid(decode_image(image_data))
+        with self.pyramid_lock:
+            self.pyramids[key] = pyramid
+            while len(self.pyramids) > PYRAMID_CACHE_SIZE:
+                self.pyramids.popitem(last=False)
+        return pyramid
+
+    def on_preview_resize(self, event):
+        # Configure events arrive in bursts while the window is dragged, so only refit once it settles
+        if self.current_pyramid is None:
+            return
+        if self.resize_after_id is not None:
+            self.root.after_cancel(self.resize_after_id)
+        self.resize_after_id = self.root.after(100, self.refit_image)
 
-            width, height = pil_image.size
-            if width > max_width or height > max_height:
-                ratio = min(max_width / width, max_height / height)
-                new_width = int(width * ratio)
-                new_height = int(height * ratio)
-                pil_image = pil_image.resize((new_width, new_height), Image.LANCZOS)
+    def refit_image(self):
+        self.resize_after_id = None
+        max_size = (self.image_frame.winfo_width() - 20, self.image_frame.winfo_height() - 20)
+        if self.current_pyramid is None or max_size == self.displayed_size:
+            return
+        self.show_image(self.current_pyramid.scaled(max_size))
+        self.displayed_size = max_size
 
-            # Convert PIL image to Tkinter PhotoImage
+    def show_image(self, pil_image):
+        with self.metrics.time("tk_update"):
+            # Convert PIL image to Tkinter PhotoImage (Tk thread only)
             tk_image = ImageTk.PhotoImage(pil_image)
 
             # Update the image label
             self.image_label.config(image=tk_image, text="")
             self.image_label.image = tk_image  # Keep a reference to avoid garbage collection
 
-            # Clean up the temporary image file
+
+class TokenBucket:
+    # Thread safe token bucket: allows bursts of up to `capacity` calls, refilled at `rate` tokens per second
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def get_retry_delay(error, attempt, base_delay=1.0, max_delay=60.0):
+    # How long to wait before retrying a failed Claude call, or None if retrying won't help.
+    # get_mermaid_from_claude wraps the anthropic error, so look at the cause too.
+    cause = error.__cause__ or error
+    status_code = getattr(cause, "status_code", None)
+    connection_error = isinstance(cause, (anthropic.APIConnectionError, anthropic.APITimeoutError))
+    if status_code not in BATCH_RETRY_STATUS_CODES and not connection_error:
+        return None
+
+    # Respect the server's retry-after header when there is one
+    response = getattr(cause, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return min(max_delay, float(retry_after))
+    except (TypeError, ValueError):
+        pass
+
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+class DiagramBatchRunner:
+    # Headless batch generation: reads prompts from a JSONL file and writes <id>.mmd / <id>.png into output_dir.
+    # Claude calls and renders run on separate pools with their own limits. Every finished prompt is appended
+    # to a manifest in output_dir, so an interrupted run picks up where it left off.
+    def __init__(self, generator, output_dir, api_concurrency=4, render_concurrency=2,
+                 requests_per_minute=50, max_retries=5):
+        self.generator = generator
+        self.output_dir = output_dir
+        self.api_concurrency = api_concurrency
+        self.render_concurrency = render_concurrency
+        self.max_retries = max_retries
+        self.rate_limiter = TokenBucket(requests_per_minute / 60.0, max(1, api_concurrency))
+
+        self.manifest_path = os.path.join(output_dir, BATCH_MANIFEST_NAME)
+        self._manifest_lock = threading.Lock()
+
+    @staticmethod
+    def read_prompts(prompts_path):
+        # Each line is either {"id": ..., "prompt": ...} or {"prompt": ...}; ids default to the line number.
+        # Ids name the output files, so they must be plain file names and unique, ignoring case (for
+        # case-insensitive file systems).
+        prompts = []
+        seen_ids = {}
+        with open(prompts_path, 'r', encoding='utf-8') as file:
+            for line_number, line in enumerate(file, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                if isinstance(entry, str):
+                    entry = {"prompt": entry}
+                item_id = str(entry.get("id", line_number))
+                if not BATCH_ID_RE.fullmatch(item_id) or item_id in (".", ".."):
+                    raise Exception(f"{prompts_path}:{line_number}: id {item_id!r} may only contain letters, "
+                                    f"digits, '_', '.' and '-'")
+                if item_id.lower() in seen_ids:
+                    raise Exception(f"{prompts_path}:{line_number}: id {item_id!r} is already used on line "
+                                    f"{seen_ids[item_id.lower()]}")
+                seen_ids[item_id.lower()] = line_number
+                prompts.append({"id": item_id, "prompt": entry["prompt"]})
+        return prompts
+
+    def load_completed(self):
+        completed = set()
+        if not os.path.exists(self.manifest_path):
+            return completed
+
+        with open(self.manifest_path, 'r', encoding='utf-8') as manifest:
+            for line in manifest:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash, that prompt just runs again
+                    continue
+                if record.get("status") == "done":
+                    completed.add(record["id"])
+        return completed
+
+    def record(self, entry):
+        with self._manifest_lock:
+            with open(self.manifest_path, 'a', encoding='utf-8') as manifest:
+                manifest.write(json.dumps(entry) + "\n")
+                manifest.flush()
+
+    def fetch_code(self, item):
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            started = time.perf_counter()
             try:
-                os.unlink(image_path)
-            except:
-                pass
+                mermaid_code = self.generator.get_mermaid_from_claude(item["prompt"])
+                mermaid_code = self.generator.validate_or_repair(mermaid_code,
+                                                                 before_repair=self.rate_limiter.acquire)
+                return mermaid_code, time.perf_counter() - started, attempt
+            except Exception as e:
+                delay = get_retry_delay(e, attempt)
+                if delay is None or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+
+    def render_item(self, item, mermaid_code):
+        started = time.perf_counter()
+        image_data = self.generator.generate_mermaid_image(mermaid_code)
+        render_seconds = time.perf_counter() - started
+
+        extension = self.generator.render_options["format"]
+        output_image = os.path.join(self.output_dir, f"{item['id']}.{extension}")
+        with open(output_image, 'wb') as file:
+            file.write(image_data)
+
+        output_code = os.path.join(self.output_dir, f"{item['id']}.mmd")
+        with open(output_code, 'w', encoding='utf-8') as file:
+            file.write(mermaid_code)
+
+        return output_image, render_seconds
+
+    def run(self, prompts_path):
+        os.makedirs(self.output_dir, exist_ok=True)
+        prompts = self.read_prompts(prompts_path)
+        completed = self.load_completed()
+        pending = [item for item in prompts if item["id"] not in completed]
+
+        # Streaming only helps the GUI preview
+        self.generator.use_streaming = False
+
+        summary = {"total": len(prompts), "skipped": len(prompts) - len(pending), "done": 0, "failed": 0,
+                   "retries": 0}
+        api_seconds = []
+        render_seconds = []
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.api_concurrency) as api_executor, \
+                ThreadPoolExecutor(max_workers=self.render_concurrency) as render_executor:
+            api_futures = {api_executor.submit(self.fetch_code, item): item for item in pending}
+            render_futures = {}
+
+            # Hand each prompt over to the render pool as soon as its code comes back
+            for future in as_completed(api_futures):
+                item = api_futures[future]
+                try:
+                    mermaid_code, seconds, retries = future.result()
+                except Exception as e:
+                    summary["failed"] += 1
+                    self.record({"id": item["id"], "status": "failed", "stage": "api", "error": str(e)})
+                    continue
+
+                api_seconds.append(seconds)
+                summary["retries"] += retries
+                render_future = render_executor.submit(self.render_item, item, mermaid_code)
+                render_futures[render_future] = (item, seconds)
+
+            for future in as_completed(render_futures):
+                item, seconds = render_futures[future]
+                try:
+                    output_image, render_time = future.result()
+                except Exception as e:
+                    summary["failed"] += 1
+                    self.record({"id": item["id"], "status": "failed", "stage": "render", "error": str(e)})
+                    continue
+
+                render_seconds.append(render_time)
+                summary["done"] += 1
+                self.record({"id": item["id"], "status": "done", "image": os.path.basename(output_image),
+                             "api_seconds": round(seconds, 3), "render_seconds": round(render_time, 3)})
+
+        elapsed = time.perf_counter() - started
+        summary.update({
+            "elapsed_seconds": round(elapsed, 3),
+            "diagrams_per_second": round(summary["done"] / elapsed, 3) if elapsed > 0 else None,
+            "api_p50_seconds": percentile(api_seconds, 0.5),
+            "api_p95_seconds": percentile(api_seconds, 0.95),
+            "render_p50_seconds": percentile(render_seconds, 0.5),
+            "render_p95_seconds": percentile(render_seconds, 0.95),
+            "render_cache": self.generator.render_cache.stats(),
+            "prompt_cache": self.generator.prompt_cache.stats(),
+            "metrics": self.generator.metrics.snapshot(),
+        })
+        return summary
+
+
+def run_batch(prompts_path, output_dir, api_concurrency=4, render_concurrency=2, requests_per_minute=50,
+              max_retries=5, client=None, api_key=None, metrics_path=None):
+    # The runner retries with its own backoff and rate limit, so the SDK must not retry underneath it as well
+    generator = MermaidDiagramGenerator(None, client=client, api_key=api_key, api_max_retries=0)
+    try:
+        runner = DiagramBatchRunner(generator, output_dir, api_concurrency, render_concurrency,
+                                    requests_per_minute, max_retries)
+        summary = runner.run(prompts_path)
+        if metrics_path:
+            generator.metrics.write(metrics_path)
+        return summary
+    finally:
+        generator.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate Mermaid diagrams from text descriptions.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    batch_parser = subparsers.add_parser("batch", help="Generate diagrams for every prompt in a JSONL file")
+    batch_parser.add_argument("prompts", help="JSONL file with one {\"id\": ..., \"prompt\": ...} per line")
+    batch_parser.add_argument("output_dir", help="Directory to write diagrams and the manifest to")
+    batch_parser.add_argument("--api-concurrency", type=int, default=4, help="Parallel Claude requests")
+    batch_parser.add_argument("--render-concurrency", type=int, default=2, help="Parallel renders")
+    batch_parser.add_argument("--requests-per-minute", type=float, default=50, help="Claude request rate limit")
+    batch_parser.add_argument("--max-retries", type=int, default=5, help="Retries on 429/5xx responses")
+    batch_parser.add_argument("--api-key", default=os.environ.get("ANTHROPIC_API_KEY"), help="Anthropic API key")
+    batch_parser.add_argument("--metrics-out", help="Write stage metrics here (.prom for Prometheus text, else JSON)")
+
+    subparsers.add_parser("check-corpus", help="Run validate_mermaid over the bundled corpus of snippets")
+
+    history_parser = subparsers.add_parser("history", help="Search the history of generated diagrams")
+    history_parser.add_argument("query", nargs="?", default="", help="Words the prompt must contain")
+    history_parser.add_argument("--limit", type=int, default=20, help="Most recent matches to list")
+    history_parser.add_argument("--export", nargs=2, metavar=("ID", "PATH"), help="Write a diagram's image to PATH")
+
+    return parser.parse_args()
 
-        except Exception as e:
-            raise Exception(f"Error displaying image: {str(e)}")
 
 # Run
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = MermaidDiagramGenerator(root)
-    root.mainloop()
+    args = parse_args()
+    if args.command == "batch":
+        summary = run_batch(args.prompts, args.output_dir, args.api_concurrency, args.render_concurrency,
+                            args.requests_per_minute, args.max_retries, api_key=args.api_key,
+                            metrics_path=args.metrics_out)
+        print(json.dumps(summary, indent=2))
+    elif args.command == "check-corpus":
+        total, failures = check_mermaid_corpus()
+        for failure in failures:
+            print(failure)
+        print(f"{total - len(failures)}/{total} corpus cases passed")
+        raise SystemExit(1 if failures else 0)
+    elif args.command == "history":
+        history = DiagramHistoryStore(HISTORY_DB_PATH, HISTORY_MAX_ENTRIES, HISTORY_MAX_IMAGE_MB * 1024 * 1024)
+        try:
+            if args.export:
+                entry = history.get(int(args.export[0]))
+                if entry is None:
+                    raise SystemExit(f"No diagram with id {args.export[0]} in the history")
+                if entry["image"] is None:
+                    raise SystemExit(f"The full render of diagram {args.export[0]} was pruned to keep the history "
+                                     "under MERMAID_HISTORY_MAX_IMAGE_MB; open it in the app to render it again")
+                with open(args.export[1], 'wb') as file:
+                    file.write(entry["image"])
+            else:
+                for entry in history.search(args.query, limit=args.limit):
+                    created = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["created"]))
+                    print(f"{entry['id']:>7}  {created}  {entry['prompt']}")
+                print(f"{history.count(args.query)} matching diagrams")
+        finally:
+            history.close()
+    else:
+        root = tk.Tk()
+        app = MermaidDiagramGenerator(root)
+        root.mainloop()
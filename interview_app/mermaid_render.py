@@ -0,0 +1,851 @@
+### MERMAID RENDERING ###
+# The headless half of the diagram app: the Mermaid syntax check, the warm render worker pool and the on-disk
+# render cache. Standard library only (renders still need node and the Mermaid CLI), so the PowerPoint converter
+# next door can use it in batch and serve runs on machines without Tk, Pillow or the anthropic package. The
+# converter also takes percentile() for its service metrics from here, so both apps compute them the same way.
+
+# Imports
+import base64
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+
+# Everything we cache between runs lives under here
+CACHE_ROOT = os.path.join(os.path.expanduser("~"), ".cache", "mermaid_diagram_generator")
+
+# Render cache settings (size cap is in megabytes)
+RENDER_CACHE_DIR = os.environ.get("MERMAID_RENDER_CACHE_DIR", os.path.join(CACHE_ROOT, "renders"))
+RENDER_CACHE_MAX_MB = int(os.environ.get("MERMAID_RENDER_CACHE_MAX_MB", "200"))
+
+# Render worker pool settings (0 workers disables the pool and always uses mmdc)
+RENDER_WORKERS = int(os.environ.get("MERMAID_RENDER_WORKERS", "2"))
+RENDER_WORKER_MAX_RENDERS = int(os.environ.get("MERMAID_RENDER_WORKER_MAX_RENDERS", "200"))
+RENDER_WORKER_RESTART_ATTEMPTS = 3
+RENDER_WORKER_RESTART_DELAY = 1.0
+RENDER_POOL_POLL_SECONDS = 0.5
+RENDER_WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mermaid_worker.mjs")
+
+# Known good / known bad snippets for checking validate_mermaid (python main.py check-corpus)
+MERMAID_CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mermaid_corpus.json")
+
+
+# Definitions, OOP, etc.
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class MermaidRenderCache:
+    # On-disk cache of rendered diagrams, keyed by a hash of the mermaid code and render options.
+    # Entries are evicted least recently used first once the cache grows past max_bytes.
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+        # Counters so we can tell whether the cache is earning its keep
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # File name -> size in bytes, ordered from least to most recently used
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(mermaid_code, options):
+        payload = json.dumps({"code": mermaid_code, "options": options}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _load_index(self):
+        # Rebuild the LRU order from file modification times left by previous runs
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(".") or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, name, stat.st_size))
+
+        for _, name, size in sorted(entries):
+            self._entries[name] = size
+            self._total_bytes += size
+
+        with self._lock:
+            self._evict()
+
+    def get(self, key, extension):
+        name = f"{key}.{extension}"
+        path = os.path.join(self.cache_dir, name)
+
+        with self._lock:
+            if name in self._entries:
+                try:
+                    with open(path, 'rb') as cached_file:
+                        data = cached_file.read()
+                except OSError:
+                    data = None
+
+                if data is not None:
+                    self._entries.move_to_end(name)
+                    self.hits += 1
+                    try:
+                        # Touch the file so the LRU order survives a restart
+                        os.utime(path)
+                    except OSError:
+                        pass
+                    return data
+
+                # Forget entries whose file was removed behind our back
+                self._total_bytes -= self._entries.pop(name)
+
+            self.misses += 1
+            return None
+
+    def put(self, key, extension, data):
+        name = f"{key}.{extension}"
+        path = os.path.join(self.cache_dir, name)
+
+        # Write to a hidden temp file first so a half-written entry is never picked up
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".")
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            if name in self._entries:
+                self._total_bytes -= self._entries.pop(name)
+            self._entries[name] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        # Caller must hold the lock. Always keep the newest entry, even if it alone is over the cap.
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.unlink(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class MermaidRenderError(Exception):
+    # The diagram itself could not be rendered (bad syntax etc.), retrying elsewhere won't help
+    pass
+
+
+class RenderPoolUnavailable(Exception):
+    # The worker pool could not serve the request, the caller should fall back to mmdc
+    pass
+
+
+def find_mermaid_cli_root():
+    # Where the globally installed @mermaid-js/mermaid-cli package lives
+    cli_root = os.environ.get("MERMAID_CLI_ROOT")
+    if cli_root:
+        return cli_root
+
+    try:
+        result = subprocess.run(['npm', 'root', '-g'], check=True, capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+    cli_root = os.path.join(result.stdout.strip(), "@mermaid-js", "mermaid-cli")
+    return cli_root if os.path.isdir(cli_root) else None
+
+
+class MermaidRenderWorker:
+    # One warm node process (see mermaid_worker.mjs) talking JSON lines over stdin/stdout
+    def __init__(self, cli_root, startup_timeout=60):
+        self.cli_root = cli_root
+        self.startup_timeout = startup_timeout
+        self.process = None
+        self.renders = 0
+        self._replies = queue.Queue()
+        self._next_id = 0
+
+    def start(self):
+        env = dict(os.environ, MERMAID_CLI_ROOT=self.cli_root)
+        try:
+            self.process = subprocess.Popen(
+                ['node', RENDER_WORKER_SCRIPT],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                env=env
+            )
+        except OSError as e:
+            raise RenderPoolUnavailable(f"Could not start render worker: {str(e)}")
+
+        # Read replies on a separate thread so every request can have a timeout
+        self._replies = queue.Queue()
+        reader = threading.Thread(target=self._read_replies, args=(self.process, self._replies))
+        reader.daemon = True
+        reader.start()
+
+        ready = self._wait_for_reply(self.startup_timeout)
+        if not ready.get("ready"):
+            self.stop()
+            raise RenderPoolUnavailable("Render worker did not start")
+        self.renders = 0
+
+    @staticmethod
+    def _read_replies(process, replies):
+        for line in process.stdout:
+            try:
+                replies.put(json.loads(line))
+            except ValueError:
+                pass
+        # EOF, the worker died or was stopped
+        replies.put(None)
+
+    def _wait_for_reply(self, timeout):
+        try:
+            reply = self._replies.get(timeout=timeout)
+        except queue.Empty:
+            self.stop()
+            raise RenderPoolUnavailable("Render worker timed out")
+        if reply is None:
+            self.stop()
+            raise RenderPoolUnavailable("Render worker exited unexpectedly")
+        return reply
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def request(self, payload, timeout):
+        if not self.is_alive():
+            raise RenderPoolUnavailable("Render worker is not running")
+
+        self._next_id += 1
+        payload = dict(payload, id=self._next_id)
+        try:
+            self.process.stdin.write(json.dumps(payload) + "\n")
+            self.process.stdin.flush()
+        except (OSError, ValueError) as e:
+            self.stop()
+            raise RenderPoolUnavailable(f"Render worker pipe closed: {str(e)}")
+
+        # Skip stale replies left over from an earlier request that timed out
+        while True:
+            reply = self._wait_for_reply(timeout)
+            if reply.get("id") == self._next_id:
+                return reply
+
+    def render(self, mermaid_code, options, timeout):
+        reply = self.request(dict(options, op="render", code=mermaid_code), timeout)
+        self.renders += 1
+        if not reply.get("ok"):
+            raise MermaidRenderError(reply.get("error", "unknown render error"))
+        return base64.b64decode(reply["data"])
+
+    def ping(self, timeout=10):
+        try:
+            return bool(self.request({"op": "ping"}, timeout).get("ok"))
+        except RenderPoolUnavailable:
+            return False
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            # Closing stdin lets the worker shut its browser down cleanly
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except Exception:
+            self.process.kill()
+        self.process = None
+
+
+class MermaidRenderPool:
+    # A fixed number of warm render workers. Workers are recycled after max_renders renders
+    # (headless browsers leak memory over time) and replaced whenever they crash or fail a health check.
+    # A worker that can't be restarted (after a few tries with backoff) is dropped; once none are left the pool
+    # stops being ready, so renders go straight to mmdc instead of waiting for a worker that will never come.
+    def __init__(self, size, max_renders, render_timeout=60, health_check_interval=30):
+        self.size = size
+        self.max_renders = max_renders
+        self.render_timeout = render_timeout
+        self.health_check_interval = health_check_interval
+        self.ready = False
+        self.restarts = 0
+        self.live_workers = 0
+
+        self._cli_root = None
+        self._lock = threading.Lock()
+        self._idle = queue.Queue()
+        self._closed = threading.Event()
+
+    def start(self):
+        self._cli_root = find_mermaid_cli_root()
+        if self.size <= 0 or not self._cli_root or not os.path.exists(RENDER_WORKER_SCRIPT):
+            return False
+
+        for _ in range(self.size):
+            worker = MermaidRenderWorker(self._cli_root)
+            try:
+                worker.start()
+            except RenderPoolUnavailable:
+                # Node/puppeteer not usable here, stay on the mmdc fallback
+                self.close()
+                return False
+            if self._closed.is_set():
+                # Closed while we were still starting up
+                worker.stop()
+                self.close()
+                return False
+            with self._lock:
+                self.live_workers += 1
+            self._idle.put(worker)
+
+        self.ready = True
+
+        checker = threading.Thread(target=self._health_check_loop)
+        checker.daemon = True
+        checker.start()
+        return True
+
+    def render(self, mermaid_code, options):
+        if not self.ready:
+            raise RenderPoolUnavailable("Render pool is not running")
+
+        # Wait in short steps, so a pool that loses its last worker meanwhile hands over to mmdc right away
+        deadline = time.perf_counter() + self.render_timeout
+        while True:
+            try:
+                worker = self._idle.get(timeout=RENDER_POOL_POLL_SECONDS)
+                break
+            except queue.Empty:
+                if not self.ready:
+                    raise RenderPoolUnavailable("Render pool has no workers left")
+                if time.perf_counter() > deadline:
+                    raise RenderPoolUnavailable("No render worker became free in time")
+
+        try:
+            return worker.render(mermaid_code, options, self.render_timeout)
+        except RenderPoolUnavailable:
+            # The worker crashed or hung, it gets replaced below
+            worker.stop()
+            raise
+        finally:
+            self._release(worker)
+
+    def _release(self, worker):
+        if self._closed.is_set():
+            worker.stop()
+            return
+
+        if worker.is_alive() and worker.renders < self.max_renders:
+            self._idle.put(worker)
+            return
+
+        # Restart off the caller's thread so a recycle doesn't add browser startup to this render
+        restart_thread = threading.Thread(target=self._restart_and_release, args=(worker,))
+        restart_thread.daemon = True
+        restart_thread.start()
+
+    def _restart_and_release(self, worker):
+        worker = self._restart(worker)
+        if worker is not None:
+            self._idle.put(worker)
+
+    def _restart(self, worker):
+        # Returns the restarted worker, or None if it is gone for good
+        worker.stop()
+        delay = RENDER_WORKER_RESTART_DELAY
+        for attempt in range(RENDER_WORKER_RESTART_ATTEMPTS):
+            if attempt and self._closed.wait(delay):
+                break
+            delay *= 2
+            with self._lock:
+                self.restarts += 1
+            try:
+                worker.start()
+                return worker
+            except RenderPoolUnavailable as e:
+                logger.warning("Render worker restart %d/%d failed: %s", attempt + 1,
+                               RENDER_WORKER_RESTART_ATTEMPTS, e)
+                worker.stop()
+        self._drop_worker()
+        return None
+
+    def _drop_worker(self):
+        with self._lock:
+            self.live_workers -= 1
+            if self.live_workers > 0 or self._closed.is_set():
+                return
+            self.ready = False
+        logger.warning("No render workers left, rendering with mmdc from now on")
+
+    def health_check(self):
+        # Ping every idle worker, replacing any that do not answer
+        healthy = 0
+        for _ in range(self.size):
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if not worker.ping():
+                worker = self._restart(worker)
+            if worker is not None:
+                healthy += 1
+                self._idle.put(worker)
+        return healthy
+
+    def _health_check_loop(self):
+        while not self._closed.wait(self.health_check_interval):
+            self.health_check()
+
+    def close(self):
+        self.ready = False
+        self._closed.set()
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+
+
+# Diagram types we don't validate ourselves; these go straight to the renderer
+MERMAID_UNCHECKED_TYPES = {
+    "erDiagram", "journey", "gitGraph", "mindmap", "timeline", "quadrantChart", "requirementDiagram",
+    "C4Context", "C4Container", "C4Component", "C4Dynamic", "C4Deployment", "xychart-beta", "sankey-beta",
+    "block-beta", "packet-beta", "architecture-beta", "kanban", "zenuml", "radar-beta", "treemap-beta",
+}
+
+MERMAID_BRACKETS = {")": "(", "]": "[", "}": "{"}
+
+# Flowchart links: -->, ---, -.->, ==>, <-->, --o, --x, ~~~ and friends
+FLOWCHART_HEADER_RE = re.compile(r"^(graph|flowchart|flowchart-elk)(\s+(TB|TD|BT|RL|LR))?\s*$")
+FLOWCHART_LINK_RE = re.compile(r"\s*(?:(?:<|(?<=\s)[ox])?(?:-{2,}|={2,}|-\.+-)(?:>|[ox](?!\w))?|~{3,})\s*")
+FLOWCHART_LINK_TEXT_RE = re.compile(r"(--|==|-\.)\s+[^-=.>|][^>|]*?\s+(-->|---|==>|===|\.->|\.-)")
+FLOWCHART_ASYMMETRIC_RE = re.compile(r"(\w)>([^\]]*)\]")
+# Node shapes written as A@{ shape: rect }, and edge ids as A e1@--> B
+FLOWCHART_SHAPE_RE = re.compile(r"(\w)@(?=\s*\{)")
+FLOWCHART_EDGE_ID_RE = re.compile(r"\s[\w\-]+@(?=[-=.<~ox])")
+FLOWCHART_NODES_RE = re.compile(r"^[\w][\w.\-]*(:::[\w\-]+)?(\s*&\s*[\w][\w.\-]*(:::[\w\-]+)?)*$")
+FLOWCHART_KEYWORDS = ("classDef", "class", "style", "linkStyle", "click", "direction")
+
+SEQUENCE_MESSAGE_RE = re.compile(r"^([^\s:>-][^:]*?)\s*(-->>|->>|-->|->|--x|-x|--\)|-\))[+-]?\s*([^\s:][^:]*?)\s*:.*$")
+SEQUENCE_PARTICIPANT_RE = re.compile(r"^(create\s+)?(participant|actor)\s+\S.*$")
+SEQUENCE_NOTE_RE = re.compile(r"^note\s+(left of|right of|over)\s+[^:]+:.*$", re.IGNORECASE)
+SEQUENCE_BLOCKS = ("loop", "alt", "opt", "par", "critical", "break", "rect", "box")
+SEQUENCE_BRANCHES = {"else": "alt", "and": "par", "option": "critical"}
+SEQUENCE_KEYWORDS = ("activate", "deactivate", "autonumber", "title", "destroy", "link", "links", "properties",
+                     "details")
+
+# Relations, including lollipop interfaces: bar ()-- foo, foo --() bar
+CLASS_RELATION_RE = re.compile(
+    r'^[\w~`.\-]+\s*("[^"]*"\s*)?(\(\)|[<*o|]*)(--|\.\.)(\(\)|[>*o|]*)\s*("[^"]*"\s*)?[\w~`.\-]+(\s*:.*)?$')
+CLASS_DANGLING_RELATION_RE = re.compile(r"^(\(\)|[<*o|]*)(--|\.\.)|(--|\.\.)(\(\)|[>*o|]*)\s*$")
+CLASS_DECLARATION_RE = re.compile(r'^class\s+[\w`.\-]+(~[^~]+~)?(\["[^"]*"\])?(:::[\w\-]+)?\s*(\{)?\s*$')
+CLASS_MEMBER_RE = re.compile(r"^[\w~`.\-]+\s*:\s*\S.*$")
+CLASS_ANNOTATION_RE = re.compile(r"^<<[^>]+>>\s*[\w.\-]+$")
+CLASS_NAMESPACE_RE = re.compile(r"^namespace\s+[\w.\-]+\s*\{$")
+CLASS_KEYWORDS = ("note", "direction", "classDef", "cssClass", "style", "click", "callback", "link")
+
+STATE_ID = r"(\[\*\]|[\w.\-]+)(:::[\w\-]+)?"
+STATE_TRANSITION_RE = re.compile(r"^" + STATE_ID + r"\s*-->\s*" + STATE_ID + r"(\s*:.*)?$")
+STATE_DESCRIPTION_RE = re.compile(r"^[\w.\-]+\s*:\s*.*$")
+STATE_NAME_RE = re.compile(r"^[\w.\-]+(:::[\w\-]+)?$")
+STATE_KEYWORDS = ("direction", "classDef", "class", "style")
+
+GANTT_KEYWORDS = ("dateFormat", "axisFormat", "title", "section", "excludes", "includes", "todayMarker",
+                  "tickInterval", "weekday", "displayMode", "inclusiveEndDates", "topAxis", "click")
+
+PIE_SLICE_RE = re.compile(r'^"[^"]*"\s*:\s*(-?\d+(\.\d+)?)\s*$')
+
+# Accessibility statements are allowed in every diagram type
+MERMAID_COMMON_KEYWORDS = ("accTitle", "accDescr")
+
+
+class MermaidValidationError(Exception):
+    # A syntax problem found before rendering, with enough detail to show the user or send back to Claude
+    def __init__(self, message, line=None, column=None, diagram_type=None):
+        super().__init__(f"Line {line}: {message}" if line else message)
+        self.message = message
+        self.line = line
+        self.column = column
+        self.diagram_type = diagram_type
+
+    def to_dict(self):
+        return {"message": self.message, "line": self.line, "column": self.column,
+                "diagram_type": self.diagram_type}
+
+
+def mermaid_statements(mermaid_code):
+    # (line number, text) for every line that isn't blank, a comment, a directive or front matter
+    lines = mermaid_code.splitlines()
+    statements = []
+    index = 0
+
+    # YAML front matter between --- lines
+    while index < len(lines) and not lines[index].strip():
+        index += 1
+    if index < len(lines) and lines[index].strip() == "---":
+        index += 1
+        while index < len(lines) and lines[index].strip() != "---":
+            index += 1
+        index += 1
+
+    for line_number in range(index + 1, len(lines) + 1):
+        text = lines[line_number - 1].strip()
+        if not text or text.startswith("%%"):
+            continue
+        statements.append((line_number, text))
+    return statements
+
+
+def starts_with_keyword(text, keywords):
+    first_word = re.split(r"[\s:{]", text, maxsplit=1)[0]
+    return first_word in keywords
+
+
+def check_brackets(text, line_number, diagram_type):
+    # Raise if (), [] or {} don't pair up, ignoring anything inside double quotes
+    stack = []
+    in_quotes = False
+    for column, char in enumerate(text, start=1):
+        if char == '"':
+            in_quotes = not in_quotes
+        elif in_quotes:
+            continue
+        elif char in "([{":
+            stack.append((char, column))
+        elif char in MERMAID_BRACKETS:
+            if not stack or stack[-1][0] != MERMAID_BRACKETS[char]:
+                raise MermaidValidationError(f"Unexpected '{char}'", line_number, column, diagram_type)
+            stack.pop()
+
+    if in_quotes:
+        raise MermaidValidationError("Unterminated string", line_number, text.index('"') + 1, diagram_type)
+    if stack:
+        char, column = stack[-1]
+        raise MermaidValidationError(f"'{char}' is never closed", line_number, column, diagram_type)
+
+
+def strip_brackets(text):
+    # Drop node labels (bracketed and quoted text) so only ids and links are left
+    result = []
+    depth = 0
+    in_quotes = False
+    for char in text:
+        if char == '"':
+            in_quotes = not in_quotes
+        elif in_quotes:
+            continue
+        elif char in "([{":
+            depth += 1
+        elif char in MERMAID_BRACKETS:
+            depth -= 1
+        elif depth == 0:
+            result.append(char)
+    return "".join(result)
+
+
+def split_flowchart_statements(text):
+    # Flowcharts allow several statements on one line separated by semicolons
+    parts = []
+    current = []
+    depth = 0
+    in_quotes = False
+    for char in text:
+        if char == '"':
+            in_quotes = not in_quotes
+        elif not in_quotes and char in "([{":
+            depth += 1
+        elif not in_quotes and char in MERMAID_BRACKETS:
+            depth -= 1
+        if char == ";" and depth <= 0 and not in_quotes:
+            parts.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    parts.append("".join(current).strip())
+    return [part for part in parts if part]
+
+
+def validate_flowchart(header, statements):
+    diagram_type = "flowchart"
+    line_number, header_text = header
+    header_statements = split_flowchart_statements(header_text)
+    if not FLOWCHART_HEADER_RE.match(header_statements[0]):
+        raise MermaidValidationError("Invalid flowchart direction, expected TB, TD, BT, RL or LR",
+                                     line_number, 1, diagram_type)
+
+    subgraphs = []
+    items = [(line_number, text) for text in header_statements[1:]] + [
+        (number, part) for number, text in statements for part in split_flowchart_statements(text)]
+
+    for line_number, text in items:
+        if text == "end":
+            if not subgraphs:
+                raise MermaidValidationError("'end' without a matching 'subgraph'", line_number, 1, diagram_type)
+            subgraphs.pop()
+            continue
+        if starts_with_keyword(text, ("subgraph",)):
+            subgraphs.append(line_number)
+            continue
+        if starts_with_keyword(text, FLOWCHART_KEYWORDS + MERMAID_COMMON_KEYWORDS):
+            continue
+
+        # Asymmetric nodes (id>text]) are the one shape whose brackets don't pair up
+        text = FLOWCHART_ASYMMETRIC_RE.sub(r"\1[\2]", text)
+        text = FLOWCHART_EDGE_ID_RE.sub(" ", FLOWCHART_SHAPE_RE.sub(r"\1", text))
+        check_brackets(text, line_number, diagram_type)
+
+        # Reduce the statement to "ids link ids link ids" and check it alternates properly. Anything without a
+        # link that we don't recognise is left for mmdc to judge, newer Mermaid versions keep adding syntax.
+        bare = strip_brackets(re.sub(r"\|[^|]*\|", "", FLOWCHART_LINK_TEXT_RE.sub(" --> ", text)))
+        parts = FLOWCHART_LINK_RE.split(bare)
+        for index, part in enumerate(parts):
+            part = part.strip()
+            if not part:
+                message = "Link is missing a node" if len(parts) > 1 else "Empty node"
+                raise MermaidValidationError(message, line_number, None, diagram_type)
+            if len(parts) > 1 and not FLOWCHART_NODES_RE.match(part):
+                raise MermaidValidationError(f"Unexpected '{part}'", line_number, text.find(part) + 1 or None,
+                                             diagram_type)
+
+    if subgraphs:
+        raise MermaidValidationError("'subgraph' is never closed with 'end'", subgraphs[-1], 1, diagram_type)
+
+
+def validate_sequence(header, statements):
+    diagram_type = "sequence"
+    blocks = []
+
+    for line_number, text in statements:
+        keyword = re.split(r"\s", text, maxsplit=1)[0]
+
+        if keyword == "end":
+            if not blocks:
+                raise MermaidValidationError("'end' without an open block", line_number, 1, diagram_type)
+            blocks.pop()
+        elif keyword in SEQUENCE_BLOCKS:
+            blocks.append((keyword, line_number))
+        elif keyword in SEQUENCE_BRANCHES:
+            if not blocks or blocks[-1][0] != SEQUENCE_BRANCHES[keyword]:
+                raise MermaidValidationError(f"'{keyword}' is only allowed inside '{SEQUENCE_BRANCHES[keyword]}'",
+                                             line_number, 1, diagram_type)
+        elif keyword in SEQUENCE_KEYWORDS or keyword in MERMAID_COMMON_KEYWORDS:
+            continue
+        elif SEQUENCE_PARTICIPANT_RE.match(text) or SEQUENCE_NOTE_RE.match(text) or SEQUENCE_MESSAGE_RE.match(text):
+            continue
+        elif re.search(r"-+>|-+x|-+\)", text) and ":" not in text:
+            raise MermaidValidationError("Message is missing ': text'", line_number, None, diagram_type)
+        # Anything else is left for mmdc to judge
+
+    if blocks:
+        keyword, line_number = blocks[-1]
+        raise MermaidValidationError(f"'{keyword}' is never closed with 'end'", line_number, 1, diagram_type)
+
+
+def validate_class(header, statements):
+    diagram_type = "class"
+    open_body = None
+    namespaces = []
+
+    for line_number, text in statements:
+        if open_body is not None:
+            # Members inside class Name { ... } are free text
+            if text == "}":
+                open_body = None
+            continue
+
+        if text.startswith("class "):
+            match = CLASS_DECLARATION_RE.match(text)
+            if not match:
+                raise MermaidValidationError("Invalid class declaration", line_number, 1, diagram_type)
+            if match.group(4):
+                open_body = line_number
+        elif CLASS_NAMESPACE_RE.match(text):
+            namespaces.append(line_number)
+        elif text == "}":
+            if not namespaces:
+                raise MermaidValidationError("Unexpected '}'", line_number, 1, diagram_type)
+            namespaces.pop()
+        elif starts_with_keyword(text, CLASS_KEYWORDS + MERMAID_COMMON_KEYWORDS):
+            continue
+        elif CLASS_RELATION_RE.match(text) or CLASS_MEMBER_RE.match(text) or CLASS_ANNOTATION_RE.match(text):
+            continue
+        elif CLASS_DANGLING_RELATION_RE.search(text):
+            raise MermaidValidationError("Relation needs a class on both sides", line_number, None, diagram_type)
+        # Anything else is left for mmdc to judge
+
+    if open_body is not None:
+        raise MermaidValidationError("Class body '{' is never closed", open_body, None, diagram_type)
+    if namespaces:
+        raise MermaidValidationError("Namespace '{' is never closed", namespaces[-1], None, diagram_type)
+
+
+def validate_state(header, statements):
+    diagram_type = "state"
+    composites = []
+    open_note = None
+
+    for line_number, text in statements:
+        if open_note is not None:
+            if text.lower() == "end note":
+                open_note = None
+            continue
+
+        if text == "}":
+            if not composites:
+                raise MermaidValidationError("Unexpected '}'", line_number, 1, diagram_type)
+            composites.pop()
+        elif text.startswith("state "):
+            opens_composite = text.endswith("{")
+            check_brackets(text.rstrip("{"), line_number, diagram_type)
+            if opens_composite:
+                composites.append(line_number)
+        elif text.lower().startswith("note "):
+            if ":" not in text:
+                open_note = line_number
+        elif text == "--" or starts_with_keyword(text, STATE_KEYWORDS + MERMAID_COMMON_KEYWORDS):
+            continue
+        elif STATE_TRANSITION_RE.match(text) or STATE_DESCRIPTION_RE.match(text) or STATE_NAME_RE.match(text):
+            continue
+        elif "-->" in text:
+            raise MermaidValidationError("Transition needs a state on both sides of '-->'",
+                                         line_number, text.index("-->") + 1, diagram_type)
+        # Anything else is left for mmdc to judge
+
+    if open_note is not None:
+        raise MermaidValidationError("'note' is never closed with 'end note'", open_note, 1, diagram_type)
+    if composites:
+        raise MermaidValidationError("Composite state '{' is never closed", composites[-1], None, diagram_type)
+
+
+def validate_gantt(header, statements):
+    diagram_type = "gantt"
+    for line_number, text in statements:
+        if starts_with_keyword(text, GANTT_KEYWORDS + MERMAID_COMMON_KEYWORDS):
+            continue
+        # Tasks are "Name : [tags,] [id,] start, end/duration"
+        name, colon, details = text.partition(":")
+        if not colon:
+            raise MermaidValidationError("Task is missing ':' and its dates", line_number, None, diagram_type)
+        if not name.strip() or not details.strip():
+            raise MermaidValidationError("Task needs a name and dates either side of ':'",
+                                         line_number, len(name) + 1, diagram_type)
+
+
+def validate_pie(header, statements):
+    diagram_type = "pie"
+    slices = 0
+    for line_number, text in statements:
+        if starts_with_keyword(text, ("title", "showData") + MERMAID_COMMON_KEYWORDS):
+            continue
+        match = PIE_SLICE_RE.match(text)
+        if not match:
+            raise MermaidValidationError('Pie slices look like "Label" : 42', line_number, 1, diagram_type)
+        if float(match.group(1)) < 0:
+            raise MermaidValidationError("Pie slice values can't be negative", line_number, None, diagram_type)
+        slices += 1
+
+    if not slices:
+        raise MermaidValidationError("Pie chart has no slices", header[0], None, diagram_type)
+
+
+MERMAID_VALIDATORS = {
+    "graph": validate_flowchart,
+    "flowchart": validate_flowchart,
+    "flowchart-elk": validate_flowchart,
+    "sequenceDiagram": validate_sequence,
+    "classDiagram": validate_class,
+    "classDiagram-v2": validate_class,
+    "stateDiagram": validate_state,
+    "stateDiagram-v2": validate_state,
+    "gantt": validate_gantt,
+    "pie": validate_pie,
+}
+
+
+def validate_mermaid(mermaid_code):
+    # Cheap in-process syntax check for the common diagram types, so obviously broken code never reaches mmdc.
+    # Returns a MermaidValidationError describing the first problem, or None if the code looks renderable.
+    statements = mermaid_statements(mermaid_code)
+    if not statements:
+        return MermaidValidationError("Diagram is empty")
+
+    header = statements[0]
+    diagram_type = re.split(r"[\s;]", header[1], maxsplit=1)[0]
+    if diagram_type in MERMAID_UNCHECKED_TYPES:
+        return None
+
+    validator = MERMAID_VALIDATORS.get(diagram_type)
+    if validator is None:
+        return MermaidValidationError(f"Unknown diagram type '{diagram_type}'", header[0], 1)
+
+    try:
+        validator(header, statements[1:])
+    except MermaidValidationError as e:
+        # Validators see each statement stripped; point the column at the line as written
+        if e.line and e.column:
+            line = mermaid_code.splitlines()[e.line - 1]
+            e.column += len(line) - len(line.lstrip())
+        return e
+    return None
+
+
+def check_mermaid_corpus(corpus_path=MERMAID_CORPUS_PATH):
+    # Every valid snippet must pass and every invalid one must fail on the expected line, column and diagram type
+    with open(corpus_path, 'r', encoding='utf-8') as file:
+        corpus = json.load(file)
+
+    failures = []
+    for case in corpus["valid"]:
+        error = validate_mermaid(case["code"])
+        if error is not None:
+            failures.append(f"{case['name']}: rejected valid code ({str(error)})")
+
+    for case in corpus["invalid"]:
+        error = validate_mermaid(case["code"])
+        if error is None:
+            failures.append(f"{case['name']}: accepted invalid code")
+        elif (error.line, error.column, error.diagram_type) != (case["line"], case["column"], case["diagram_type"]):
+            failures.append(f"{case['name']}: expected line {case['line']} column {case['column']} "
+                            f"({case['diagram_type']}), got line {error.line} column {error.column} "
+                            f"({error.diagram_type}): {str(error)}")
+
+    return len(corpus["valid"]) + len(corpus["invalid"]), failures
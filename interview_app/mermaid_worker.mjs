@@ -0,0 +1,69 @@
+// Long-lived Mermaid render worker, spawned by MermaidRenderPool in main.py.
+// Keeps one headless browser open and renders diagrams on request, so we only pay browser startup once.
+//
+// Protocol: one JSON object per line on stdin, one JSON object per line on stdout.
+//   -> {"id": 1, "op": "render", "code": "graph TD; A-->B", "format": "png", "theme": "default",
+//       "background": "white", "width": 800, "height": 600}
+//   <- {"id": 1, "ok": true, "data": "<base64 image bytes>"}
+//   <- {"id": 1, "ok": false, "error": "Parse error on line 1 ..."}
+//   -> {"id": 2, "op": "ping"}
+//   <- {"id": 2, "ok": true}
+// A {"ready": true} line is written once the browser is up.
+
+import { createRequire } from 'node:module';
+import path from 'node:path';
+import readline from 'node:readline';
+import { pathToFileURL } from 'node:url';
+
+// Load puppeteer and the renderer from the globally installed mermaid-cli package
+const cliRoot = process.env.MERMAID_CLI_ROOT;
+const cliRequire = createRequire(path.join(cliRoot, 'package.json'));
+const puppeteer = cliRequire('puppeteer');
+const { renderMermaid } = await import(pathToFileURL(path.join(cliRoot, 'src', 'index.js')).href);
+
+const launchArgs = process.env.MERMAID_WORKER_NO_SANDBOX ? ['--no-sandbox'] : [];
+const browser = await puppeteer.launch({ headless: true, args: launchArgs });
+
+function reply(message) {
+  process.stdout.write(JSON.stringify(message) + '\n');
+}
+
+async function handle(request) {
+  if (request.op === 'ping') {
+    // Make sure the browser is still responsive, not just the node process
+    await browser.version();
+    return { id: request.id, ok: true };
+  }
+
+  const format = request.format || 'png';
+  const { data } = await renderMermaid(browser, request.code, format, {
+    viewport: { width: request.width || 800, height: request.height || 600 },
+    backgroundColor: request.background || 'white',
+    mermaidConfig: { theme: request.theme || 'default' },
+  });
+  return { id: request.id, ok: true, data: Buffer.from(data).toString('base64') };
+}
+
+// Requests are handled one at a time; the pool never sends a second request before the first is answered
+const lines = readline.createInterface({ input: process.stdin });
+let queue = Promise.resolve();
+
+lines.on('line', (line) => {
+  queue = queue.then(async () => {
+    let request;
+    try {
+      request = JSON.parse(line);
+      reply(await handle(request));
+    } catch (error) {
+      reply({ id: request ? request.id : null, ok: false, error: String(error && error.message || error) });
+    }
+  });
+});
+
+lines.on('close', async () => {
+  await queue;
+  await browser.close();
+  process.exit(0);
+});
+
+reply({ ready: true });
@@ -0,0 +1,13 @@
+# Shared setup for the interview_app tests: main.py is imported straight from the folder above, the way
+# benchmark.py does, with every cache pointed at a temporary folder and no node render workers.
+import os
+import sys
+import tempfile
+
+TEST_CACHE_DIR = tempfile.mkdtemp(prefix="mermaid_tests_")
+os.environ["MERMAID_RENDER_CACHE_DIR"] = os.path.join(TEST_CACHE_DIR, "renders")
+os.environ["MERMAID_PROMPT_CACHE_PATH"] = os.path.join(TEST_CACHE_DIR, "responses.sqlite3")
+os.environ["MERMAID_HISTORY_PATH"] = os.path.join(TEST_CACHE_DIR, "history.sqlite3")
+os.environ["MERMAID_RENDER_WORKERS"] = "0"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
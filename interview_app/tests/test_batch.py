@@ -0,0 +1,41 @@
+# Batch mode: prompt ids name the output files, so they are checked when the prompts are loaded
+import json
+
+import pytest
+
+import main
+
+
+def write_prompts(tmp_path, entries):
+    prompts_path = tmp_path / "prompts.jsonl"
+    prompts_path.write_text("".join(json.dumps(entry) + "\n" for entry in entries), encoding="utf-8")
+    return str(prompts_path)
+
+
+def test_ids_default_to_the_line_number(tmp_path):
+    prompts_path = write_prompts(tmp_path, [{"id": "login-flow_v2.1", "prompt": "a"}, {"prompt": "b"}, "c"])
+    prompts = main.DiagramBatchRunner.read_prompts(prompts_path)
+    assert [item["id"] for item in prompts] == ["login-flow_v2.1", "2", "3"]
+
+
+@pytest.mark.parametrize("item_id", ["../escape", "/etc/passwd", "a/b", "a\\b", "", ".", "..", "name with space"])
+def test_ids_that_are_not_plain_file_names_are_rejected(tmp_path, item_id):
+    prompts_path = write_prompts(tmp_path, [{"id": item_id, "prompt": "a"}])
+    with pytest.raises(Exception, match="may only contain"):
+        main.DiagramBatchRunner.read_prompts(prompts_path)
+
+
+@pytest.mark.parametrize("ids", [["flow", "flow"], ["Flow", "flow"], ["2", {"prompt": "b"}]])
+def test_duplicate_ids_are_rejected(tmp_path, ids):
+    entries = [item_id if isinstance(item_id, dict) else {"id": item_id, "prompt": "a"} for item_id in ids]
+    prompts_path = write_prompts(tmp_path, entries)
+    with pytest.raises(Exception, match="already used on line 1"):
+        main.DiagramBatchRunner.read_prompts(prompts_path)
+
+
+def test_batch_client_leaves_retries_to_the_runner():
+    generator = main.MermaidDiagramGenerator(None, api_key="test-key", api_max_retries=0)
+    try:
+        assert generator.get_client().max_retries == 0
+    finally:
+        generator.close()
@@ -0,0 +1,84 @@
+# PromptResponseCache trimming and expiry, and repairs staying out of it
+import pytest
+
+import main
+
+SYSTEM_PROMPT = "system"
+
+
+@pytest.fixture
+def make_cache(tmp_path):
+    caches = []
+
+    def make(**options):
+        cache = main.PromptResponseCache(str(tmp_path / "responses.sqlite3"), **options)
+        caches.append(cache)
+        return cache
+
+    yield make
+    for cache in caches:
+        cache.close()
+
+
+def test_trims_least_recently_used_only_past_max_entries(make_cache):
+    cache = make_cache(ttl_seconds=3600, max_entries=10)
+    for index in range(10):
+        cache.put(f"prompt {index}", "model", SYSTEM_PROMPT, f"code {index}", 1.0)
+    assert cache.stats()["entries"] == 10
+
+    # Used again, so it outlives older entries
+    assert cache.get("prompt 0", "model", SYSTEM_PROMPT) == "code 0"
+
+    cache.put("prompt 10", "model", SYSTEM_PROMPT, "code 10", 1.0)
+    assert cache.stats()["entries"] == 9
+    assert cache.get("prompt 0", "model", SYSTEM_PROMPT) == "code 0"
+    assert cache.get("prompt 1", "model", SYSTEM_PROMPT) is None
+    assert cache.get("prompt 10", "model", SYSTEM_PROMPT) == "code 10"
+
+    # Replacing an entry doesn't count as a new one
+    cache.put("prompt 10", "model", SYSTEM_PROMPT, "code 10 again", 1.0)
+    assert cache.stats()["entries"] == 9
+
+
+def test_entry_count_survives_reopening(make_cache):
+    cache = make_cache(ttl_seconds=3600, max_entries=3)
+    for index in range(3):
+        cache.put(f"prompt {index}", "model", SYSTEM_PROMPT, f"code {index}", 1.0)
+    cache.close()
+
+    reopened = make_cache(ttl_seconds=3600, max_entries=3)
+    reopened.put("prompt 3", "model", SYSTEM_PROMPT, "code 3", 1.0)
+    assert reopened.stats()["entries"] <= 3
+
+
+def test_expired_entries_are_not_served_between_sweeps(make_cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(main.time, "time", lambda: now[0])
+    cache = make_cache(ttl_seconds=30, max_entries=10, expire_interval=60, fuzzy_threshold=0.5)
+    cache.put("flowchart of the login process", "model", SYSTEM_PROMPT, "graph TD", 1.0)
+
+    now[0] += 31
+    assert cache.get("flowchart of the login process", "model", SYSTEM_PROMPT) is None
+    assert cache.get("flowchart of a login process", "model", SYSTEM_PROMPT) is None
+
+    # The sweep that deletes it waits for its interval
+    assert cache.stats()["entries"] == 1
+    now[0] += 30
+    assert cache.get("anything", "model", SYSTEM_PROMPT) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_repairs_skip_the_prompt_cache(monkeypatch):
+    generator = main.MermaidDiagramGenerator(None, client=object())
+    calls = []
+
+    def fake_get_mermaid_from_claude(prompt, cancel_event=None, use_cache=True, **options):
+        calls.append(use_cache)
+        return "graph TD\n    A --> B"
+
+    monkeypatch.setattr(generator, "get_mermaid_from_claude", fake_get_mermaid_from_claude)
+    try:
+        generator.repair_mermaid_code("graph TD\n    A -->", Exception("Parse error"))
+    finally:
+        generator.close()
+    assert calls == [False]
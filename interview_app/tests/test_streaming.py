@@ -0,0 +1,141 @@
+# The streaming Claude path, run offline against a fake client: the fence scanner, the early render at the
+# closing fence and the per-call timings
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import main
+
+FLOWCHART = "graph TD\n    A[Start] --> B[End]"
+
+
+class FakeStream:
+    # Stands in for client.messages.stream(...). After the chunk that closes the code fence it holds the rest of
+    # the response back until rendering has started (or a timeout), so the test can tell when that happened.
+    def __init__(self, chunks, render_started, hold_after=None):
+        self.chunks = chunks
+        self.render_started = render_started
+        self.hold_after = hold_after
+        self.rendering_before_rest = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    @property
+    def text_stream(self):
+        for index, chunk in enumerate(self.chunks):
+            yield chunk
+            if index == self.hold_after:
+                self.rendering_before_rest = self.render_started.wait(timeout=5)
+
+    def get_final_message(self):
+        return SimpleNamespace(usage=SimpleNamespace(input_tokens=12, output_tokens=34))
+
+
+class FakeClient:
+    def __init__(self, chunks, hold_after=None):
+        self.chunks = chunks
+        self.hold_after = hold_after
+        self.render_started = threading.Event()
+        self.streams = []
+        self.messages = self
+
+    def stream(self, **request):
+        stream = FakeStream(self.chunks, self.render_started, self.hold_after)
+        self.streams.append(stream)
+        return stream
+
+    def create(self, **request):
+        raise AssertionError("the streaming path should not call messages.create")
+
+
+class FakeRoot:
+    # Just enough of Tk for the pipeline: UI updates are dropped
+    def after(self, delay, function=None, *args):
+        return None
+
+
+@pytest.fixture
+def make_generator():
+    generators = []
+
+    def make(client):
+        generator = main.MermaidDiagramGenerator(None, client=client)
+        generators.append(generator)
+        return generator
+
+    yield make
+    for generator in generators:
+        generator.close()
+
+
+def test_fence_scanner_returns_code_at_the_closing_fence():
+    scanner = main.MermaidFenceScanner()
+    chunks = ["``", "`mer", "maid\ngraph TD\n", "    A --> B\n", "``", "`", "\nThat's the diagram."]
+    results = [scanner.feed(chunk) for chunk in chunks]
+    assert results == [None, None, None, None, None, "graph TD\n    A --> B", None]
+    assert scanner.finish() == "graph TD\n    A --> B"
+
+
+def test_fence_scanner_without_a_fence_uses_the_whole_response():
+    scanner = main.MermaidFenceScanner()
+    assert scanner.feed("graph LR\n") is None
+    assert scanner.feed("    A --> B") is None
+    assert scanner.finish() == "graph LR\n    A --> B"
+
+
+def test_rendering_starts_at_the_closing_fence(make_generator):
+    chunks = ["```mermaid\n", FLOWCHART + "\n", "```", "\nThis diagram shows", " a start and an end."]
+    client = FakeClient(chunks, hold_after=2)
+    generator = make_generator(client)
+    generator.root = FakeRoot()
+
+    rendered = []
+
+    def fake_render(mermaid_code):
+        rendered.append(mermaid_code)
+        client.render_started.set()
+        return b"image"
+
+    generator.generate_mermaid_image = fake_render
+    job = main.DiagramJob("a start and an end, streamed", (800, 600))
+
+    assert generator.run_code_stage(job) == FLOWCHART
+    assert client.streams[0].rendering_before_rest is True
+    assert job.early_render_code == FLOWCHART
+    assert job.futures["early_render"].result(timeout=5) == b"image"
+    assert rendered == [FLOWCHART]
+
+
+def test_timings_are_recorded_per_call(make_generator):
+    client = FakeClient(["```mermaid\n", FLOWCHART, "\n```", "\nDone."])
+    generator = make_generator(client)
+    prompt = "a start and an end, timed"
+
+    timings = {}
+    codes = []
+    assert generator.get_mermaid_from_claude(prompt, on_code=codes.append, timings=timings) == FLOWCHART
+    assert set(timings) == {"started", "time_to_first_token", "time_to_code"}
+    assert 0 <= timings["time_to_first_token"] <= timings["time_to_code"]
+    assert codes == [FLOWCHART]
+
+    # The same prompt again comes from the prompt cache, without another stream
+    cached_timings = {}
+    assert generator.get_mermaid_from_claude(prompt, timings=cached_timings) == FLOWCHART
+    assert set(cached_timings) == {"started", "cache_hit", "time_to_code"}
+    assert cached_timings["cache_hit"] is True
+    assert len(client.streams) == 1
+
+
+def test_no_api_key_and_no_client_is_an_error(monkeypatch):
+    monkeypatch.delenv("ANTHROPIC_API_KEY", raising=False)
+    generator = main.MermaidDiagramGenerator(None)
+    try:
+        with pytest.raises(Exception, match="No Anthropic API key"):
+            generator.get_client()
+    finally:
+        generator.close()
@@ -0,0 +1,47 @@
+# validate_mermaid against the snippet corpus: every valid snippet passes, and every invalid one fails with the
+# line, column and diagram type recorded for it
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import mermaid_render
+
+with open(mermaid_render.MERMAID_CORPUS_PATH, 'r', encoding='utf-8') as file:
+    CORPUS = json.load(file)
+
+
+@pytest.mark.parametrize("case", CORPUS["valid"], ids=lambda case: case["name"])
+def test_valid_snippets_pass(case):
+    assert mermaid_render.validate_mermaid(case["code"]) is None
+
+
+@pytest.mark.parametrize("case", CORPUS["invalid"], ids=lambda case: case["name"])
+def test_invalid_snippets_fail_where_expected(case):
+    error = mermaid_render.validate_mermaid(case["code"])
+    assert isinstance(error, mermaid_render.MermaidValidationError)
+    assert error.message
+    assert (error.line, error.column, error.diagram_type) == (case["line"], case["column"], case["diagram_type"])
+    assert str(error) == (f"Line {error.line}: {error.message}" if error.line else error.message)
+
+
+def test_columns_point_into_the_line_as_written():
+    error = mermaid_render.validate_mermaid("graph TD\n        A --> B]")
+    assert (error.line, error.column) == (2, 16)
+    assert "graph TD\n        A --> B]".splitlines()[1][error.column - 1] == "]"
+
+
+def test_corpus_command_agrees():
+    total, failures = mermaid_render.check_mermaid_corpus()
+    assert total == len(CORPUS["valid"]) + len(CORPUS["invalid"])
+    assert failures == []
+
+
+def test_imports_without_the_gui_dependencies():
+    # The PowerPoint converter loads this module in headless batch and serve runs
+    blocked = "import sys; sys.modules.update(dict.fromkeys(['tkinter', 'PIL', 'anthropic', 'cairosvg']))"
+    result = subprocess.run([sys.executable, "-c", f"{blocked}; import mermaid_render"],
+                            cwd=os.path.dirname(mermaid_render.__file__), capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
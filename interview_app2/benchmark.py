@@ -0,0 +1,381 @@
+### CONVERTER BENCHMARKS ###
+# Two benchmarks for main.py on synthetic decks:
+# - Without a command: the built-in PPTX writer against pandoc on the same deck. Every deck only uses
+#   Markdown the native writer supports (headings, lists, tables, code, quotes, links), so both sides convert
+#   exactly the same input.
+# - suite: the headless file conversion (convert_markdown_file, what batch mode and the GUI run) over decks of
+#   10 to 10,000 slides with a chosen share of table slides, a number of images and each --slide-level / -i
+#   combination. Every case runs in a fresh process, so its peak memory and cold caches are its own. Wall time,
+#   peak RSS (ours and pandoc's) and output size are recorded, can be saved as a baseline, and later runs are
+#   checked against it. --pandoc-stub swaps pandoc for pandoc_stub.py to time just the Python side offline.
+#
+# Usage:
+#   python benchmark.py --sizes 10 100 1000 --runs 3
+#   python benchmark.py --incremental --theme night --json > results.json
+#   python benchmark.py suite --sizes 10 100 1000 10000 --tables 0.5 --images 20 --save-baseline baseline.json
+#   python benchmark.py suite --pandoc-stub --baseline baseline.json --threshold 0.2
+
+# Imports
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+# Peak memory comes from getrusage, which Windows doesn't have
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Keep the benchmark away from the real caches, so every suite case starts cold
+BENCHMARK_CACHE_DIR = tempfile.mkdtemp(prefix="pptx_benchmark_")
+os.environ["PPTX_SLIDE_CACHE_DIR"] = os.path.join(BENCHMARK_CACHE_DIR, "slides")
+os.environ["PPTX_IMAGE_CACHE_DIR"] = os.path.join(BENCHMARK_CACHE_DIR, "images")
+os.environ["PPTX_MERMAID_CACHE_DIR"] = os.path.join(BENCHMARK_CACHE_DIR, "diagrams")
+
+import main
+
+PANDOC_STUB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pandoc_stub.py")
+
+# Synthetic images: pixel size (downscaled to slide size on the way in, like a typical screenshot or photo)
+BENCHMARK_IMAGE_SIZE = (2400, 1600)
+
+# Time differences below this are noise, whatever the relative change
+REGRESSION_MIN_SECONDS = 0.05
+
+
+def make_slide(index, kind=None):
+    # A handful of slide shapes that show up in real decks, picked by index so every run is the same
+    kind = index % 5 if kind is None else kind
+    lines = [f"## Slide {index + 1}: topic {index % 17}", ""]
+    if kind == 0:
+        lines += [f"- Point **{index}** with *emphasis* and `inline code`",
+                  f"- A [link](https://example.com/{index}) -- with \"quotes\"...",
+                  "    - A nested detail",
+                  "    - Another nested detail",
+                  "- Closing point"]
+    elif kind == 1:
+        lines += ["| Metric | Before | After |", "|:-------|-------:|------:|"]
+        lines += [f"| row {row} | {index * row} | {index * row // 2} |" for row in range(1, 6)]
+    elif kind == 2:
+        lines += ["Some context for the code below.", "", "```python",
+                  f"def step_{index}(value):", "    return value * 2", "```"]
+    elif kind == 3:
+        lines += [f"> Quote number {index}, with ~~struck~~ words.", "",
+                  "1. First step", "2. Second step", "3. Third step"]
+    else:
+        lines += [f"Paragraph text for slide {index}. " * 4, "", "### A sub heading", "",
+                  "More text under the sub heading."]
+    return "\n".join(lines) + "\n"
+
+
+def spread(index, count, total):
+    # Whether slide index is one of count slides spread evenly over total
+    return count > 0 and (index + 1) * count // total > index * count // total
+
+
+def make_deck(slides, table_density=None, image_names=()):
+    # table_density is the share of slides that are tables (by default every fifth slide is). Slides picked for
+    # an image get one of image_names below their text, each image used once.
+    parts = ["---", f"title: Synthetic deck ({slides} slides)", "author: Benchmark", "---", ""]
+    images = iter(image_names)
+    for index in range(slides):
+        if index % 25 == 0:
+            parts.append(f"# Part {index // 25 + 1}\n")
+        if table_density is None:
+            slide = make_slide(index)
+        elif spread(index, round(table_density * slides), slides):
+            slide = make_slide(index, 1)
+        else:
+            slide = make_slide(index, (0, 2, 3, 4)[index % 4])
+        if spread(index, len(image_names), slides):
+            slide += f"\n![Figure {index + 1}]({next(images)})\n"
+        parts.append(slide)
+    return "\n".join(parts)
+
+
+def make_images(folder, count):
+    # count distinct photo-like JPEGs (noise doesn't compress, so they weigh what real photos do)
+    if count and main.Image is None:
+        raise SystemExit("Decks with images need Pillow. Install it using: pip install Pillow")
+    names = []
+    for index in range(count):
+        noise = main.Image.effect_noise(BENCHMARK_IMAGE_SIZE, 40 + index % 40)
+        gradient = main.Image.linear_gradient("L").resize(BENCHMARK_IMAGE_SIZE)
+        tint = main.Image.new("L", BENCHMARK_IMAGE_SIZE, (index * 37) % 256)
+        name = f"image_{index}.jpg"
+        main.Image.merge("RGB", (noise, gradient, tint)).save(os.path.join(folder, name), quality=95)
+        names.append(name)
+    return names
+
+
+def count_slides(data):
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        return sum(1 for name in archive.namelist() if name.startswith("ppt/slides/slide"))
+
+
+def time_conversion(convert, runs):
+    # Returns (median seconds, output bytes of the last run)
+    durations = []
+    data = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        data = convert()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations), data
+
+
+def run_benchmark(slides, runs, theme, incremental, skip_pandoc):
+    markdown_text = make_deck(slides)
+    options = {"theme": theme, "slide_level": 2, "incremental": incremental}
+
+    native_seconds, native_data = time_conversion(lambda: main.convert_markdown_native(markdown_text, **options),
+                                                  runs)
+    result = {
+        "slides": slides,
+        "markdown_bytes": len(markdown_text.encode("utf-8")),
+        "native_seconds": round(native_seconds, 4),
+        "native_slides_per_second": round(slides / native_seconds, 1),
+        "native_output_bytes": len(native_data),
+        "native_pptx_slides": count_slides(native_data),
+    }
+
+    if not skip_pandoc:
+        pandoc_seconds, pandoc_data = time_conversion(
+            lambda: main.convert_markdown_to_bytes(markdown_text, native=False, **options), runs)
+        result.update({
+            "pandoc_seconds": round(pandoc_seconds, 4),
+            "pandoc_slides_per_second": round(slides / pandoc_seconds, 1),
+            "pandoc_output_bytes": len(pandoc_data),
+            "pandoc_pptx_slides": count_slides(pandoc_data),
+            "speedup": round(pandoc_seconds / native_seconds, 1),
+        })
+    return result
+
+
+def print_report(results):
+    print("slides    native s   slides/s    pandoc s   slides/s   speedup   native KB   pandoc KB")
+    for result in results:
+        pandoc = result.get("pandoc_seconds")
+        print(f"{result['slides']:>6} {result['native_seconds']:>11.4f} {result['native_slides_per_second']:>10} "
+              + (f"{pandoc:>11.4f} {result['pandoc_slides_per_second']:>10} {result['speedup']:>8}x "
+                 if pandoc is not None else f"{'-':>11} {'-':>10} {'-':>9} ")
+              + f"{result['native_output_bytes'] / 1024:>11.1f} "
+              + (f"{result['pandoc_output_bytes'] / 1024:>11.1f}" if pandoc is not None else f"{'-':>11}"))
+        if pandoc is not None and result["native_pptx_slides"] != result["pandoc_pptx_slides"]:
+            print(f"       warning: native wrote {result['native_pptx_slides']} slides, "
+                  f"pandoc {result['pandoc_pptx_slides']}")
+
+
+def peak_rss_kb(who):
+    # Peak resident memory in KB (ru_maxrss is in bytes on macOS), or None without getrusage
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def case_key(case):
+    return (f"{case['slides']} slides, tables {case['tables']:g}, {case['images']} images, "
+            f"level {case['slide_level']}{', -i' if case['incremental'] else ''}"
+            f"{', pandoc only' if case['pandoc_only'] else ''}")
+
+
+def run_case(case):
+    # One suite case, in a process of its own (see run_case_process). Only the conversion itself is timed.
+    deck_dir = tempfile.mkdtemp(dir=BENCHMARK_CACHE_DIR)
+    image_names = make_images(deck_dir, case["images"])
+    markdown_text = make_deck(case["slides"], case["tables"], image_names)
+    input_path = os.path.join(deck_dir, "deck.md")
+    output_path = os.path.join(deck_dir, "deck.pptx")
+    with open(input_path, 'w', encoding='utf-8') as file:
+        file.write(markdown_text)
+
+    started = time.perf_counter()
+    main.convert_markdown_file(input_path, output_path, case["theme"], case["slide_level"], case["incremental"],
+                               native=False if case["pandoc_only"] else None)
+    seconds = time.perf_counter() - started
+
+    # Image worker processes only count towards the children's peak once they have exited
+    main.close_asset_workers()
+
+    with open(output_path, 'rb') as file:
+        data = file.read()
+    return {
+        "seconds": seconds,
+        "peak_rss_kb": peak_rss_kb(resource.RUSAGE_SELF) if resource else None,
+        "children_peak_rss_kb": peak_rss_kb(resource.RUSAGE_CHILDREN) if resource else None,
+        "markdown_bytes": len(markdown_text.encode("utf-8")),
+        "output_bytes": len(data),
+        "pptx_slides": count_slides(data),
+    }
+
+
+def run_case_process(case, pandoc_path):
+    # getrusage peaks never go down, so measuring several cases in one process would only show the biggest
+    env = dict(os.environ, PANDOC=pandoc_path)
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "case", json.dumps(case)], env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise main.ConversionError(f"{case_key(case)} failed: {result.stderr.decode('utf-8', errors='replace')}")
+    return json.loads(result.stdout)
+
+
+def run_suite(cases, runs, pandoc_path, on_result=None):
+    # Median wall time over runs, the highest peaks, and sizes from the last run
+    results = []
+    for case in cases:
+        measurements = [run_case_process(case, pandoc_path) for _ in range(runs)]
+        peaks = [measurement["peak_rss_kb"] for measurement in measurements]
+        children_peaks = [measurement["children_peak_rss_kb"] for measurement in measurements]
+        result = dict(case)
+        result.update({
+            "seconds": round(statistics.median(measurement["seconds"] for measurement in measurements), 4),
+            "peak_rss_kb": max(peaks) if None not in peaks else None,
+            "children_peak_rss_kb": max(children_peaks) if None not in children_peaks else None,
+            "markdown_bytes": measurements[-1]["markdown_bytes"],
+            "output_bytes": measurements[-1]["output_bytes"],
+            "pptx_slides": measurements[-1]["pptx_slides"],
+        })
+        results.append(result)
+        if on_result:
+            on_result(result)
+    return results
+
+
+def make_cases(args):
+    return [{"slides": slides, "tables": args.tables, "images": args.images, "slide_level": slide_level,
+             "incremental": incremental, "pandoc_only": args.pandoc_only, "theme": args.theme}
+            for slides in args.sizes
+            for slide_level in args.slide_levels
+            for incremental in {"off": (False,), "on": (True,), "both": (False, True)}[args.incremental]]
+
+
+def find_regressions(results, baseline, threshold):
+    # Every measurement more than threshold (a fraction) above the baseline's value for the same case
+    previous = {case_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get(case_key(result))
+        if old is None:
+            continue
+        for metric in ("seconds", "peak_rss_kb", "children_peak_rss_kb", "output_bytes"):
+            if not old.get(metric) or result.get(metric) is None:
+                continue
+            if result[metric] <= old[metric] * (1 + threshold):
+                continue
+            if metric == "seconds" and result[metric] - old[metric] < REGRESSION_MIN_SECONDS:
+                continue
+            regressions.append(f"{case_key(result)}: {metric} {old[metric]} -> {result[metric]} "
+                               f"(+{(result[metric] / old[metric] - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_suite_result(result):
+    def megabytes(kb):
+        return f"{kb / 1024:>9.1f}" if kb is not None else f"{'-':>9}"
+
+    print(f"{result['slides']:>6} {result['tables']:>6g} {result['images']:>6} {result['slide_level']:>5} "
+          f"{'yes' if result['incremental'] else 'no':>4} {result['seconds']:>9.3f} "
+          f"{megabytes(result['peak_rss_kb'])} {megabytes(result['children_peak_rss_kb'])} "
+          f"{result['output_bytes'] / 1024:>10.1f} {result['pptx_slides']:>7}", flush=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the Markdown to PPTX conversion on synthetic decks.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    # Without a command: native writer against pandoc
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="Deck sizes in slides")
+    parser.add_argument("--runs", type=int, default=3, help="Conversions per deck and writer (median is reported)")
+    parser.add_argument("--theme", default="default", help="Presentation theme")
+    parser.add_argument("--incremental", action="store_true", help="Incremental bullets")
+    parser.add_argument("--skip-pandoc", action="store_true", help="Only time the native writer")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+
+    suite_parser = subparsers.add_parser("suite", help="Scaling and regression suite over the file conversion")
+    suite_parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000],
+                              help="Deck sizes in slides")
+    suite_parser.add_argument("--tables", type=float, default=0.2, help="Share of slides that are tables (0-1)")
+    suite_parser.add_argument("--images", type=int, default=0, help="Distinct images in each deck, one per slide")
+    suite_parser.add_argument("--slide-levels", type=int, nargs="+", default=[2], help="--slide-level values to run")
+    suite_parser.add_argument("--incremental", choices=("off", "on", "both"), default="off",
+                              help="Run without -i, with it, or both")
+    suite_parser.add_argument("--pandoc-only", action="store_true", help="Never use the native writer")
+    suite_parser.add_argument("--theme", default="default", help="Presentation theme")
+    suite_parser.add_argument("--runs", type=int, default=1, help="Processes per case (median time is reported)")
+    suite_parser.add_argument("--pandoc-stub", action="store_true",
+                              help="Use pandoc_stub.py instead of pandoc, to time the Python side offline")
+    suite_parser.add_argument("--baseline", help="Compare against this baseline and exit 1 on regressions")
+    suite_parser.add_argument("--threshold", type=float, default=0.2,
+                              help="Allowed increase over the baseline, as a fraction (0.2 = 20%%)")
+    suite_parser.add_argument("--save-baseline", help="Write the results here as the new baseline")
+    suite_parser.add_argument("--json", action="store_true", help="Print results as JSON")
+
+    case_parser = subparsers.add_parser("case", help="Run a single suite case (used by suite)")
+    case_parser.add_argument("case", help="Case as JSON")
+    return parser.parse_args()
+
+
+def run_suite_command(args):
+    pandoc_path = PANDOC_STUB_PATH if args.pandoc_stub else main.PANDOC_PATH
+    cases = make_cases(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        if baseline["pandoc_stub"] != args.pandoc_stub:
+            # Stub timings and real pandoc timings can't be compared with each other
+            raise SystemExit(f"{args.baseline} was recorded {'with' if baseline['pandoc_stub'] else 'without'} "
+                             "--pandoc-stub, run the suite the same way to compare against it")
+
+    if not args.json:
+        print("slides tables images level   -i    wall s    RSS MB  child MB  output KB  slides")
+    results = run_suite(cases, args.runs, pandoc_path, on_result=None if args.json else print_suite_result)
+    report = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pandoc_stub": args.pandoc_stub,
+        "results": results,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    if args.save_baseline:
+        main.write_file_atomic(args.save_baseline, json.dumps(report, indent=2))
+
+    if baseline is not None:
+        regressions = find_regressions(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+        if regressions:
+            raise SystemExit(1)
+        print(f"No regressions over {args.threshold * 100:.0f}% against {args.baseline}", file=sys.stderr)
+
+
+# Run
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        if args.command == "case":
+            print(json.dumps(run_case(json.loads(args.case))))
+        elif args.command == "suite":
+            run_suite_command(args)
+        else:
+            results = [run_benchmark(slides, args.runs, args.theme, args.incremental, args.skip_pandoc)
+                       for slides in args.sizes]
+
+            if args.json:
+                print(json.dumps(results, indent=2))
+            else:
+                print_report(results)
+    finally:
+        shutil.rmtree(BENCHMARK_CACHE_DIR, ignore_errors=True)
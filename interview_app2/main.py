@@ -1,9 +1,2794 @@
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk, scrolledtext
 import subprocess
 import os
 import threading
 import tempfile
+import argparse
+import codecs
+import hashlib
+import html
+import importlib.util
+import io
+import json
+import logging
+import multiprocessing
+import queue
+import re
+import string
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+import zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Only needed to shrink images before they go into a deck
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# Only needed for the window; batch, watch and serve run without it
+try:
+    import tkinter as tk
+    from tkinter import filedialog, messagebox, ttk, scrolledtext
+except ImportError:
+    tk = None
+
+
+logger = logging.getLogger(__name__)
+
+
+# Conversion settings (PANDOC picks a pandoc other than the one on PATH, e.g. a stub for offline benchmarks)
+PANDOC_PATH = os.environ.get("PANDOC", "pandoc")
+CONVERSION_TIMEOUT_SECONDS = float(os.environ.get("PPTX_CONVERSION_TIMEOUT", "300"))
+PIPE_CHUNK_SIZE = 64 * 1024
+CANCEL_POLL_SECONDS = 0.1
+
+
+# Conversion service settings
+ENGINE_WORKERS = int(os.environ.get("PPTX_ENGINE_WORKERS", str(os.cpu_count() or 1)))
+ENGINE_QUEUE_SIZE = int(os.environ.get("PPTX_ENGINE_QUEUE_SIZE", "32"))
+ENGINE_MAX_FINISHED_JOBS = 200
+ENGINE_LATENCY_SAMPLES = 1000
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_MAX_BODY_BYTES = 64 * 1024 * 1024
+SERVICE_INPUT_DIR = os.environ.get("PPTX_SERVICE_INPUT_DIR", os.path.expanduser("~"))
+SERVICE_OUTPUT_DIR = os.environ.get("PPTX_SERVICE_OUTPUT_DIR", os.path.expanduser("~"))
+SERVICE_LOCAL_HOSTS = ("localhost", "127.0.0.1", "[::1]")
+SERVICE_POLL_MS = 100
+
+
+# Batch conversion settings
+BATCH_MANIFEST_NAME = ".pptx_manifest.json"
+# The manifest is written after this many finished files or this many seconds, whichever comes first, and at the end
+BATCH_MANIFEST_SAVE_EVERY = 50
+BATCH_MANIFEST_SAVE_SECONDS = 5.0
+MARKDOWN_EXTENSIONS = (".md", ".markdown")
+
+
+# Per-slide rebuild cache settings
+CACHE_ROOT = os.path.join(os.path.expanduser("~"), ".cache", "markdown_to_pptx")
+SLIDE_CACHE_DIR = os.environ.get("PPTX_SLIDE_CACHE_DIR", os.path.join(CACHE_ROOT, "slides"))
+SLIDE_CACHE_MAX_ENTRIES = int(os.environ.get("PPTX_SLIDE_CACHE_MAX_ENTRIES", "50000"))
+# Slides are parsed with links to other slides' headings turned off: they can't resolve one slide at a time, and
+# this keeps a slide's AST the same whichever slides it was parsed alongside
+SLIDE_READER = "markdown-implicit_header_references"
+# Raw block format that separates the slides of a batched parse
+SLIDE_MARKER_FORMAT = "pptx-slide-cache"
+
+# Image asset settings: local images are shrunk to what a 16:9 slide can show at IMAGE_TARGET_DPI,
+# recompressed and cached by content before pandoc embeds them
+IMAGE_ASSETS_ENABLED = os.environ.get("PPTX_IMAGE_ASSETS", "1") != "0"
+IMAGE_CACHE_DIR = os.environ.get("PPTX_IMAGE_CACHE_DIR", os.path.join(CACHE_ROOT, "images"))
+IMAGE_CACHE_MAX_ENTRIES = int(os.environ.get("PPTX_IMAGE_CACHE_MAX_ENTRIES", "2000"))
+IMAGE_TARGET_DPI = int(os.environ.get("PPTX_IMAGE_DPI", "150"))
+IMAGE_JPEG_QUALITY = 85
+IMAGE_WORKERS = int(os.environ.get("PPTX_IMAGE_WORKERS", str(os.cpu_count() or 1)))
+SLIDE_WIDTH_INCHES = 10
+SLIDE_HEIGHT_INCHES = 5.625
+
+# Mermaid diagram settings: ```mermaid blocks are rendered (a few at a time) and cached by source
+MERMAID_ENABLED = os.environ.get("PPTX_MERMAID", "1") != "0"
+MERMAID_CACHE_DIR = os.environ.get("PPTX_MERMAID_CACHE_DIR", os.path.join(CACHE_ROOT, "diagrams"))
+MERMAID_CACHE_MAX_MB = int(os.environ.get("PPTX_MERMAID_CACHE_MAX_MB", "200"))
+# Each render worker is a headless browser (a few hundred MB), so keep this small whatever the core count
+MERMAID_RENDER_WORKERS = int(os.environ.get("PPTX_MERMAID_WORKERS", "2"))
+MERMAID_RENDER_TIMEOUT = 60
+MERMAID_RENDER_OPTIONS = {"format": "png", "theme": "default", "background": "white", "width": 1600,
+                          "height": 900}
+DIAGRAM_APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "interview_app")
+
+# Editor settings: big files are loaded a chunk per idle callback, and past the threshold an unmodified
+# file is converted straight from disk instead of being copied back out of the editor
+EDITOR_LOAD_CHUNK_SIZE = 256 * 1024
+EDITOR_DIRECT_CONVERT_BYTES = int(os.environ.get("PPTX_EDITOR_DIRECT_CONVERT_BYTES", str(1024 * 1024)))
+
+# Watch mode settings
+WATCH_DEBOUNCE_SECONDS = 0.5
+WATCH_POLL_SECONDS = 0.5
+
+# Markdown structure the slide splitter cares about
+ATX_HEADING_RE = re.compile(r"^ {0,3}(#{1,6})(\s|$)")
+CODE_FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+# Reference links and footnotes can point across slides, so decks using them are always converted whole
+CROSS_SLIDE_REFERENCE_RE = re.compile(r"^ {0,3}\[[^\]]+\]:|\[\^[^\]]+\]", re.MULTILINE)
+# Mermaid fences may be indented any amount, e.g. inside a (nested) list item
+MERMAID_FENCE_RE = re.compile(r"^ *(`{3,}|~{3,})\s*\{?\s*\.?mermaid\b", re.MULTILINE)
+# ![alt](target "title"): group 1 is everything up to the target, group 2 the target itself
+MARKDOWN_IMAGE_RE = re.compile(r"(!\[(?:[^\[\]]|\[[^\[\]]*\])*\]\(\s*)(<[^<>\n]+>|[^\s()<>]+)")
+
+# Native writer settings: decks that only use common Markdown are written straight to .pptx in-process,
+# anything else still goes through pandoc
+NATIVE_WRITER_ENABLED = os.environ.get("PPTX_NATIVE_WRITER", "1") != "0"
+NATIVE_TITLE_FRAME = (457200, 205979, 8229600, 857250)
+NATIVE_CONTENT_FRAME = (457200, 1200150, 8229600, 3394472)
+NATIVE_LINE_HEIGHT = 304800
+NATIVE_CHARS_PER_LINE = 70
+NATIVE_TABLE_ROW_HEIGHT = 370840
+NATIVE_LIST_INDENT = 342900
+NATIVE_QUOTE_INDENT = 457200
+NATIVE_CODE_SIZE = 1400
+NATIVE_TABLE_STYLE_ID = "{5C22544A-7EE6-4342-B048-85BDC9FD1C3A}"
+NATIVE_THEMES = {
+    "default": {"background": "FFFFFF", "text": "000000", "accent": "4472C4",
+                "heading_font": "Calibri Light", "body_font": "Calibri"},
+    "serif": {"background": "F0F1EB", "text": "000000", "accent": "51483D",
+              "heading_font": "Palatino Linotype", "body_font": "Palatino Linotype"},
+    "simple": {"background": "FFFFFF", "text": "000000", "accent": "00008B",
+               "heading_font": "Arial", "body_font": "Arial"},
+    "night": {"background": "111111", "text": "EEEEEE", "accent": "E7AD52",
+              "heading_font": "Arial", "body_font": "Arial"},
+    "moon": {"background": "002B36", "text": "93A1A1", "accent": "268BD2",
+             "heading_font": "Arial", "body_font": "Arial"},
+}
+
+# Markdown the native writer understands (or knows to hand over to pandoc)
+INLINE_CODE_RE = re.compile(r"(`+)(.+?)(?<!`)\1(?!`)", re.DOTALL)
+INLINE_LINK_RE = re.compile(r"\[([^\[\]]*)\]\(\s*<?([^\s()<>]+)>?(?:\s+\"[^\"]*\")?\s*\)")
+AUTOLINK_RE = re.compile(r"<((?:https?://|mailto:)[^\s<>]+)>")
+BLOCKQUOTE_RE = re.compile(r"^ {0,3}> ?")
+LIST_ITEM_RE = re.compile(r"^(\s*)([-+*]|\d{1,9}[.)])(\s+|$)(.*)$")
+TASK_ITEM_RE = re.compile(r"^\[([ xX])\]\s+")
+THEMATIC_BREAK_RE = re.compile(r"^ {0,3}([-*_])(\s*\1){2,}\s*$")
+SETEXT_UNDERLINE_RE = re.compile(r"^ {0,3}(=+|-+)\s*$")
+TABLE_SEPARATOR_RE = re.compile(r"^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)+\|?\s*$|^\s*\|\s*:?-+:?\s*\|\s*$")
+FRONT_MATTER_LINE_RE = re.compile(r"^([A-Za-z_][\w-]*):\s*(.*)$")
+SMART_OPEN_DOUBLE_RE = re.compile("(^|[\\s(\\[{–—])\"")
+SMART_OPEN_SINGLE_RE = re.compile("(^|[\\s(\\[{–—])'")
+RAW_TEX_RE = re.compile(r"\\[A-Za-z]+")
+# Images, raw HTML/TeX blocks, divs, grid tables, line blocks, definition lists, fancy list markers...
+NATIVE_UNSUPPORTED_RE = re.compile(r"!\[")
+NATIVE_UNSUPPORTED_BLOCK_RE = re.compile(
+    r"^ {0,3}(<|:::|\+[-=]|\|\s|[:~]\s|%|\(@|([a-zA-Z]|[ivxlcdmIVXLCDM]+|#)[.)]\s|\(\w+\)\s)")
+# Math, superscript, subscript, citations, bracketed spans and attributes
+NATIVE_UNSUPPORTED_INLINE_RE = re.compile(r"\$[^\s$]|\^[^\s^]+\^|(?<!~)~[^\s~]+~(?!~)|\[@|\]\{|\{[#.=][^}]*\}")
+
+# PresentationML boilerplate for the native writer
+PPTX_NAMESPACES = ('xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+                   'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+                   'xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main"')
+PPTX_XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+PPTX_CONTENT_TYPE_PREFIX = "application/vnd.openxmlformats-officedocument."
+PPTX_RELATIONSHIP_TYPES = {
+    kind: f"http://schemas.openxmlformats.org/officeDocument/2006/relationships/{kind}"
+    for kind in ("officeDocument", "slideMaster", "slideLayout", "slide", "theme", "presProps", "tableStyles",
+                 "hyperlink", "extended-properties")
+}
+PPTX_EMPTY_PARAGRAPH = '<a:endParaRPr lang="en-US"/>'
+PPTX_SHAPE_TREE_START = ('<p:spTree><p:nvGrpSpPr><p:cNvPr id="1" name=""/><p:cNvGrpSpPr/><p:nvPr/></p:nvGrpSpPr>'
+                         '<p:grpSpPr/>')
+
+PPTX_RELS_XML = (PPTX_XML_HEADER + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/'
+                 'relationships">{relationships}</Relationships>')
+
+PPTX_ROOT_RELS_XML = PPTX_RELS_XML.format(relationships=(
+    f'<Relationship Id="rId1" Type="{PPTX_RELATIONSHIP_TYPES["officeDocument"]}" Target="ppt/presentation.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/package/2006/relationships/metadata/'
+    'core-properties" Target="docProps/core.xml"/>'
+    f'<Relationship Id="rId3" Type="{PPTX_RELATIONSHIP_TYPES["extended-properties"]}" Target="docProps/app.xml"/>'))
+
+PPTX_CONTENT_TYPES_XML = (
+    PPTX_XML_HEADER + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    f'<Override PartName="/ppt/presentation.xml" ContentType="{PPTX_CONTENT_TYPE_PREFIX}'
+    'presentationml.presentation.main+xml"/>'
+    f'<Override PartName="/ppt/slideMasters/slideMaster1.xml" ContentType="{PPTX_CONTENT_TYPE_PREFIX}'
+    'presentationml.slideMaster+xml"/>'
+    + "".join(f'<Override PartName="/ppt/slideLayouts/slideLayout{number}.xml" '
+              f'ContentType="{PPTX_CONTENT_TYPE_PREFIX}presentationml.slideLayout+xml"/>' for number in (1, 2, 3))
+    + f'<Override PartName="/ppt/theme/theme1.xml" ContentType="{PPTX_CONTENT_TYPE_PREFIX}theme+xml"/>'
+    f'<Override PartName="/ppt/presProps.xml" ContentType="{PPTX_CONTENT_TYPE_PREFIX}presentationml.presProps+xml"/>'
+    f'<Override PartName="/ppt/tableStyles.xml" ContentType="{PPTX_CONTENT_TYPE_PREFIX}'
+    'presentationml.tableStyles+xml"/>'
+    '<Override PartName="/docProps/core.xml" ContentType="application/vnd.openxmlformats-package.'
+    'core-properties+xml"/>'
+    f'<Override PartName="/docProps/app.xml" ContentType="{PPTX_CONTENT_TYPE_PREFIX}extended-properties+xml"/>'
+    '{slides}</Types>')
+
+PPTX_PRESENTATION_XML = (
+    PPTX_XML_HEADER + f'<p:presentation {PPTX_NAMESPACES} saveSubsetFonts="1"><p:sldMasterIdLst>'
+    '<p:sldMasterId id="2147483648" r:id="rId1"/></p:sldMasterIdLst>{slides}'
+    '<p:sldSz cx="9144000" cy="5143500" type="screen16x9"/><p:notesSz cx="6858000" cy="9144000"/>'
+    '<p:defaultTextStyle><a:lvl1pPr><a:defRPr lang="en-US"/></a:lvl1pPr></p:defaultTextStyle></p:presentation>')
+
+PPTX_PRES_PROPS_XML = PPTX_XML_HEADER + f'<p:presentationPr {PPTX_NAMESPACES}/>'
+PPTX_TABLE_STYLES_XML = (PPTX_XML_HEADER + '<a:tblStyleLst xmlns:a="http://schemas.openxmlformats.org/drawingml/'
+                         f'2006/main" def="{NATIVE_TABLE_STYLE_ID}"/>')
+
+PPTX_CORE_XML = (
+    PPTX_XML_HEADER + '<cp:coreProperties xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/'
+    'core-properties" xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:dcterms="http://purl.org/dc/terms/" '
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"><dc:title>{title}</dc:title>'
+    '<dc:creator>{creator}</dc:creator></cp:coreProperties>')
+
+PPTX_APP_XML = (PPTX_XML_HEADER + '<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/'
+                'extended-properties"><Application>Markdown to PowerPoint Converter</Application>'
+                '<Slides>{slides}</Slides></Properties>')
+
+PPTX_SLIDE_XML = (PPTX_XML_HEADER + f'<p:sld {PPTX_NAMESPACES}><p:cSld>{PPTX_SHAPE_TREE_START}'
+                  '{shapes}</p:spTree></p:cSld><p:clrMapOvr><a:masterClrMapping/></p:clrMapOvr>{timing}</p:sld>')
+
+
+def pptx_placeholder_xml(shape_id, name, placeholder, frame, anchor=""):
+    x, y, width, height = frame
+    return (f'<p:sp><p:nvSpPr><p:cNvPr id="{shape_id}" name="{name}"/><p:cNvSpPr><a:spLocks noGrp="1"/>'
+            f'</p:cNvSpPr><p:nvPr>{placeholder}</p:nvPr></p:nvSpPr><p:spPr><a:xfrm><a:off x="{x}" y="{y}"/>'
+            f'<a:ext cx="{width}" cy="{height}"/></a:xfrm><a:prstGeom prst="rect"><a:avLst/></a:prstGeom>'
+            f'</p:spPr><p:txBody><a:bodyPr{anchor}><a:normAutofit/></a:bodyPr><a:lstStyle/>'
+            f'<a:p>{PPTX_EMPTY_PARAGRAPH}</a:p></p:txBody></p:sp>')
+
+
+def pptx_text_level_xml(level, size, bullet):
+    if bullet:
+        margin = NATIVE_LIST_INDENT * level
+        bullet_xml = f'<a:buFont typeface="Arial"/><a:buChar char="\u2022"/>'
+    else:
+        margin = 0
+        bullet_xml = "<a:buNone/>"
+    return (f'<a:lvl{level}pPr marL="{margin}" indent="{-NATIVE_LIST_INDENT if bullet else 0}" algn="l">'
+            f'<a:spcBef><a:spcPts val="600"/></a:spcBef>{bullet_xml}<a:defRPr sz="{size}" kern="1200">'
+            f'<a:solidFill><a:schemeClr val="tx1"/></a:solidFill><a:latin typeface="+mn-lt"/>'
+            f'<a:ea typeface="+mn-ea"/><a:cs typeface="+mn-cs"/></a:defRPr></a:lvl{level}pPr>')
+
+
+PPTX_MASTER_XML = (
+    PPTX_XML_HEADER + f'<p:sldMaster {PPTX_NAMESPACES}><p:cSld><p:bg><p:bgRef idx="1001"><a:schemeClr val="bg1"/>'
+    f'</p:bgRef></p:bg>{PPTX_SHAPE_TREE_START}'
+    + pptx_placeholder_xml(2, "Title Placeholder 1", '<p:ph type="title"/>', NATIVE_TITLE_FRAME, ' anchor="ctr"')
+    + pptx_placeholder_xml(3, "Text Placeholder 2", '<p:ph type="body" idx="1"/>', NATIVE_CONTENT_FRAME)
+    + '</p:spTree></p:cSld><p:clrMap bg1="lt1" tx1="dk1" bg2="lt2" tx2="dk2" accent1="accent1" '
+    'accent2="accent2" accent3="accent3" accent4="accent4" accent5="accent5" accent6="accent6" hlink="hlink" '
+    'folHlink="folHlink"/><p:sldLayoutIdLst>'
+    + "".join(f'<p:sldLayoutId id="{2147483648 + number}" r:id="rId{number}"/>' for number in (1, 2, 3))
+    + '</p:sldLayoutIdLst><p:txStyles><p:titleStyle><a:lvl1pPr algn="l"><a:spcBef><a:spcPct val="0"/></a:spcBef>'
+    '<a:buNone/><a:defRPr sz="3200" kern="1200"><a:solidFill><a:schemeClr val="tx1"/></a:solidFill>'
+    '<a:latin typeface="+mj-lt"/><a:ea typeface="+mj-ea"/><a:cs typeface="+mj-cs"/></a:defRPr></a:lvl1pPr>'
+    '</p:titleStyle><p:bodyStyle>'
+    + "".join(pptx_text_level_xml(level, size, True) for level, size in ((1, 2000), (2, 1800), (3, 1600),
+                                                                          (4, 1600), (5, 1600)))
+    + '</p:bodyStyle><p:otherStyle>' + pptx_text_level_xml(1, 1800, False)
+    + '</p:otherStyle></p:txStyles></p:sldMaster>')
+
+PPTX_MASTER_RELS_XML = PPTX_RELS_XML.format(relationships="".join(
+    f'<Relationship Id="rId{number}" Type="{PPTX_RELATIONSHIP_TYPES["slideLayout"]}" '
+    f'Target="../slideLayouts/slideLayout{number}.xml"/>' for number in (1, 2, 3))
+    + f'<Relationship Id="rId4" Type="{PPTX_RELATIONSHIP_TYPES["theme"]}" Target="../theme/theme1.xml"/>')
+
+PPTX_LAYOUT_RELS_XML = PPTX_RELS_XML.format(
+    relationships=f'<Relationship Id="rId1" Type="{PPTX_RELATIONSHIP_TYPES["slideMaster"]}" '
+                  f'Target="../slideMasters/slideMaster1.xml"/>')
+
+
+def pptx_layout_xml(layout_type, name, placeholders):
+    return (PPTX_XML_HEADER + f'<p:sldLayout {PPTX_NAMESPACES} type="{layout_type}" preserve="1">'
+            f'<p:cSld name="{name}">{PPTX_SHAPE_TREE_START}{"".join(placeholders)}</p:spTree></p:cSld>'
+            f'<p:clrMapOvr><a:masterClrMapping/></p:clrMapOvr></p:sldLayout>')
+
+
+# Title slide, title and content, section header: the same three layouts pandoc uses for these slides
+PPTX_LAYOUTS = (
+    pptx_layout_xml("title", "Title Slide", (
+        pptx_placeholder_xml(2, "Title 1", '<p:ph type="ctrTitle"/>', (685800, 1597819, 7772400, 1102519),
+                             ' anchor="b"'),
+        pptx_placeholder_xml(3, "Subtitle 2", '<p:ph type="subTitle" idx="1"/>',
+                             (1371600, 2914650, 6400800, 1314450)))),
+    pptx_layout_xml("obj", "Title and Content", (
+        pptx_placeholder_xml(2, "Title 1", '<p:ph type="title"/>', NATIVE_TITLE_FRAME, ' anchor="ctr"'),
+        pptx_placeholder_xml(3, "Content Placeholder 2", '<p:ph idx="1"/>', NATIVE_CONTENT_FRAME))),
+    pptx_layout_xml("secHead", "Section Header", (
+        pptx_placeholder_xml(2, "Title 1", '<p:ph type="title"/>', (722313, 1652588, 7772400, 1021556),
+                             ' anchor="ctr"'),)),
+)
+
+PPTX_THEME_XML = (
+    PPTX_XML_HEADER + '<a:theme xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" name="{name}">'
+    '<a:themeElements><a:clrScheme name="{name}"><a:dk1><a:srgbClr val="{text}"/></a:dk1>'
+    '<a:lt1><a:srgbClr val="{background}"/></a:lt1><a:dk2><a:srgbClr val="{text}"/></a:dk2>'
+    '<a:lt2><a:srgbClr val="{background}"/></a:lt2><a:accent1><a:srgbClr val="{accent}"/></a:accent1>'
+    '<a:accent2><a:srgbClr val="ED7D31"/></a:accent2><a:accent3><a:srgbClr val="A5A5A5"/></a:accent3>'
+    '<a:accent4><a:srgbClr val="FFC000"/></a:accent4><a:accent5><a:srgbClr val="5B9BD5"/></a:accent5>'
+    '<a:accent6><a:srgbClr val="70AD47"/></a:accent6><a:hlink><a:srgbClr val="{accent}"/></a:hlink>'
+    '<a:folHlink><a:srgbClr val="954F72"/></a:folHlink></a:clrScheme><a:fontScheme name="{name}">'
+    '<a:majorFont><a:latin typeface="{heading_font}"/><a:ea typeface=""/><a:cs typeface=""/></a:majorFont>'
+    '<a:minorFont><a:latin typeface="{body_font}"/><a:ea typeface=""/><a:cs typeface=""/></a:minorFont>'
+    '</a:fontScheme><a:fmtScheme name="{name}"><a:fillStyleLst>'
+    + '<a:solidFill><a:schemeClr val="phClr"/></a:solidFill>' * 3
+    + '</a:fillStyleLst><a:lnStyleLst>'
+    + "".join(f'<a:ln w="{width}"><a:solidFill><a:schemeClr val="phClr"/></a:solidFill></a:ln>'
+              for width in (6350, 12700, 19050))
+    + '</a:lnStyleLst><a:effectStyleLst>' + '<a:effectStyle><a:effectLst/></a:effectStyle>' * 3
+    + '</a:effectStyleLst><a:bgFillStyleLst>' + '<a:solidFill><a:schemeClr val="phClr"/></a:solidFill>' * 3
+    + '</a:bgFillStyleLst></a:fmtScheme></a:themeElements><a:objectDefaults/><a:extraClrSchemeLst/></a:theme>')
+
+
+class ConversionError(Exception):
+    pass
+
+
+class ConversionCancelled(ConversionError):
+    # Raised when the user cancels a running conversion
+    pass
+
+
+def get_deadline(timeout):
+    return None if timeout is None else time.perf_counter() + timeout
+
+
+def split_markdown_slides(markdown_text, slide_level):
+    # Split a deck into (front matter, [slide units]). A unit starts at every heading of level <= slide_level,
+    # which is where pandoc starts a new slide (or section title slide) anyway.
+    # Returns None if the deck can't be split safely.
+    if CROSS_SLIDE_REFERENCE_RE.search(markdown_text):
+        return None
+
+    lines = markdown_text.splitlines(keepends=True)
+
+    # YAML metadata block at the top
+    front_matter = ""
+    start = 0
+    if lines and lines[0].strip() == "---":
+        for index in range(1, len(lines)):
+            if lines[index].strip() in ("---", "..."):
+                front_matter = "".join(lines[:index + 1])
+                start = index + 1
+                break
+
+    units = []
+    current = []
+    fence = None
+    previous_blank = True
+    for line in lines[start:]:
+        if fence is not None:
+            # Inside a code block a "#" line is just code
+            if line.strip().startswith(fence):
+                fence = None
+        else:
+            fence_match = CODE_FENCE_RE.match(line)
+            heading_match = ATX_HEADING_RE.match(line)
+            if fence_match:
+                fence = fence_match.group(1)
+            elif (heading_match and previous_blank and len(heading_match.group(1)) <= slide_level
+                  and "".join(current).strip()):
+                units.append("".join(current))
+                current = []
+
+        current.append(line)
+        previous_blank = not line.strip()
+
+    if "".join(current).strip():
+        units.append("".join(current))
+    return front_matter, units
+
+
+class SlideCacheBuilder:
+    # Rebuilds big decks slide by slide. Each slide's Markdown is parsed to pandoc's JSON AST once and cached by
+    # content hash (and pandoc version); the slides missing from the cache are parsed together in one pandoc run.
+    # The deck is then reassembled from the ASTs and written out in a single pandoc run. Editing one slide
+    # re-parses just that slide, but that final write still covers the whole deck.
+    def __init__(self, cache_dir=SLIDE_CACHE_DIR, max_entries=SLIDE_CACHE_MAX_ENTRIES, workers=None):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.workers = workers or os.cpu_count() or 1
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._pandoc_version = None
+
+    def pandoc_version(self):
+        # Part of every cache key, so a pandoc upgrade (which can change the AST) never reuses old slides
+        with self._lock:
+            if self._pandoc_version is None:
+                output = run_pandoc([PANDOC_PATH, "--version"]).decode("utf-8", errors="replace")
+                self._pandoc_version = output.strip().split("\n")[0]
+            return self._pandoc_version
+
+    def cache_path(self, markdown_text):
+        key = hashlib.sha256(f"{self.pandoc_version()}\0{markdown_text}".encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key + ".json")
+
+    @staticmethod
+    def load_cached(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                ast = json.load(file)
+        except (OSError, ValueError):
+            return None
+        # Touch it so pruning keeps recently used slides
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return ast
+
+    def parse_unit(self, markdown_text, cancel_event=None, deadline=None):
+        # Returns (ast, reused)
+        path = self.cache_path(markdown_text)
+        ast = self.load_cached(path)
+        if ast is not None:
+            return ast, True
+
+        if cancel_event is not None and cancel_event.is_set():
+            raise ConversionCancelled("Conversion cancelled")
+        ast_json = run_pandoc([PANDOC_PATH, "-f", SLIDE_READER, "-t", "json"], markdown_text,
+                              cancel_event=cancel_event, deadline=deadline)
+
+        # Write then rename so a half-written entry is never read back
+        write_file_atomic(path, ast_json)
+        return json.loads(ast_json), False
+
+    def parse_batch(self, units, cancel_event=None, deadline=None):
+        # Parses several slides in one pandoc run and caches each one: returns their ASTs in order, or None if
+        # the output can't be split back into slides (then they have to be parsed one by one).
+        # Every slide is followed by a raw block in a format of our own, numbered, and the blocks are split there.
+        if cancel_event is not None and cancel_event.is_set():
+            raise ConversionCancelled("Conversion cancelled")
+        text = "".join(f"{unit.rstrip(chr(10))}\n\n```{{={SLIDE_MARKER_FORMAT}}}\n{index}\n```\n\n"
+                       for index, unit in enumerate(units))
+        document = json.loads(run_pandoc([PANDOC_PATH, "-f", SLIDE_READER, "-t", "json"], text,
+                                         cancel_event=cancel_event, deadline=deadline))
+
+        asts = []
+        blocks = []
+        for block in document["blocks"]:
+            if block.get("t") == "RawBlock" and block["c"][0] == SLIDE_MARKER_FORMAT:
+                if block["c"][1].strip() != str(len(asts)):
+                    return None
+                asts.append({"pandoc-api-version": document["pandoc-api-version"], "meta": {}, "blocks": blocks})
+                blocks = []
+            else:
+                blocks.append(block)
+        if len(asts) != len(units) or blocks:
+            # A slide swallowed a marker, e.g. an unclosed code fence
+            return None
+
+        for unit, ast in zip(units, asts):
+            write_file_atomic(self.cache_path(unit), json.dumps(ast).encode("utf-8"))
+        return asts
+
+    def build_document(self, markdown_text, slide_level, on_progress=None, cancel_event=None, deadline=None):
+        # Returns (pandoc JSON document, stats) or None if the deck has to be converted whole.
+        # on_progress("slides", done, total) is called as each slide is parsed or found in the cache.
+        split = split_markdown_slides(markdown_text, slide_level)
+        if split is None:
+            return None
+        front_matter, units = split
+
+        parsed = [None] * len(units)
+        missing = []
+        for index, unit in enumerate(units):
+            ast = self.load_cached(self.cache_path(unit))
+            if ast is None:
+                missing.append(index)
+            else:
+                parsed[index] = (ast, True)
+        if on_progress:
+            on_progress("slides", len(units) - len(missing), len(units))
+
+        # One pandoc run for every slide that isn't cached, or one run per slide if the batch can't be split
+        asts = self.parse_batch([units[index] for index in missing], cancel_event, deadline) if missing else []
+        if asts is not None:
+            for index, ast in zip(missing, asts):
+                parsed[index] = (ast, False)
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(self.parse_unit, units[index], cancel_event, deadline): index
+                           for index in missing}
+                for future in as_completed(futures):
+                    parsed[futures[future]] = future.result()
+        if on_progress:
+            on_progress("slides", len(units), len(units))
+        meta_ast = self.parse_unit(front_matter, cancel_event, deadline)[0] if front_matter else None
+
+        blocks = []
+        for ast, _ in parsed:
+            blocks.extend(ast["blocks"])
+
+        first = meta_ast or (parsed[0][0] if parsed else self.parse_unit("", cancel_event, deadline)[0])
+        document = {
+            "pandoc-api-version": first["pandoc-api-version"],
+            "meta": meta_ast["meta"] if meta_ast else {},
+            "blocks": blocks,
+        }
+        reused = sum(1 for _, was_cached in parsed if was_cached)
+        return document, {"slides": len(units), "reused": reused, "parsed": len(units) - reused}
+
+    def convert_file(self, input_path, output_path, theme="default", slide_level=2, incremental=False,
+                     on_progress=None, cancel_event=None, timeout=None):
+        with open(input_path, 'r', encoding='utf-8') as file:
+            markdown_text = file.read()
+        # Images are still resolved relative to the source file
+        return self.convert_text(markdown_text, output_path, theme, slide_level, incremental,
+                                 resource_path=os.path.dirname(os.path.abspath(input_path)),
+                                 on_progress=on_progress, cancel_event=cancel_event, timeout=timeout)
+
+    def convert_text(self, markdown_text, output_path, theme="default", slide_level=2, incremental=False,
+                     resource_path=None, on_progress=None, cancel_event=None, timeout=None):
+        data, stats = self.render_text(markdown_text, theme, slide_level, incremental, resource_path, on_progress,
+                                       cancel_event, timeout)
+        write_file_atomic(output_path, data)
+        return stats
+
+    def render_text(self, markdown_text, theme="default", slide_level=2, incremental=False, resource_path=None,
+                    on_progress=None, cancel_event=None, timeout=None):
+        # Returns (PPTX bytes, stats). timeout covers the whole conversion, slide parsing included.
+        started = time.perf_counter()
+        deadline = get_deadline(timeout)
+        # Slides are cached with their diagrams and images already pointing at the processed copies
+        markdown_text = prepare_deck_assets(markdown_text, resource_path, on_progress, cancel_event, deadline)
+        built = self.build_document(markdown_text, slide_level, on_progress, cancel_event, deadline)
+        if built is None:
+            data = convert_markdown_to_bytes(markdown_text, theme, slide_level, incremental, resource_path,
+                                             on_progress=on_progress, cancel_event=cancel_event,
+                                             timeout=None if deadline is None else deadline - time.perf_counter(),
+                                             native=False)
+            return data, {"slides": None, "reused": 0, "parsed": None}
+        document, stats = built
+
+        # Write the reassembled deck
+        cmd = build_pandoc_command("-", "-", theme, slide_level, incremental)
+        cmd[1:2] = ["-f", "json"]
+        if resource_path:
+            cmd.extend(["--resource-path", resource_path])
+        if on_progress:
+            on_progress("pandoc", 0, 1)
+        data = run_pandoc(cmd, json.dumps(document), cancel_event=cancel_event, deadline=deadline)
+        log_conversion(f"{stats['slides']} slides ({stats['parsed']} parsed)", len(markdown_text.encode("utf-8")),
+                       len(data), started)
+
+        self.prune()
+        return data, stats
+
+    def prune(self):
+        # Drop the least recently used slides once the cache holds more than max_entries
+        try:
+            entries = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                       if name.endswith(".json")]
+        except OSError:
+            return
+        if len(entries) <= self.max_entries:
+            return
+
+        entries.sort(key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0)
+        for path in entries[:len(entries) - self.max_entries]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+_slide_builder = None
+_slide_builder_lock = threading.Lock()
+
+
+def get_slide_builder():
+    # One shared builder (and cache) per process
+    global _slide_builder
+    with _slide_builder_lock:
+        if _slide_builder is None:
+            _slide_builder = SlideCacheBuilder()
+        return _slide_builder
+
+
+def wait_for_futures(futures, on_done, cancel_event=None, deadline=None):
+    # Wait for every future, calling on_done(future) as each one finishes. Cancelling or running past the
+    # deadline stops the wait and drops whatever hasn't started yet.
+    not_done = set(futures)
+    try:
+        while not_done:
+            if cancel_event is not None and cancel_event.is_set():
+                raise ConversionCancelled("Conversion cancelled")
+            if deadline is not None and time.perf_counter() > deadline:
+                raise ConversionError("Conversion timed out and was stopped")
+            done, not_done = wait(not_done, timeout=CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            for future in done:
+                on_done(future)
+    finally:
+        for future in not_done:
+            future.cancel()
+
+
+def prose_line_indexes(lines):
+    # Indexes of the lines that aren't inside fenced code blocks
+    indexes = []
+    fence = None
+    for index, line in enumerate(lines):
+        if fence is not None:
+            if line.strip().startswith(fence):
+                fence = None
+            continue
+        fence_match = CODE_FENCE_RE.match(line)
+        if fence_match:
+            fence = fence_match.group(1)
+            continue
+        indexes.append(index)
+    return indexes
+
+
+def process_image_asset(source_path, target_base, max_size, jpeg_quality):
+    # Runs in a worker process: shrink one image to fit max_size pixels and recompress it.
+    # Writes target_base + extension and returns that path. Images that can't get any smaller (or that PIL
+    # shouldn't touch, like animations and vector formats) are copied over unchanged.
+    with open(source_path, 'rb') as file:
+        original = file.read()
+    extension = os.path.splitext(source_path)[1].lower() or ".img"
+    data = original
+
+    try:
+        with Image.open(io.BytesIO(original)) as image:
+            if image.format in ("JPEG", "PNG", "BMP", "TIFF") and not getattr(image, "is_animated", False):
+                image_format = image.format
+                image = ImageOps.exif_transpose(image)
+                resized = image.width > max_size[0] or image.height > max_size[1]
+                if resized:
+                    image.thumbnail(max_size, Image.LANCZOS)
+
+                buffer = io.BytesIO()
+                has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+                if image_format == "JPEG" or (image_format in ("BMP", "TIFF") and not has_alpha):
+                    image.convert("RGB").save(buffer, "JPEG", quality=jpeg_quality, optimize=True)
+                    processed_extension = ".jpg"
+                else:
+                    image.save(buffer, "PNG", optimize=True)
+                    processed_extension = ".png"
+
+                if resized or buffer.tell() < len(original):
+                    data = buffer.getvalue()
+                    extension = processed_extension
+    except (OSError, ValueError, Image.DecompressionBombError):
+        # Not an image PIL can read, pandoc gets the original
+        pass
+
+    target_path = target_base + extension
+    write_file_atomic(target_path, data)
+    return target_path
+
+
+class ImageAssetPipeline:
+    # Prepares the images a deck references before pandoc embeds them. Each image is downscaled to what a
+    # 16:9 slide can show at the target DPI and recompressed, once per distinct content: the same logo on
+    # fifty slides (or under three file names) is processed once and embedded from a single cached file.
+    # Processed images are kept in cache_dir between runs and made in parallel worker processes.
+    def __init__(self, cache_dir=IMAGE_CACHE_DIR, dpi=IMAGE_TARGET_DPI, jpeg_quality=IMAGE_JPEG_QUALITY,
+                 workers=IMAGE_WORKERS, max_entries=IMAGE_CACHE_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_size = (round(SLIDE_WIDTH_INCHES * dpi), round(SLIDE_HEIGHT_INCHES * dpi))
+        self.jpeg_quality = jpeg_quality
+        self.workers = workers
+        self.max_entries = max_entries
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._executor = None
+        # (path, mtime, size) -> content hash, so unchanged images aren't re-read on every conversion
+        self._hashes = {}
+
+    @staticmethod
+    def resolve(target, search_dirs):
+        # Image reference -> absolute path of an existing file, or None (URLs, missing files)
+        target = target.strip("<>")
+        if "://" in target or target.startswith("data:"):
+            return None
+        for candidate in (target, urllib.parse.unquote(target)):
+            if os.path.isabs(candidate):
+                if os.path.isfile(candidate):
+                    return candidate
+                continue
+            for directory in search_dirs:
+                path = os.path.abspath(os.path.join(directory, candidate))
+                if os.path.isfile(path):
+                    return path
+        return None
+
+    def content_hash(self, path):
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if key in self._hashes:
+                return self._hashes[key]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(block)
+        with self._lock:
+            self._hashes[key] = digest.hexdigest()
+        return self._hashes[key]
+
+    def cache_base(self, content_hash):
+        # Settings are part of the name, so changing the DPI or quality makes new files instead of reusing old ones
+        width, height = self.max_size
+        return os.path.join(self.cache_dir, f"{content_hash[:40]}-{width}x{height}-q{self.jpeg_quality}")
+
+    def find_cached(self, base):
+        directory, prefix = os.path.split(base)
+        for name in os.listdir(directory):
+            if name.startswith(prefix + "."):
+                path = os.path.join(directory, name)
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+                return path
+        return None
+
+    def get_executor(self):
+        # Worker processes are started on first use and kept for the next conversion. They're spawned rather
+        # than forked because the GUI and the conversion service have threads running.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def prepare(self, markdown_text, resource_path=None, on_progress=None, cancel_event=None, deadline=None):
+        # Returns markdown_text with every local image reference pointing at its processed copy.
+        # on_progress("images", done, total) is called as images are finished.
+        search_dirs = [directory for directory in (resource_path or "").split(os.pathsep) if directory] + ["."]
+
+        # Collect image references outside code blocks
+        lines = markdown_text.splitlines(keepends=True)
+        prose = prose_line_indexes(lines)
+        references = {}
+        for index in prose:
+            for match in MARKDOWN_IMAGE_RE.finditer(lines[index]):
+                references.setdefault(match.group(2), None)
+        if not references:
+            return markdown_text
+
+        # Resolve and dedupe by content
+        sources = {}
+        for target in references:
+            path = self.resolve(target, search_dirs)
+            if path is not None:
+                content_hash = self.content_hash(path)
+                references[target] = content_hash
+                sources.setdefault(content_hash, path)
+
+        processed = {}
+        pending = {}
+        for content_hash, path in sources.items():
+            base = self.cache_base(content_hash)
+            cached = self.find_cached(base)
+            if cached:
+                processed[content_hash] = cached
+            else:
+                pending[content_hash] = (path, base)
+
+        total = len(sources)
+        if on_progress:
+            on_progress("images", len(processed), total)
+        if len(pending) == 1:
+            # Not worth starting a worker process for
+            content_hash, (path, base) = next(iter(pending.items()))
+            processed[content_hash] = process_image_asset(path, base, self.max_size, self.jpeg_quality)
+            if on_progress:
+                on_progress("images", len(processed), total)
+        elif pending:
+            executor = self.get_executor()
+            futures = {executor.submit(process_image_asset, path, base, self.max_size, self.jpeg_quality):
+                       content_hash for content_hash, (path, base) in pending.items()}
+
+            def on_done(future):
+                processed[futures[future]] = future.result()
+                if on_progress:
+                    on_progress("images", len(processed), total)
+
+            wait_for_futures(futures, on_done, cancel_event, deadline)
+            self.prune()
+
+        logger.info("Prepared %d image references (%d distinct, %d processed)", len(references), total,
+                    len(pending))
+
+        def replace(match):
+            content_hash = references.get(match.group(2))
+            if content_hash is None:
+                return match.group(0)
+            return f"{match.group(1)}<{processed[content_hash]}>"
+
+        for index in prose:
+            lines[index] = MARKDOWN_IMAGE_RE.sub(replace, lines[index])
+        return "".join(lines)
+
+    def prune(self):
+        # Drop the least recently used images once the cache holds more than max_entries
+        try:
+            entries = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                       if not name.startswith(".")]
+        except OSError:
+            return
+        if len(entries) <= self.max_entries:
+            return
+
+        entries.sort(key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0)
+        for path in entries[:len(entries) - self.max_entries]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+_image_pipeline = None
+_image_pipeline_lock = threading.Lock()
+
+
+def get_image_pipeline():
+    # One shared pipeline (and worker pool) per process, or None when Pillow isn't installed or it's switched off
+    global _image_pipeline
+    if Image is None or not IMAGE_ASSETS_ENABLED:
+        return None
+    with _image_pipeline_lock:
+        if _image_pipeline is None:
+            _image_pipeline = ImageAssetPipeline()
+        return _image_pipeline
+
+
+def prepare_image_assets(markdown_text, resource_path=None, on_progress=None, cancel_event=None, deadline=None):
+    pipeline = get_image_pipeline()
+    if pipeline is None:
+        return markdown_text
+    return pipeline.prepare(markdown_text, resource_path, on_progress, cancel_event, deadline)
+
+
+_mermaid_render_module = None
+_mermaid_render_lock = threading.Lock()
+
+
+def load_mermaid_render():
+    # The diagram tool's headless Mermaid module (interview_app/mermaid_render.py): warm render workers, render
+    # cache, validation and percentile(). It needs nothing beyond the standard library, so this works without Tk;
+    # None if it isn't next to this project. Loaded once from its path, since the diagram tool's folder isn't a
+    # package.
+    global _mermaid_render_module
+    with _mermaid_render_lock:
+        if _mermaid_render_module is None:
+            path = os.path.join(DIAGRAM_APP_DIR, "mermaid_render.py")
+            if not os.path.exists(path):
+                return None
+            spec = importlib.util.spec_from_file_location("interview_app_mermaid_render", path)
+            module = importlib.util.module_from_spec(spec)
+            try:
+                spec.loader.exec_module(module)
+            except ImportError as e:
+                logger.info("Diagram app renderer not available (%s), rendering Mermaid with mmdc", e)
+                return None
+            _mermaid_render_module = module
+        return _mermaid_render_module
+
+
+def run_mmdc(mermaid_code, options):
+    # Mermaid CLI, code in on stdin and the image out on stdout
+    cmd = ["mmdc", "-q", "-i", "-", "-o", "-", "-e", options["format"], "-t", options["theme"],
+           "-b", options["background"], "-w", str(options["width"]), "-H", str(options["height"])]
+    try:
+        result = subprocess.run(cmd, input=mermaid_code.encode("utf-8"), capture_output=True, check=True,
+                                timeout=MERMAID_RENDER_TIMEOUT)
+    except FileNotFoundError:
+        raise ConversionError("Mermaid CLI (mmdc) not found. Install it with: npm install -g @mermaid-js/mermaid-cli")
+    except subprocess.TimeoutExpired:
+        raise ConversionError(f"Mermaid CLI took longer than {MERMAID_RENDER_TIMEOUT:g}s")
+    except subprocess.CalledProcessError as e:
+        raise ConversionError(f"Mermaid CLI error: {e.stderr.decode('utf-8', errors='replace')}")
+    return result.stdout
+
+
+def find_mermaid_blocks(lines):
+    # [(first line, closing fence line, code)] for every ```mermaid block, skipping ones nested in other fences.
+    # A fence indented inside a list item has that indentation taken off its code, like Markdown does.
+    blocks = []
+    fence = None
+    start = None
+    indent = 0
+    for index, line in enumerate(lines):
+        if fence is not None:
+            if line.strip().startswith(fence):
+                if start is not None:
+                    code = "".join(body[min(indent, len(body) - len(body.lstrip(" "))):]
+                                   for body in lines[start + 1:index])
+                    blocks.append((start, index, code))
+                fence = None
+            continue
+        indent = len(line) - len(line.lstrip(" "))
+        fence_match = CODE_FENCE_RE.match(line[indent:])
+        if fence_match:
+            fence = fence_match.group(1)
+            start = index if MERMAID_FENCE_RE.match(line) else None
+    return blocks
+
+
+class MermaidBlockRenderer:
+    # Swaps ```mermaid blocks for rendered images before pandoc runs. All the diagrams in a deck render at
+    # once on a bounded pool, so a deck builds in about the time of its slowest diagram; each image is cached
+    # by a hash of its source, so unchanged diagrams are never rendered twice. The cache is capped at max_bytes,
+    # least recently used first.
+    # Rendering goes through the diagram app's renderer when it can be loaded, otherwise straight to mmdc.
+    def __init__(self, cache_dir=MERMAID_CACHE_DIR, workers=MERMAID_RENDER_WORKERS, options=None,
+                 max_bytes=MERMAID_CACHE_MAX_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.max_bytes = max_bytes
+        self.options = dict(options or MERMAID_RENDER_OPTIONS)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._mermaid_render = None
+        self._render_pool = None
+        self._render_cache = None
+        self._mermaid_render_checked = False
+
+    def get_mermaid_render(self):
+        # The diagram app's render pool (one warm browser per render slot) and render cache, set up on the first
+        # diagram. None if the diagram app's renderer isn't available.
+        with self._lock:
+            if not self._mermaid_render_checked:
+                self._mermaid_render_checked = True
+                mermaid_render = load_mermaid_render()
+                if mermaid_render is not None:
+                    self._render_cache = mermaid_render.MermaidRenderCache(
+                        mermaid_render.RENDER_CACHE_DIR, mermaid_render.RENDER_CACHE_MAX_MB * 1024 * 1024)
+                    self._render_pool = mermaid_render.MermaidRenderPool(
+                        self.workers, mermaid_render.RENDER_WORKER_MAX_RENDERS)
+                    # Browsers start in the background; until they are ready diagrams go through mmdc
+                    pool_thread = threading.Thread(target=self._render_pool.start)
+                    pool_thread.daemon = True
+                    pool_thread.start()
+                    self._mermaid_render = mermaid_render
+            return self._mermaid_render
+
+    def cache_path(self, mermaid_code):
+        payload = json.dumps({"code": mermaid_code, "options": self.options}, sort_keys=True)
+        key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.{self.options['format']}")
+
+    def render(self, mermaid_code, path):
+        mermaid_render = self.get_mermaid_render()
+        if mermaid_render is not None:
+            data = self.render_with_pool(mermaid_render, mermaid_code)
+        else:
+            data = run_mmdc(mermaid_code, self.options)
+        write_file_atomic(path, data)
+        return path
+
+    def render_with_pool(self, mermaid_render, mermaid_code):
+        # Shared render cache first (diagrams made in the diagram app count too), then a syntax check, then a warm
+        # worker, then mmdc if the pool isn't up or can't take the job
+        extension = self.options["format"]
+        cache_key = self._render_cache.make_key(mermaid_code, self.options)
+        data = self._render_cache.get(cache_key, extension)
+        if data is not None:
+            return data
+
+        error = mermaid_render.validate_mermaid(mermaid_code)
+        if error is not None:
+            raise ConversionError(f"Invalid Mermaid: {error}")
+
+        data = None
+        if self._render_pool.ready:
+            try:
+                data = self._render_pool.render(mermaid_code, self.options)
+            except mermaid_render.MermaidRenderError as e:
+                raise ConversionError(f"Mermaid render error: {e}")
+            except mermaid_render.RenderPoolUnavailable:
+                pass
+        if data is None:
+            data = run_mmdc(mermaid_code, self.options)
+        self._render_cache.put(cache_key, extension, data)
+        return data
+
+    def replace_blocks(self, markdown_text, on_progress=None, cancel_event=None, deadline=None):
+        # Returns markdown_text with each mermaid block replaced by its image. A diagram that fails to render
+        # stays a code block (and is logged), the rest of the deck still converts.
+        # on_progress("diagrams", done, total) is called as diagrams are finished.
+        lines = markdown_text.splitlines(keepends=True)
+        blocks = find_mermaid_blocks(lines)
+        if not blocks:
+            return markdown_text
+
+        paths = {}
+        for _, _, mermaid_code in blocks:
+            paths.setdefault(mermaid_code, self.cache_path(mermaid_code))
+        rendered = {}
+        for code, path in paths.items():
+            try:
+                # Touch it so pruning keeps diagrams that are still in use
+                os.utime(path)
+                rendered[code] = path
+            except OSError:
+                pass
+        pending = {code: path for code, path in paths.items() if code not in rendered}
+
+        total = len(paths)
+        if on_progress:
+            on_progress("diagrams", len(rendered), total)
+        futures = {self._executor.submit(self.render, code, path): code for code, path in pending.items()}
+        failed = 0
+
+        def on_done(future):
+            nonlocal failed
+            try:
+                rendered[futures[future]] = future.result()
+            except Exception as e:
+                failed += 1
+                logger.warning("Mermaid diagram failed to render, leaving it as code: %s", e)
+            if on_progress:
+                on_progress("diagrams", len(rendered) + failed, total)
+
+        wait_for_futures(futures, on_done, cancel_event, deadline)
+        if pending:
+            self.prune()
+        logger.info("Prepared %d Mermaid blocks (%d distinct, %d rendered, %d failed)", len(blocks), total,
+                    len(pending) - failed, failed)
+
+        # Replace from the bottom up so earlier line numbers stay valid. The image keeps the fence's indentation,
+        # so a diagram inside a list item stays in that item.
+        for start, end, mermaid_code in reversed(blocks):
+            if mermaid_code in rendered:
+                indent = lines[start][:len(lines[start]) - len(lines[start].lstrip(" "))]
+                lines[start:end + 1] = [f"\n{indent}![](<{rendered[mermaid_code]}>)\n\n"]
+        return "".join(lines)
+
+    def prune(self):
+        # Drop the least recently used diagrams once the cache holds more than max_bytes; the ones this deck uses
+        # were just touched, so they go last
+        entries = []
+        try:
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_file() and not entry.name.startswith("."):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            total -= size
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._render_pool is not None:
+            self._render_pool.close()
+
+
+_mermaid_renderer = None
+_mermaid_renderer_lock = threading.Lock()
+
+
+def get_mermaid_renderer():
+    # One shared renderer (and render pool) per process, or None when it's switched off
+    global _mermaid_renderer
+    if not MERMAID_ENABLED:
+        return None
+    with _mermaid_renderer_lock:
+        if _mermaid_renderer is None:
+            _mermaid_renderer = MermaidBlockRenderer()
+        return _mermaid_renderer
+
+
+def close_asset_workers():
+    # Stop the diagram render workers and image processes, if any were started
+    for workers in (_mermaid_renderer, _image_pipeline):
+        if workers is not None:
+            workers.close()
+
+
+def needs_deck_assets(markdown_text):
+    # Whether prepare_deck_assets has anything to do for this deck
+    return bool((MERMAID_ENABLED and MERMAID_FENCE_RE.search(markdown_text))
+                or (get_image_pipeline() is not None and MARKDOWN_IMAGE_RE.search(markdown_text)))
+
+
+def prepare_deck_assets(markdown_text, resource_path=None, on_progress=None, cancel_event=None, deadline=None):
+    # Everything that happens to a deck before pandoc sees it: diagrams are rendered, then every image
+    # (diagrams included) goes through the image pipeline
+    renderer = get_mermaid_renderer()
+    if renderer is not None:
+        markdown_text = renderer.replace_blocks(markdown_text, on_progress, cancel_event, deadline)
+    return prepare_image_assets(markdown_text, resource_path, on_progress, cancel_event, deadline)
+
+
+class NativeUnsupported(Exception):
+    # Raised by the native writer for Markdown it can't render the way pandoc would, callers fall back to pandoc
+    pass
+
+
+def smarten(text):
+    # pandoc's "smart" extension: dashes, ellipses and curly quotes
+    text = html.unescape(text).replace("---", "\u2014").replace("--", "\u2013").replace("...", "\u2026")
+    text = SMART_OPEN_DOUBLE_RE.sub("\\1\u201c", text).replace('"', "\u201d")
+    text = SMART_OPEN_SINGLE_RE.sub("\\1\u2018", text).replace("'", "\u2019")
+    return text
+
+
+def find_closing_delimiter(text, start, delimiter):
+    # Index of the delimiter run that closes an emphasis opened just before start, or -1
+    char = delimiter[0]
+    index = start
+    while index < len(text):
+        if text[index] == "\\":
+            index += 2
+            continue
+        if text[index] == "`":
+            # Code spans can't contain emphasis markers
+            end = text.find("`", index + 1)
+            index = end + 1 if end != -1 else len(text)
+            continue
+        if text[index] == char:
+            run = len(text) - index - len(text[index:].lstrip(char))
+            if (run == len(delimiter) and not text[index - 1].isspace()
+                    and not (char == "_" and text[index + run:index + run + 1].isalnum())):
+                return index
+            index += run
+            continue
+        index += 1
+    return -1
+
+
+def parse_inline(text, style=None):
+    # Markdown inline syntax -> list of (text, style) runs. style keys: b, i, strike, code, link.
+    style = style or {}
+    runs = []
+    buffer = []
+
+    def flush():
+        if buffer:
+            if NATIVE_UNSUPPORTED_INLINE_RE.search("".join(buffer)):
+                raise NativeUnsupported("math, citations or other inline extensions")
+            runs.append((smarten("".join(buffer)), style))
+            buffer.clear()
+
+    index = 0
+    while index < len(text):
+        char = text[index]
+        if char == "\\" and index + 1 < len(text):
+            if text[index + 1] in string.punctuation:
+                buffer.append(text[index + 1])
+                index += 2
+                continue
+            if RAW_TEX_RE.match(text, index):
+                raise NativeUnsupported("raw TeX")
+
+        if char == "`":
+            match = INLINE_CODE_RE.match(text, index)
+            if match:
+                flush()
+                runs.append((match.group(2).strip(), dict(style, code=True)))
+                index = match.end()
+                continue
+
+        if char == "[":
+            match = INLINE_LINK_RE.match(text, index)
+            if match:
+                flush()
+                runs.extend(parse_inline(match.group(1), dict(style, link=match.group(2))))
+                index = match.end()
+                continue
+
+        if char == "<":
+            match = AUTOLINK_RE.match(text, index)
+            if not match:
+                raise NativeUnsupported("raw HTML")
+            flush()
+            runs.append((match.group(1), dict(style, link=match.group(1))))
+            index = match.end()
+            continue
+
+        if char in "*_~":
+            run = len(text) - index - len(text[index:].lstrip(char))
+            delimiter = text[index:index + min(run, 3)]
+            opens = (index + len(delimiter) < len(text) and not text[index + len(delimiter)].isspace()
+                     and not (char == "_" and index > 0 and text[index - 1].isalnum()))
+            if char == "~" and delimiter != "~~":
+                opens = False
+            closing = find_closing_delimiter(text, index + len(delimiter), delimiter) if opens else -1
+            if closing != -1:
+                flush()
+                inner_style = dict(style)
+                if char == "~":
+                    inner_style["strike"] = True
+                else:
+                    inner_style["b"] = inner_style.get("b") or len(delimiter) >= 2
+                    inner_style["i"] = inner_style.get("i") or len(delimiter) != 2
+                runs.extend(parse_inline(text[index + len(delimiter):closing], inner_style))
+                index = closing + len(delimiter)
+                continue
+            buffer.append(text[index:index + run])
+            index += run
+            continue
+
+        buffer.append(char)
+        index += 1
+
+    flush()
+    return runs
+
+
+def parse_front_matter(lines):
+    # Only flat "key: value" YAML, anything fancier goes to pandoc
+    metadata = {}
+    for line in lines:
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        match = FRONT_MATTER_LINE_RE.match(line)
+        if not match or match.group(2) in ("|", ">", ""):
+            raise NativeUnsupported("complex metadata")
+        value = match.group(2).strip()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+            value = value[1:-1]
+        metadata[match.group(1)] = value
+    return metadata
+
+
+def iter_markdown_blocks(lines):
+    # Streaming block parser for the subset the native writer supports. Yields
+    #   ("heading", level, text), ("paragraph", text), ("list_item", depth, number or None, text),
+    #   ("list_paragraph", depth, text), ("quote", text), ("code", [lines]), ("table", aligns, header, rows),
+    #   ("rule",)
+    # and raises NativeUnsupported as soon as it meets anything else (or anything ambiguous).
+    index = 0
+    count = len(lines)
+    list_indents = []
+
+    def is_block_start(line):
+        return bool(ATX_HEADING_RE.match(line) or CODE_FENCE_RE.match(line) or BLOCKQUOTE_RE.match(line)
+                    or LIST_ITEM_RE.match(line) or THEMATIC_BREAK_RE.match(line))
+
+    while index < count:
+        line = lines[index]
+        stripped = line.strip()
+
+        if not stripped:
+            index += 1
+            continue
+
+        if line.startswith(("    ", "\t")) and not list_indents:
+            # Indented code block
+            code = []
+            while index < count and (lines[index].startswith(("    ", "\t")) or not lines[index].strip()):
+                code.append(lines[index][4:] if lines[index].startswith("    ") else lines[index][1:])
+                index += 1
+            while code and not code[-1].strip():
+                code.pop()
+            yield ("code", code)
+            continue
+
+        fence = CODE_FENCE_RE.match(line)
+        if fence:
+            marker = fence.group(1)
+            code = []
+            index += 1
+            while index < count and not (lines[index].strip().startswith(marker[0] * len(marker))
+                                         and not lines[index].strip().strip(marker[0])):
+                code.append(lines[index])
+                index += 1
+            index += 1
+            list_indents = []
+            yield ("code", code)
+            continue
+
+        heading = ATX_HEADING_RE.match(line)
+        if heading:
+            text = line.strip().lstrip("#").strip()
+            text = re.sub(r"\s+#+$", "", text) if text.strip("#") else ""
+            list_indents = []
+            index += 1
+            yield ("heading", len(heading.group(1)), text)
+            continue
+
+        if THEMATIC_BREAK_RE.match(line):
+            list_indents = []
+            index += 1
+            yield ("rule",)
+            continue
+
+        if BLOCKQUOTE_RE.match(line):
+            quoted = []
+            while index < count and lines[index].strip():
+                quoted.append(BLOCKQUOTE_RE.sub("", lines[index], count=1))
+                index += 1
+            if any(is_block_start(quoted_line) or BLOCKQUOTE_RE.match(quoted_line) for quoted_line in quoted):
+                raise NativeUnsupported("block elements inside a blockquote")
+            list_indents = []
+            yield ("quote", join_paragraph_lines(quoted))
+            continue
+
+        item = LIST_ITEM_RE.match(line)
+        if item:
+            indent = len(item.group(1).expandtabs(4))
+            while list_indents and indent < list_indents[-1]:
+                list_indents.pop()
+            if not list_indents or indent > list_indents[-1]:
+                if list_indents and indent < list_indents[-1] + 2:
+                    raise NativeUnsupported("ambiguous list nesting")
+                list_indents.append(indent)
+            depth = len(list_indents) - 1
+            marker = item.group(2)
+            number = int(marker[:-1]) if marker[0].isdigit() else None
+
+            # The item's own lines: everything up to a blank line or the next item
+            text = [item.group(4)]
+            index += 1
+            while index < count and lines[index].strip() and not LIST_ITEM_RE.match(lines[index]):
+                if is_block_start(lines[index].lstrip()):
+                    raise NativeUnsupported("block element inside a list item")
+                text.append(lines[index])
+                index += 1
+            yield ("list_item", depth, number, join_paragraph_lines(text))
+
+            # Indented paragraphs after a blank line still belong to the item
+            while index < count:
+                next_index = index
+                while next_index < count and not lines[next_index].strip():
+                    next_index += 1
+                if next_index >= count:
+                    index = next_index
+                    break
+                following = lines[next_index]
+                following_indent = len(following) - len(following.lstrip())
+                if LIST_ITEM_RE.match(following) or following_indent <= indent:
+                    break
+                if is_block_start(following.lstrip()) or following_indent >= indent + 8:
+                    raise NativeUnsupported("block element inside a list item")
+                paragraph = []
+                index = next_index
+                while index < count and lines[index].strip() and not LIST_ITEM_RE.match(lines[index]):
+                    paragraph.append(lines[index])
+                    index += 1
+                yield ("list_paragraph", depth, join_paragraph_lines(paragraph))
+            continue
+
+        list_indents = []
+
+        if "|" in line and index + 1 < count and TABLE_SEPARATOR_RE.match(lines[index + 1]):
+            separator = split_table_row(lines[index + 1])
+            aligns = []
+            for cell in separator:
+                cell = cell.strip()
+                if cell.startswith(":") and cell.endswith(":"):
+                    aligns.append("ctr")
+                elif cell.endswith(":"):
+                    aligns.append("r")
+                else:
+                    aligns.append("l")
+            header = split_table_row(line)
+            rows = []
+            index += 2
+            while index < count and lines[index].strip() and "|" in lines[index]:
+                rows.append(split_table_row(lines[index]))
+                index += 1
+            if len(header) != len(aligns) or any(len(row) > len(aligns) for row in rows):
+                raise NativeUnsupported("ragged table")
+            rows = [row + [""] * (len(aligns) - len(row)) for row in rows]
+            yield ("table", aligns, header, rows)
+            continue
+
+        if NATIVE_UNSUPPORTED_BLOCK_RE.match(line):
+            raise NativeUnsupported(f"unsupported block: {stripped[:40]}")
+
+        # Plain paragraph. pandoc needs a blank line before headings, lists and quotes, so a line that looks
+        # like one of those in the middle of a paragraph is either continuation text or a setext heading;
+        # not worth guessing.
+        paragraph = [line]
+        index += 1
+        while index < count and lines[index].strip():
+            if is_block_start(lines[index]) or SETEXT_UNDERLINE_RE.match(lines[index]) or (
+                    "|" in lines[index] and index + 1 < count and TABLE_SEPARATOR_RE.match(lines[index + 1])):
+                raise NativeUnsupported("ambiguous paragraph")
+            paragraph.append(lines[index])
+            index += 1
+        yield ("paragraph", join_paragraph_lines(paragraph))
+
+
+def join_paragraph_lines(lines):
+    # Soft line breaks become spaces, two trailing spaces or a trailing backslash make a hard break
+    text = ""
+    for position, line in enumerate(lines):
+        last = position == len(lines) - 1
+        if not last and line.endswith("  "):
+            text += line.strip() + "\n"
+        elif not last and line.rstrip().endswith("\\") and not line.rstrip().endswith("\\\\"):
+            text += line.strip()[:-1] + "\n"
+        else:
+            text += line.strip() + ("" if last else " ")
+    return text
+
+
+def split_table_row(line):
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|") and not line.endswith("\\|"):
+        line = line[:-1]
+    return [cell.strip().replace("\\|", "|") for cell in re.split(r"(?<!\\)\|", line)]
+
+
+def xml_escape(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+
+
+class NativeSlideWriter:
+    # Writes a .pptx straight to a zip: shared parts (master, layouts, theme) up front, each slide the moment
+    # it's complete, and the presentation part, which lists all slides, at the end.
+    def __init__(self, file, theme="default", incremental=False):
+        self.colors = NATIVE_THEMES.get(theme, NATIVE_THEMES["default"])
+        self.theme_name = theme if theme in NATIVE_THEMES else "default"
+        self.incremental = incremental
+        self.zip = zipfile.ZipFile(file, "w", zipfile.ZIP_DEFLATED)
+        self.slide_count = 0
+        self.write_shared_parts()
+
+    def write_shared_parts(self):
+        write = self.zip.writestr
+        write("ppt/theme/theme1.xml", PPTX_THEME_XML.format(name=self.theme_name, **self.colors))
+        write("ppt/slideMasters/slideMaster1.xml", PPTX_MASTER_XML)
+        write("ppt/slideMasters/_rels/slideMaster1.xml.rels", PPTX_MASTER_RELS_XML)
+        for number, layout in enumerate(PPTX_LAYOUTS, 1):
+            write(f"ppt/slideLayouts/slideLayout{number}.xml", layout)
+            write(f"ppt/slideLayouts/_rels/slideLayout{number}.xml.rels", PPTX_LAYOUT_RELS_XML)
+        write("ppt/presProps.xml", PPTX_PRES_PROPS_XML)
+        write("ppt/tableStyles.xml", PPTX_TABLE_STYLES_XML)
+
+    def runs_xml(self, runs, size=None, relationships=None):
+        parts = []
+        for text, style in runs:
+            attributes = ' lang="en-US"'
+            if size or style.get("code"):
+                attributes += f' sz="{size or NATIVE_CODE_SIZE}"'
+            if style.get("b"):
+                attributes += ' b="1"'
+            if style.get("i"):
+                attributes += ' i="1"'
+            if style.get("strike"):
+                attributes += ' strike="sngStrike"'
+            children = '<a:latin typeface="Courier New"/>' if style.get("code") else ""
+            if style.get("link") and relationships is not None:
+                relationships.append(style["link"])
+                children += f'<a:hlinkClick r:id="rId{len(relationships) + 1}"/>'
+            properties = f"<a:rPr{attributes}>{children}</a:rPr>" if children else f"<a:rPr{attributes}/>"
+            for position, piece in enumerate(text.split("\n")):
+                if position:
+                    parts.append("<a:br/>")
+                if piece:
+                    parts.append(f"<a:r>{properties}<a:t>{xml_escape(piece)}</a:t></a:r>")
+        return "".join(parts)
+
+    def paragraph_xml(self, paragraph, relationships):
+        kind = paragraph["kind"]
+        level = paragraph.get("depth", 0)
+        margin = NATIVE_LIST_INDENT * (level + 1)
+        if kind == "bullet":
+            properties = (f'<a:pPr marL="{margin}" lvl="{level}" indent="-{NATIVE_LIST_INDENT}">'
+                          f'<a:buFont typeface="Arial"/><a:buChar char="\u2022"/></a:pPr>')
+        elif kind == "number":
+            start = f' startAt="{paragraph["start"]}"' if paragraph.get("start", 1) != 1 else ""
+            properties = (f'<a:pPr marL="{margin}" lvl="{level}" indent="-{NATIVE_LIST_INDENT}">'
+                          f'<a:buAutoNum type="arabicPeriod"{start}/></a:pPr>')
+        elif kind == "list_paragraph":
+            properties = f'<a:pPr marL="{margin}" lvl="{level}" indent="0"><a:buNone/></a:pPr>'
+        elif kind == "quote":
+            properties = f'<a:pPr marL="{NATIVE_QUOTE_INDENT}" indent="0"><a:buNone/></a:pPr>'
+        else:
+            properties = '<a:pPr marL="0" indent="0"><a:buNone/></a:pPr>'
+
+        runs = paragraph["runs"]
+        if kind == "heading":
+            runs = [(text, dict(style, b=True)) for text, style in runs]
+        elif kind == "quote":
+            runs = [(text, dict(style, i=True)) for text, style in runs]
+        body = self.runs_xml(runs, NATIVE_CODE_SIZE if kind == "code" else None, relationships)
+        return f'<a:p>{properties}{body or PPTX_EMPTY_PARAGRAPH}</a:p>'
+
+    def text_shape_xml(self, shape_id, paragraphs, relationships, frame=None, placeholder=None):
+        if placeholder:
+            non_visual = (f'<p:nvSpPr><p:cNvPr id="{shape_id}" name="Placeholder {shape_id}"/>'
+                          f'<p:cNvSpPr><a:spLocks noGrp="1"/></p:cNvSpPr><p:nvPr>{placeholder}</p:nvPr></p:nvSpPr>')
+        else:
+            non_visual = (f'<p:nvSpPr><p:cNvPr id="{shape_id}" name="TextBox {shape_id}"/>'
+                          f'<p:cNvSpPr txBox="1"/><p:nvPr/></p:nvSpPr>')
+        if frame:
+            x, y, width, height = frame
+            shape_properties = (f'<p:spPr><a:xfrm><a:off x="{x}" y="{y}"/><a:ext cx="{width}" cy="{height}"/>'
+                                f'</a:xfrm><a:prstGeom prst="rect"><a:avLst/></a:prstGeom></p:spPr>')
+        else:
+            shape_properties = "<p:spPr/>"
+        body_properties = '<a:bodyPr><a:normAutofit/></a:bodyPr>' if not placeholder else "<a:bodyPr/>"
+        text = "".join(self.paragraph_xml(paragraph, relationships) for paragraph in paragraphs)
+        return (f"<p:sp>{non_visual}{shape_properties}<p:txBody>{body_properties}<a:lstStyle/>{text}"
+                f"</p:txBody></p:sp>")
+
+    def table_xml(self, shape_id, table, frame, relationships):
+        x, y, width, height = frame
+        columns = len(table["aligns"])
+        column_width = width // columns
+        row_height = NATIVE_TABLE_ROW_HEIGHT
+
+        def row_xml(cells):
+            xml = [f'<a:tr h="{row_height}">']
+            for cell, align in zip(cells, table["aligns"]):
+                body = self.runs_xml(parse_inline(cell), None, relationships)
+                xml.append(f'<a:tc><a:txBody><a:bodyPr/><a:lstStyle/><a:p><a:pPr algn="{align}"/>'
+                           f'{body or PPTX_EMPTY_PARAGRAPH}</a:p></a:txBody><a:tcPr/></a:tc>')
+            xml.append("</a:tr>")
+            return "".join(xml)
+
+        grid = "".join(f'<a:gridCol w="{column_width}"/>' for _ in range(columns))
+        rows = row_xml(table["header"]) + "".join(row_xml(row) for row in table["rows"])
+        return (f'<p:graphicFrame><p:nvGraphicFramePr><p:cNvPr id="{shape_id}" name="Table {shape_id}"/>'
+                f'<p:cNvGraphicFramePr><a:graphicFrameLocks noGrp="1"/></p:cNvGraphicFramePr><p:nvPr/>'
+                f'</p:nvGraphicFramePr><p:xfrm><a:off x="{x}" y="{y}"/><a:ext cx="{width}" cy="{height}"/>'
+                f'</p:xfrm><a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/table">'
+                f'<a:tbl><a:tblPr firstRow="1" bandRow="1"><a:tableStyleId>{NATIVE_TABLE_STYLE_ID}</a:tableStyleId>'
+                f'</a:tblPr><a:tblGrid>{grid}</a:tblGrid>{rows}</a:tbl></a:graphicData></a:graphic>'
+                f'</p:graphicFrame>')
+
+    def estimate_height(self, block):
+        if block["kind"] == "table":
+            return NATIVE_TABLE_ROW_HEIGHT * (len(block["rows"]) + 1)
+        lines = 0
+        for paragraph in block["paragraphs"]:
+            text = "".join(text for text, _ in paragraph["runs"])
+            lines += sum(1 + len(piece) // NATIVE_CHARS_PER_LINE for piece in text.split("\n"))
+        return NATIVE_LINE_HEIGHT * max(lines, 1)
+
+    def add_slide(self, slide):
+        # slide: {"layout": "title" | "section" | "content", "title": runs, "subtitle": [runs], "blocks": [...]}
+        # where a block is {"kind": "text", "paragraphs": [...]} or {"kind": "table", ...}
+        self.slide_count += 1
+        relationships = []
+        shapes = []
+        animated = []
+        shape_id = 2
+
+        if slide["layout"] == "title":
+            shapes.append(self.text_shape_xml(shape_id, [{"kind": "normal", "runs": slide["title"]}], relationships,
+                                              placeholder='<p:ph type="ctrTitle"/>'))
+            shape_id += 1
+            if slide["subtitle"]:
+                paragraphs = [{"kind": "normal", "runs": runs} for runs in slide["subtitle"]]
+                shapes.append(self.text_shape_xml(shape_id, paragraphs, relationships,
+                                                  placeholder='<p:ph type="subTitle" idx="1"/>'))
+            layout = 1
+        elif slide["layout"] == "section":
+            shapes.append(self.text_shape_xml(shape_id, [{"kind": "normal", "runs": slide["title"]}], relationships,
+                                              placeholder='<p:ph type="title"/>'))
+            layout = 3
+        else:
+            layout = 2
+            if slide["title"] is not None:
+                shapes.append(self.text_shape_xml(shape_id, [{"kind": "normal", "runs": slide["title"]}],
+                                                  relationships, placeholder='<p:ph type="title"/>'))
+                shape_id += 1
+
+            blocks = slide["blocks"]
+            top = NATIVE_CONTENT_FRAME[1] if slide["title"] is not None else NATIVE_TITLE_FRAME[1]
+            available = NATIVE_CONTENT_FRAME[1] + NATIVE_CONTENT_FRAME[3] - top
+            heights = [self.estimate_height(block) for block in blocks]
+            scale = min(1.0, available / sum(heights)) if heights else 1.0
+            simple = len(blocks) == 1 and blocks[0]["kind"] == "text" and slide["title"] is not None
+
+            y = top
+            for block, height in zip(blocks, heights):
+                height = int(height * scale) if not simple else NATIVE_CONTENT_FRAME[3]
+                frame = (NATIVE_CONTENT_FRAME[0], y, NATIVE_CONTENT_FRAME[2], height)
+                if block["kind"] == "table":
+                    shapes.append(self.table_xml(shape_id, block, frame, relationships))
+                else:
+                    # A lone text block fills the layout's content placeholder
+                    shapes.append(self.text_shape_xml(shape_id, block["paragraphs"], relationships,
+                                                      None if simple else frame,
+                                                      '<p:ph idx="1"/>' if simple else None))
+                    if self.incremental and any(paragraph["kind"] in ("bullet", "number")
+                                                for paragraph in block["paragraphs"]):
+                        animated.append((shape_id, len(block["paragraphs"])))
+                shape_id += 1
+                y += height
+
+        timing = self.timing_xml(animated) if animated else ""
+        self.zip.writestr(f"ppt/slides/slide{self.slide_count}.xml",
+                          PPTX_SLIDE_XML.format(shapes="".join(shapes), timing=timing))
+
+        links = "".join(f'<Relationship Id="rId{number}" Type="{PPTX_RELATIONSHIP_TYPES["hyperlink"]}" '
+                        f'Target="{xml_escape(target)}" TargetMode="External"/>'
+                        for number, target in enumerate(relationships, 2))
+        self.zip.writestr(f"ppt/slides/_rels/slide{self.slide_count}.xml.rels",
+                          PPTX_RELS_XML.format(
+                              relationships=f'<Relationship Id="rId1" Type="{PPTX_RELATIONSHIP_TYPES["slideLayout"]}" '
+                                            f'Target="../slideLayouts/slideLayout{layout}.xml"/>{links}'))
+
+    def timing_xml(self, animated):
+        # Same structure pandoc writes for -i: every paragraph of a list shape appears on its own click
+        clicks = []
+        node_id = 3
+        for shape_id, paragraph_count in animated:
+            for paragraph in range(paragraph_count):
+                clicks.append(
+                    f'<p:par><p:cTn id="{node_id}" fill="hold"><p:stCondLst><p:cond delay="indefinite"/>'
+                    f'</p:stCondLst><p:childTnLst><p:par><p:cTn id="{node_id + 1}" fill="hold"><p:stCondLst>'
+                    f'<p:cond delay="0"/></p:stCondLst><p:childTnLst><p:par><p:cTn id="{node_id + 2}" presetID="1" '
+                    f'presetClass="entr" presetSubtype="0" fill="hold" grpId="0" nodeType="clickEffect">'
+                    f'<p:stCondLst><p:cond delay="0"/></p:stCondLst><p:childTnLst><p:set><p:cBhvr>'
+                    f'<p:cTn id="{node_id + 3}" dur="1" fill="hold"><p:stCondLst><p:cond delay="0"/></p:stCondLst>'
+                    f'</p:cTn><p:tgtEl><p:spTgt spid="{shape_id}"><p:txEl><p:pRg st="{paragraph}" '
+                    f'end="{paragraph}"/></p:txEl></p:spTgt></p:tgtEl><p:attrNameLst>'
+                    f'<p:attrName>style.visibility</p:attrName></p:attrNameLst></p:cBhvr><p:to>'
+                    f'<p:strVal val="visible"/></p:to></p:set></p:childTnLst></p:cTn></p:par></p:childTnLst>'
+                    f'</p:cTn></p:par></p:childTnLst></p:cTn></p:par>')
+                node_id += 4
+        builds = "".join(f'<p:bldP spid="{shape_id}" grpId="0" uiExpand="1" build="p"/>'
+                         for shape_id, _ in animated)
+        return (f'<p:timing><p:tnLst><p:par><p:cTn id="1" dur="indefinite" restart="never" nodeType="tmRoot">'
+                f'<p:childTnLst><p:seq concurrent="1" nextAc="seek"><p:cTn id="2" dur="indefinite" '
+                f'nodeType="mainSeq"><p:childTnLst>{"".join(clicks)}</p:childTnLst></p:cTn><p:prevCondLst>'
+                f'<p:cond evt="onPrev" delay="0"><p:tgtEl><p:sldTgt/></p:tgtEl></p:cond></p:prevCondLst>'
+                f'<p:nextCondLst><p:cond evt="onNext" delay="0"><p:tgtEl><p:sldTgt/></p:tgtEl></p:cond>'
+                f'</p:nextCondLst></p:seq></p:childTnLst></p:cTn></p:par></p:tnLst><p:bldLst>{builds}</p:bldLst>'
+                f'</p:timing>')
+
+    def finish(self, metadata):
+        slide_ids = "".join(f'<p:sldId id="{255 + number}" r:id="rId{number + 1}"/>'
+                            for number in range(1, self.slide_count + 1))
+        self.zip.writestr("ppt/presentation.xml", PPTX_PRESENTATION_XML.format(
+            slides=f"<p:sldIdLst>{slide_ids}</p:sldIdLst>" if slide_ids else ""))
+
+        types = PPTX_RELATIONSHIP_TYPES
+        relationships = [f'<Relationship Id="rId1" Type="{types["slideMaster"]}" '
+                         f'Target="slideMasters/slideMaster1.xml"/>']
+        relationships += [f'<Relationship Id="rId{number + 1}" Type="{types["slide"]}" '
+                          f'Target="slides/slide{number}.xml"/>' for number in range(1, self.slide_count + 1)]
+        next_id = self.slide_count + 2
+        for offset, (kind, target) in enumerate((("theme", "theme/theme1.xml"), ("presProps", "presProps.xml"),
+                                                 ("tableStyles", "tableStyles.xml"))):
+            relationships.append(f'<Relationship Id="rId{next_id + offset}" Type="{types[kind]}" '
+                                 f'Target="{target}"/>')
+        self.zip.writestr("ppt/_rels/presentation.xml.rels",
+                          PPTX_RELS_XML.format(relationships="".join(relationships)))
+
+        slide_types = "".join(f'<Override PartName="/ppt/slides/slide{number}.xml" '
+                              f'ContentType="{PPTX_CONTENT_TYPE_PREFIX}presentationml.slide+xml"/>'
+                              for number in range(1, self.slide_count + 1))
+        self.zip.writestr("[Content_Types].xml", PPTX_CONTENT_TYPES_XML.format(slides=slide_types))
+        self.zip.writestr("_rels/.rels", PPTX_ROOT_RELS_XML)
+        self.zip.writestr("docProps/core.xml", PPTX_CORE_XML.format(
+            title=xml_escape(metadata.get("title", "")), creator=xml_escape(metadata.get("author", ""))))
+        self.zip.writestr("docProps/app.xml", PPTX_APP_XML.format(slides=self.slide_count))
+        self.zip.close()
+
+
+def convert_markdown_native(markdown_text, theme="default", slide_level=2, incremental=False, cancel_event=None):
+    # In-process Markdown -> PPTX for the common subset (headings, paragraphs, lists, quotes, code, pipe
+    # tables, inline emphasis, code and links), laid out the way pandoc lays out its slides.
+    # Raises NativeUnsupported for anything else so the caller can hand the deck to pandoc instead.
+    if NATIVE_UNSUPPORTED_RE.search(markdown_text) or CROSS_SLIDE_REFERENCE_RE.search(markdown_text):
+        raise NativeUnsupported("images, HTML, math, footnotes or other pandoc extensions")
+
+    lines = markdown_text.splitlines()
+    metadata = {}
+    if lines and lines[0].strip() == "---":
+        for end in range(1, len(lines)):
+            if lines[end].strip() in ("---", "..."):
+                metadata = parse_front_matter(lines[1:end])
+                lines = lines[end + 1:]
+                break
+
+    buffer = io.BytesIO()
+    writer = NativeSlideWriter(buffer, theme, incremental)
+    if metadata.get("title"):
+        subtitle = [parse_inline(metadata[key]) for key in ("subtitle", "author", "date") if metadata.get(key)]
+        writer.add_slide({"layout": "title", "title": parse_inline(metadata["title"]), "subtitle": subtitle,
+                          "blocks": []})
+
+    current = None
+    list_starts = {}
+
+    def flush():
+        nonlocal current
+        if current is not None and (current["title"] is not None or current["blocks"]):
+            if cancel_event is not None and cancel_event.is_set():
+                raise ConversionCancelled("Conversion cancelled")
+            writer.add_slide(current)
+        current = None
+
+    def current_blocks():
+        # Content before the first slide heading, or after a rule, goes on an untitled slide
+        nonlocal current
+        if current is None:
+            current = {"layout": "content", "title": None, "blocks": []}
+        return current["blocks"]
+
+    def add_paragraph(paragraph):
+        blocks = current_blocks()
+        if not blocks or blocks[-1]["kind"] != "text":
+            blocks.append({"kind": "text", "paragraphs": []})
+        blocks[-1]["paragraphs"].append(paragraph)
+
+    for block in iter_markdown_blocks(lines):
+        kind = block[0]
+        if kind != "list_item" and kind != "list_paragraph":
+            list_starts = {}
+
+        if kind == "heading":
+            level, text = block[1], block[2]
+            if level < slide_level:
+                flush()
+                writer.add_slide({"layout": "section", "title": parse_inline(text), "blocks": []})
+            elif level == slide_level:
+                flush()
+                current = {"layout": "content", "title": parse_inline(text), "blocks": []}
+            else:
+                add_paragraph({"kind": "heading", "runs": parse_inline(text)})
+        elif kind == "rule":
+            flush()
+        elif kind == "paragraph":
+            add_paragraph({"kind": "normal", "runs": parse_inline(block[1])})
+        elif kind == "quote":
+            add_paragraph({"kind": "quote", "runs": parse_inline(block[1])})
+        elif kind == "code":
+            for code_line in block[1] or [""]:
+                add_paragraph({"kind": "code", "runs": [(code_line, {"code": True})]})
+        elif kind == "list_item":
+            depth, number, text = block[1], block[2], block[3]
+            text = TASK_ITEM_RE.sub(lambda match: "\u2612 " if match.group(1) in "xX" else "\u2610 ", text)
+            for deeper in [key for key in list_starts if key > depth]:
+                del list_starts[deeper]
+            paragraph = {"kind": "bullet" if number is None else "number", "depth": depth,
+                         "runs": parse_inline(text)}
+            if number is not None:
+                paragraph["start"] = list_starts.setdefault(depth, number)
+            add_paragraph(paragraph)
+        elif kind == "list_paragraph":
+            add_paragraph({"kind": "list_paragraph", "depth": block[1], "runs": parse_inline(block[2])})
+        elif kind == "table":
+            current_blocks().append({"kind": "table", "aligns": block[1], "header": block[2], "rows": block[3]})
+    flush()
+
+    writer.finish(metadata)
+    return buffer.getvalue()
+
+
+def build_pandoc_command(input_path, output_path, theme="default", slide_level=2, incremental=False):
+    # Build pandoc command
+    cmd = [
+        PANDOC_PATH,
+        input_path,
+        "-o", output_path,
+        "-t", "pptx",
+        "--slide-level", str(slide_level)
+    ]
+
+    # Add theme if not default
+    if theme != "default":
+        cmd.extend(["-V", f"theme={theme}"])
+
+    # Add incremental option if selected
+    if incremental:
+        cmd.extend(["-i"])
+
+    return cmd
+
+
+def run_pandoc(cmd, input_text=None, input_file=None, on_process=None, on_progress=None, cancel_event=None,
+               deadline=None):
+    # Runs pandoc with input_text (or the binary file object input_file) on stdin and returns everything it
+    # wrote to stdout as bytes. With neither, pandoc reads its input file itself. Nothing touches the disk unless
+    # the caller writes the result.
+    # on_process(process) is called right after pandoc starts, e.g. so the caller can kill it.
+    # on_progress("pandoc", 0, 1) is called once pandoc has all of its input and is building the deck. Bytes fed
+    # to stdin aren't reported: the pipe takes them almost at once, so they say nothing about how far pandoc is.
+    # The per-slide path (SlideCacheBuilder) reports real progress instead.
+    # Setting cancel_event or passing deadline (a time.perf_counter() value) kills pandoc early.
+    if input_file is not None:
+        chunks = iter(lambda: input_file.read(PIPE_CHUNK_SIZE), b"")
+    elif input_text is not None:
+        data = input_text.encode("utf-8") if isinstance(input_text, str) else input_text
+        chunks = (data[offset:offset + PIPE_CHUNK_SIZE] for offset in range(0, len(data), PIPE_CHUNK_SIZE))
+    else:
+        chunks = None
+
+    try:
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE if chunks is not None else subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise ConversionError(f"pandoc not found ({cmd[0]}). Please install it from "
+                              "https://pandoc.org/installing.html or set PANDOC to its path")
+    if on_process:
+        on_process(process)
+
+    def feed():
+        try:
+            for chunk in chunks:
+                process.stdin.write(chunk)
+            process.stdin.close()
+        except OSError:
+            # pandoc exited or was killed, its exit code says why
+            return
+        if on_progress:
+            on_progress("pandoc", 0, 1)
+
+    def drain(stream, output):
+        for chunk in iter(lambda: stream.read(PIPE_CHUNK_SIZE), b""):
+            output.append(chunk)
+
+    # The pipes are serviced on helper threads, which leaves this one free to watch for cancel and timeout
+    stdout_chunks, stderr_chunks = [], []
+    threads = [threading.Thread(target=drain, args=(process.stdout, stdout_chunks)),
+               threading.Thread(target=drain, args=(process.stderr, stderr_chunks))]
+    if chunks is not None:
+        threads.append(threading.Thread(target=feed))
+    elif on_progress:
+        on_progress("pandoc", 0, 1)
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    stopped = None
+    while True:
+        try:
+            process.wait(timeout=CANCEL_POLL_SECONDS)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+        if cancel_event is not None and cancel_event.is_set():
+            stopped = ConversionCancelled("Conversion cancelled")
+        elif deadline is not None and time.perf_counter() > deadline:
+            stopped = ConversionError("Conversion timed out and was stopped")
+        if stopped is not None:
+            process.kill()
+            process.wait()
+            break
+
+    for thread in threads:
+        thread.join(timeout=1)
+    if stopped is not None:
+        raise stopped
+
+    if process.returncode != 0:
+        raise ConversionError(f"Error: {b''.join(stderr_chunks).decode('utf-8', errors='replace')}")
+    return b"".join(stdout_chunks)
+
+
+def log_conversion(source, input_size, output_size, started):
+    logger.info("Converted %s: %d bytes of Markdown -> %d bytes of PPTX in %.2fs", source, input_size,
+                output_size, time.perf_counter() - started)
+
+
+def render_native(markdown_text, theme="default", slide_level=2, incremental=False, cancel_event=None,
+                  native=None, source="Markdown text"):
+    # PPTX bytes from the native writer, or None if it's switched off or the deck needs pandoc
+    if not (NATIVE_WRITER_ENABLED if native is None else native):
+        return None
+    if MERMAID_ENABLED and MERMAID_FENCE_RE.search(markdown_text):
+        # Diagrams are rendered to images, which only pandoc can place
+        logger.info("%s needs pandoc: Mermaid diagrams", source)
+        return None
+    started = time.perf_counter()
+    try:
+        data = convert_markdown_native(markdown_text, theme, slide_level, incremental, cancel_event)
+    except NativeUnsupported as e:
+        logger.info("%s needs pandoc: %s", source, e)
+        return None
+    log_conversion(f"{source} (native writer)", len(markdown_text.encode("utf-8")), len(data), started)
+    return data
+
+
+def convert_markdown_to_bytes(markdown_text, theme="default", slide_level=2, incremental=False,
+                              resource_path=None, on_process=None, on_progress=None, cancel_event=None,
+                              timeout=None, native=None):
+    # Markdown in, PPTX bytes out: in-process when the native writer can do it, otherwise piped through pandoc
+    data = render_native(markdown_text, theme, slide_level, incremental, cancel_event, native)
+    if data is not None:
+        return data
+
+    started = time.perf_counter()
+    deadline = get_deadline(timeout)
+    markdown_text = prepare_deck_assets(markdown_text, resource_path, on_progress, cancel_event, deadline)
+    cmd = build_pandoc_command("-", "-", theme, slide_level, incremental)
+    if resource_path:
+        cmd.extend(["--resource-path", resource_path])
+    data = run_pandoc(cmd, markdown_text, on_process=on_process, on_progress=on_progress,
+                      cancel_event=cancel_event, deadline=deadline)
+    log_conversion("Markdown text", len(markdown_text.encode("utf-8")), len(data), started)
+    return data
+
+
+def write_file_atomic(path, data):
+    # Write to a hidden temp file in the same folder and rename it over path, so nobody ever sees a half-written
+    # file and a failed write leaves the previous version alone
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp",
+                                     dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def convert_markdown_file(input_path, output_path, theme="default", slide_level=2, incremental=False,
+                          reuse_slides=False, on_progress=None, cancel_event=None, timeout=None, native=None):
+    # Headless single-file conversion, raises ConversionError with pandoc's stderr on failure
+    markdown_text = None
+    if NATIVE_WRITER_ENABLED if native is None else native:
+        with open(input_path, 'r', encoding='utf-8') as file:
+            markdown_text = file.read()
+        data = render_native(markdown_text, theme, slide_level, incremental, cancel_event, source=input_path)
+        if data is not None:
+            write_file_atomic(output_path, data)
+            return None
+
+    if reuse_slides:
+        return get_slide_builder().convert_file(input_path, output_path, theme, slide_level, incremental,
+                                                on_progress=on_progress, cancel_event=cancel_event,
+                                                timeout=timeout)
+
+    # Images are looked up next to the file first, then in the working directory like pandoc does by default
+    resource_path = os.pathsep.join([os.path.dirname(os.path.abspath(input_path)), "."])
+
+    # Decks with diagrams or images are prepared first, which needs the text in memory
+    if MERMAID_ENABLED or get_image_pipeline() is not None:
+        if markdown_text is None:
+            with open(input_path, 'r', encoding='utf-8') as file:
+                markdown_text = file.read()
+        if needs_deck_assets(markdown_text):
+            data = convert_markdown_to_bytes(markdown_text, theme, slide_level, incremental, resource_path,
+                                             on_progress=on_progress, cancel_event=cancel_event, timeout=timeout,
+                                             native=False)
+            write_file_atomic(output_path, data)
+            return None
+
+    # Everything else is streamed from disk into pandoc, which hands the deck back on stdout
+    started = time.perf_counter()
+    cmd = build_pandoc_command("-", "-", theme, slide_level, incremental)
+    cmd.extend(["--resource-path", resource_path])
+    with open(input_path, 'rb') as input_file:
+        input_size = os.fstat(input_file.fileno()).st_size
+        data = run_pandoc(cmd, input_file=input_file, on_progress=on_progress, cancel_event=cancel_event,
+                          deadline=get_deadline(timeout))
+    write_file_atomic(output_path, data)
+    log_conversion(input_path, input_size, len(data), started)
+
+
+def convert_file_native(input_path, output_path, theme="default", slide_level=2, incremental=False):
+    # Runs in a batch worker process: writes the deck with the native writer and returns True, or returns False
+    # when the deck needs pandoc
+    with open(input_path, 'r', encoding='utf-8') as file:
+        markdown_text = file.read()
+    data = render_native(markdown_text, theme, slide_level, incremental, native=True, source=input_path)
+    if data is None:
+        return False
+    write_file_atomic(output_path, data)
+    return True
+
+
+class LiveConverter:
+    # Keeps output_path in sync with changing Markdown (watch mode). Bursts of changes are debounced into one
+    # pandoc run, a run working on content that has since changed is killed, and output_path is only replaced
+    # once a conversion succeeds, so the last good deck stays in place while the source is broken.
+    # on_result(result) is called from a worker thread after every run.
+    def __init__(self, output_path, theme="default", slide_level=2, incremental=False, resource_path=None,
+                 debounce=WATCH_DEBOUNCE_SECONDS, on_result=None, reuse_slides=False, native=None):
+        self.output_path = output_path
+        self.options = {"theme": theme, "slide_level": slide_level, "incremental": incremental,
+                        "native": NATIVE_WRITER_ENABLED if native is None else native}
+        self.reuse_slides = reuse_slides
+        self.resource_path = resource_path
+        self.debounce = debounce
+        self.on_result = on_result
+
+        self._lock = threading.Lock()
+        self._timer = None
+        self._pending = None
+        self._generation = 0
+        self._process = None
+        self._cancel_event = None
+        self._closed = False
+
+    def submit(self, markdown_text):
+        # Only the newest text matters, every call restarts the debounce timer
+        with self._lock:
+            if self._closed:
+                return
+            self._pending = markdown_text
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce, self._fire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _fire(self):
+        with self._lock:
+            if self._closed or self._pending is None:
+                return
+            markdown_text, self._pending = self._pending, None
+            self._generation += 1
+            generation = self._generation
+
+            # Whatever is still running is converting stale content
+            if self._process is not None and self._process.poll() is None:
+                self._process.kill()
+            if self._cancel_event is not None:
+                self._cancel_event.set()
+            self._cancel_event = cancel_event = threading.Event()
+
+        thread = threading.Thread(target=self._convert, args=(generation, markdown_text, cancel_event))
+        thread.daemon = True
+        thread.start()
+
+    def _convert(self, generation, markdown_text, cancel_event):
+        started = time.perf_counter()
+        result = {"generation": generation, "output": self.output_path}
+
+        def register(process):
+            with self._lock:
+                self._process = process
+                # Newer content arrived while pandoc was starting
+                if generation != self._generation:
+                    process.kill()
+
+        try:
+            if self.reuse_slides:
+                # As in ConversionEngine: the slide cache only matters for decks the native writer hands to pandoc
+                options = dict(self.options)
+                native = options.pop("native")
+                data = render_native(markdown_text, cancel_event=cancel_event, native=native, **options)
+                if data is None:
+                    data, _ = get_slide_builder().render_text(markdown_text, resource_path=self.resource_path,
+                                                              cancel_event=cancel_event,
+                                                              timeout=CONVERSION_TIMEOUT_SECONDS, **options)
+            else:
+                data = convert_markdown_to_bytes(markdown_text, resource_path=self.resource_path,
+                                                 on_process=register, cancel_event=cancel_event,
+                                                 timeout=CONVERSION_TIMEOUT_SECONDS, **self.options)
+            with self._lock:
+                superseded = generation != self._generation
+                if not superseded:
+                    write_file_atomic(self.output_path, data)
+            result.update(status="superseded" if superseded else "converted")
+        except ConversionError as e:
+            # A killed run fails too, that's not worth reporting
+            with self._lock:
+                superseded = generation != self._generation
+            if superseded:
+                result.update(status="superseded")
+            else:
+                result.update(status="failed", error=str(e))
+        except Exception as e:
+            result.update(status="failed", error=str(e))
+
+        result["seconds"] = time.perf_counter() - started
+        if self.on_result:
+            self.on_result(result)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+            if self._process is not None and self._process.poll() is None:
+                self._process.kill()
+            if self._cancel_event is not None:
+                self._cancel_event.set()
+
+
+class FileWatcher:
+    # Polls a file for changes and calls on_change(text) with its new contents, starting with the current ones.
+    # Polling mtime and size is plenty for a file someone is editing and needs no extra dependency.
+    def __init__(self, path, on_change, interval=WATCH_POLL_SECONDS):
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        last_signature = None
+        while not self._stop_event.is_set():
+            try:
+                stat = os.stat(self.path)
+                signature = (stat.st_mtime_ns, stat.st_size)
+                if signature != last_signature:
+                    with open(self.path, 'r', encoding='utf-8') as file:
+                        markdown_text = file.read()
+                    last_signature = signature
+                    self.on_change(markdown_text)
+            except (OSError, UnicodeDecodeError):
+                # Editors often delete and recreate the file on save, just try again next time
+                pass
+            self._stop_event.wait(self.interval)
+
+
+class BatchConverter:
+    # Converts every Markdown file under input_dir into a matching .pptx under output_dir, in parallel.
+    # A manifest of input hash + options sits in output_dir, so decks that haven't changed are skipped next time.
+    # The native writer is pure Python, so with more than one worker its conversions go to worker processes;
+    # decks that need pandoc are piped through it from the worker threads.
+    def __init__(self, input_dir, output_dir, theme="default", slide_level=2, incremental=False, workers=None,
+                 force=False, reuse_slides=False, timeout=None, native=None):
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.options = {"theme": theme, "slide_level": slide_level, "incremental": incremental,
+                        "native": NATIVE_WRITER_ENABLED if native is None else native}
+        self.reuse_slides = reuse_slides
+        self.timeout = timeout
+        self.workers = workers or os.cpu_count() or 1
+        self.force = force
+
+        self.manifest_path = os.path.join(output_dir, BATCH_MANIFEST_NAME)
+        self.manifest = {}
+        self._manifest_lock = threading.Lock()
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+        self._process_pool = None
+
+    def find_inputs(self):
+        inputs = []
+        for directory, _, file_names in os.walk(self.input_dir):
+            for file_name in sorted(file_names):
+                if file_name.lower().endswith(MARKDOWN_EXTENSIONS):
+                    inputs.append(os.path.relpath(os.path.join(directory, file_name), self.input_dir))
+        return sorted(inputs)
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as file:
+                self.manifest = json.load(file)
+        except (OSError, ValueError):
+            self.manifest = {}
+
+    def save_manifest(self):
+        # Write then rename, so an interrupted run never leaves a half-written manifest behind
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.manifest, file, indent=2, sort_keys=True)
+        os.replace(temp_path, self.manifest_path)
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+
+    def record(self, relative_path, entry):
+        # Rewriting the whole manifest per file would make a large batch quadratic, so writes are batched.
+        # A crash loses at most the last batch, and those files are converted again next time.
+        with self._manifest_lock:
+            self.manifest[relative_path] = entry
+            self._unsaved += 1
+            if (self._unsaved >= BATCH_MANIFEST_SAVE_EVERY
+                    or time.monotonic() - self._saved_at >= BATCH_MANIFEST_SAVE_SECONDS):
+                self.save_manifest()
+
+    def input_hash(self, input_path):
+        # The deck's text, the options and every local image it embeds, so replacing an image rebuilds the deck
+        # even though its Markdown didn't change. Images count by size + mtime, which is a stat instead of a read.
+        # Mermaid code is part of the text; the render and image settings go in with the options.
+        settings = dict(self.options, mermaid=MERMAID_ENABLED and MERMAID_RENDER_OPTIONS,
+                        images=IMAGE_ASSETS_ENABLED and [IMAGE_TARGET_DPI, IMAGE_JPEG_QUALITY])
+        digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8"))
+        with open(input_path, 'rb') as file:
+            data = file.read()
+        digest.update(data)
+
+        # Looked up the same way the conversion does: next to the deck, then the working directory
+        search_dirs = [os.path.dirname(os.path.abspath(input_path)), "."]
+        lines = data.decode("utf-8", errors="replace").splitlines(keepends=True)
+        targets = sorted({match.group(2) for index in prose_line_indexes(lines)
+                          for match in MARKDOWN_IMAGE_RE.finditer(lines[index])})
+        for target in targets:
+            path = ImageAssetPipeline.resolve(target, search_dirs)
+            if path is None:
+                # A URL or a missing file; a missing one that turns up later changes the hash
+                digest.update(f"\0{target}\0-".encode("utf-8"))
+                continue
+            stat = os.stat(path)
+            digest.update(f"\0{target}\0{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def convert_one(self, relative_path):
+        input_path = os.path.join(self.input_dir, relative_path)
+        relative_output = os.path.splitext(relative_path)[0] + ".pptx"
+        output_path = os.path.join(self.output_dir, relative_output)
+        result = {"input": relative_path, "output": relative_output}
+
+        started = time.perf_counter()
+        try:
+            input_hash = self.input_hash(input_path)
+            previous = self.manifest.get(relative_path)
+            if (not self.force and previous and previous.get("hash") == input_hash
+                    and os.path.exists(output_path)):
+                result.update(status="skipped", seconds=0.0)
+                return result
+
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            converted = False
+            options = self.options
+            if options["native"] and self._process_pool is not None:
+                # Only decks the native writer can't do come back here for pandoc
+                converted = self._process_pool.submit(convert_file_native, input_path, output_path,
+                                                      options["theme"], options["slide_level"],
+                                                      options["incremental"]).result()
+                options = dict(options, native=False)
+            if not converted:
+                convert_markdown_file(input_path, output_path, reuse_slides=self.reuse_slides, timeout=self.timeout,
+                                      **options)
+            seconds = time.perf_counter() - started
+
+            self.record(relative_path, {"hash": input_hash, "output": relative_output, "seconds": round(seconds, 3)})
+            result.update(status="converted", seconds=seconds)
+        except Exception as e:
+            result.update(status="failed", seconds=time.perf_counter() - started, error=str(e))
+        return result
+
+    def run(self, on_progress=None):
+        # on_progress(done, total, result) is called from worker threads as each file finishes
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.load_manifest()
+        inputs = self.find_inputs()
+
+        started = time.perf_counter()
+        results = []
+        if self.options["native"] and self.workers > 1 and len(inputs) > 1:
+            # Spawned rather than forked, the GUI has threads running
+            self._process_pool = ProcessPoolExecutor(max_workers=min(self.workers, len(inputs)),
+                                                     mp_context=multiprocessing.get_context("spawn"))
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [executor.submit(self.convert_one, relative_path) for relative_path in inputs]
+                for future in as_completed(futures):
+                    results.append(future.result())
+                    if on_progress:
+                        on_progress(len(results), len(inputs), results[-1])
+        finally:
+            if self._process_pool is not None:
+                self._process_pool.shutdown()
+                self._process_pool = None
+            with self._manifest_lock:
+                if self._unsaved:
+                    self.save_manifest()
+
+        elapsed = time.perf_counter() - started
+        counts = {status: sum(1 for result in results if result["status"] == status)
+                  for status in ("converted", "skipped", "failed")}
+        return {
+            "files": sorted(results, key=lambda result: result["input"]),
+            "total": len(inputs),
+            **counts,
+            "workers": self.workers,
+            "elapsed_seconds": round(elapsed, 3),
+            "conversion_seconds": round(sum(result["seconds"] for result in results), 3),
+        }
+
+
+class EngineBusy(Exception):
+    # Raised when the job queue is full, callers should retry later
+    pass
+
+
+class JobNotFound(Exception):
+    pass
+
+
+def percentile(values, fraction):
+    # One implementation for both apps, it lives in the diagram app's mermaid_render.py
+    mermaid_render = load_mermaid_render()
+    if mermaid_render is None:
+        raise Exception(f"Latency percentiles need {os.path.join(DIAGRAM_APP_DIR, 'mermaid_render.py')}")
+    return mermaid_render.percentile(values, fraction)
+
+
+class ConversionEngine:
+    # Headless conversion service: a bounded job queue in front of a pool of worker threads.
+    # Everything that wants a conversion (the GUI, the HTTP service, scripts) submits a job and polls its status.
+    #
+    # A job is a dict with either "markdown" (text) or "input_path", optionally "output_path" (the deck is
+    # written there, otherwise the bytes are kept for result()), plus "theme", "slide_level", "incremental",
+    # "reuse_slides" and "native".
+    JOB_OPTIONS = ("theme", "slide_level", "incremental", "reuse_slides", "native")
+    FINISHED_STATUSES = ("done", "failed", "cancelled")
+
+    def __init__(self, workers=ENGINE_WORKERS, queue_size=ENGINE_QUEUE_SIZE, timeout=CONVERSION_TIMEOUT_SECONDS):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._results = {}
+        self._counters = {"submitted": 0, "rejected": 0, "done": 0, "failed": 0, "cancelled": 0}
+        self._latencies = {"queue": deque(maxlen=ENGINE_LATENCY_SAMPLES),
+                           "run": deque(maxlen=ENGINE_LATENCY_SAMPLES),
+                           "total": deque(maxlen=ENGINE_LATENCY_SAMPLES)}
+        self._finished_times = deque(maxlen=ENGINE_LATENCY_SAMPLES)
+        self._running = 0
+        self._started = time.time()
+        self._closed = threading.Event()
+
+        self._threads = []
+        for _ in range(workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, job, wait=0):
+        # Returns the job id. With the queue full, waits up to `wait` seconds for room, then raises EngineBusy.
+        if self._closed.is_set():
+            raise EngineBusy("The conversion engine is shutting down")
+        if bool(job.get("markdown") is not None) == bool(job.get("input_path")):
+            raise ValueError("A job needs either markdown or input_path")
+        if job.get("input_path") and not os.path.isfile(job["input_path"]):
+            raise ValueError(f"No such file: {job['input_path']}")
+        slide_level = int(job.get("slide_level", 2))
+        if not 1 <= slide_level <= 6:
+            raise ValueError("slide_level must be between 1 and 6")
+
+        record = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "markdown": job.get("markdown"),
+            "input_path": job.get("input_path"),
+            "output_path": job.get("output_path"),
+            "options": {"theme": str(job.get("theme", "default")), "slide_level": slide_level,
+                        "incremental": bool(job.get("incremental", False)),
+                        "reuse_slides": bool(job.get("reuse_slides", False)),
+                        "native": bool(job.get("native", NATIVE_WRITER_ENABLED))},
+            "progress": {"stage": None, "done": 0, "total": None},
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+            "slides": None,
+            "result_bytes": None,
+            "cancel_event": threading.Event(),
+        }
+
+        with self._lock:
+            self._jobs[record["id"]] = record
+        try:
+            if wait:
+                self._queue.put(record, timeout=wait)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[record["id"]]
+                self._counters["rejected"] += 1
+            raise EngineBusy(f"The conversion queue is full ({self.queue_size} jobs)")
+
+        with self._lock:
+            self._counters["submitted"] += 1
+            self._forget_old_jobs()
+        return record["id"]
+
+    def _forget_old_jobs(self):
+        # Keep the most recent finished jobs around for polling, drop the rest with their results
+        finished = [job_id for job_id, record in self._jobs.items() if record["status"] in self.FINISHED_STATUSES]
+        for job_id in finished[:max(0, len(finished) - ENGINE_MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+            self._results.pop(job_id, None)
+
+    def _get(self, job_id):
+        record = self._jobs.get(job_id)
+        if record is None:
+            raise JobNotFound(f"Unknown job: {job_id}")
+        return record
+
+    def status(self, job_id):
+        with self._lock:
+            record = self._get(job_id)
+            status = {key: record[key] for key in ("id", "status", "output_path", "submitted_at", "started_at",
+                                                   "finished_at", "error", "slides", "result_bytes")}
+            status["options"] = dict(record["options"])
+            status["progress"] = dict(record["progress"])
+            status["queue_position"] = None
+            if record["status"] == "queued":
+                queued = [other for other in self._jobs.values() if other["status"] == "queued"]
+                status["queue_position"] = queued.index(record)
+            return status
+
+    def result(self, job_id):
+        # PPTX bytes of a finished job that had no output_path
+        with self._lock:
+            record = self._get(job_id)
+            if record["status"] != "done" or job_id not in self._results:
+                raise ConversionError(f"Job {job_id} has no result ({record['status']})")
+            return self._results[job_id]
+
+    def cancel(self, job_id):
+        with self._lock:
+            record = self._get(job_id)
+            if record["status"] in self.FINISHED_STATUSES:
+                return False
+            record["cancel_event"].set()
+            if record["status"] == "queued":
+                # The worker that picks it up skips it
+                self._finish(record, "cancelled", error="Conversion cancelled")
+            return True
+
+    def _finish(self, record, status, error=None):
+        # Caller holds the lock
+        record["status"] = status
+        record["error"] = error
+        record["finished_at"] = time.time()
+        record["markdown"] = None
+        self._counters[status] += 1
+        self._finished_times.append(time.perf_counter())
+        self._latencies["total"].append(record["finished_at"] - record["submitted_at"])
+        if record["started_at"] is not None:
+            self._latencies["run"].append(record["finished_at"] - record["started_at"])
+
+    def _work(self):
+        # Workers poll for jobs rather than waiting on a stop marker, which close() couldn't queue when it's full
+        while not self._closed.is_set():
+            try:
+                record = self._queue.get(timeout=CANCEL_POLL_SECONDS)
+            except queue.Empty:
+                continue
+
+            with self._lock:
+                if record["status"] != "queued":
+                    continue
+                record["status"] = "running"
+                record["started_at"] = time.time()
+                self._latencies["queue"].append(record["started_at"] - record["submitted_at"])
+                self._running += 1
+
+            try:
+                data, slide_stats = self._execute(record)
+                with self._lock:
+                    if data is not None:
+                        self._results[record["id"]] = data
+                        record["result_bytes"] = len(data)
+                    record["slides"] = slide_stats
+                    self._finish(record, "done")
+            except ConversionCancelled as e:
+                with self._lock:
+                    self._finish(record, "cancelled", error=str(e))
+            except Exception as e:
+                with self._lock:
+                    self._finish(record, "failed", error=str(e))
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+    def _execute(self, record):
+        # Returns (PPTX bytes or None if written to output_path, slide stats)
+        def on_progress(stage, done, total):
+            record["progress"] = {"stage": stage, "done": done, "total": total}
+
+        options = dict(record["options"])
+        reuse_slides = options.pop("reuse_slides")
+        control = {"on_progress": on_progress, "cancel_event": record["cancel_event"], "timeout": self.timeout}
+        output_path = record["output_path"]
+
+        markdown_text = record["markdown"]
+        resource_path = None
+        if markdown_text is None:
+            if output_path:
+                # Stream the file from disk, nothing to hold in memory
+                slide_stats = convert_markdown_file(record["input_path"], output_path, reuse_slides=reuse_slides,
+                                                    **options, **control)
+                return None, slide_stats
+            with open(record["input_path"], 'r', encoding='utf-8') as file:
+                markdown_text = file.read()
+            resource_path = os.path.dirname(os.path.abspath(record["input_path"]))
+
+        slide_stats = None
+        if reuse_slides:
+            # The slide cache only matters for decks the native writer hands over to pandoc
+            native = options.pop("native")
+            data = render_native(markdown_text, cancel_event=record["cancel_event"], native=native, **options)
+            if data is None:
+                data, slide_stats = get_slide_builder().render_text(markdown_text, resource_path=resource_path,
+                                                                    **options, **control)
+        else:
+            data = convert_markdown_to_bytes(markdown_text, resource_path=resource_path, **options, **control)
+
+        if output_path:
+            write_file_atomic(output_path, data)
+            return None, slide_stats
+        return data, slide_stats
+
+    def metrics(self):
+        with self._lock:
+            now = time.perf_counter()
+            recent = sum(1 for finished in self._finished_times if now - finished <= 60)
+            latencies = {}
+            for phase, samples in self._latencies.items():
+                values = list(samples)
+                latencies[phase] = {
+                    "count": len(values),
+                    "mean": sum(values) / len(values) if values else None,
+                    "p50": percentile(values, 0.50),
+                    "p95": percentile(values, 0.95),
+                    "p99": percentile(values, 0.99),
+                }
+            return {
+                "uptime_seconds": round(time.time() - self._started, 3),
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "queued": self._queue.qsize(),
+                "running": self._running,
+                "jobs": dict(self._counters),
+                "throughput_per_minute": recent,
+                "latency_seconds": latencies,
+            }
+
+    def metrics_prometheus(self, prefix="pptx_"):
+        metrics = self.metrics()
+        lines = [f"# TYPE {prefix}jobs_total counter"]
+        for status, count in sorted(metrics["jobs"].items()):
+            lines.append(f'{prefix}jobs_total{{status="{status}"}} {count}')
+        for name in ("queued", "running", "workers", "queue_size"):
+            lines.append(f"# TYPE {prefix}{name} gauge")
+            lines.append(f"{prefix}{name} {metrics[name]}")
+        lines.append(f"# TYPE {prefix}job_seconds summary")
+        for phase, stats in sorted(metrics["latency_seconds"].items()):
+            for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                if stats[key] is not None:
+                    lines.append(f'{prefix}job_seconds{{phase="{phase}",quantile="{quantile}"}} {stats[key]:.6f}')
+            lines.append(f'{prefix}job_seconds_count{{phase="{phase}"}} {stats["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        # Cancel whatever is still pending and stop the workers. Never blocks, however full the queue is.
+        self._closed.set()
+        with self._lock:
+            for record in self._jobs.values():
+                if record["status"] in ("queued", "running"):
+                    record["cancel_event"].set()
+                if record["status"] == "queued":
+                    self._finish(record, "cancelled", error="Conversion cancelled")
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+
+def check_service_path(path, root, field, extensions):
+    # Jobs from the service may only read Markdown inside the input root and write .pptx files inside the output
+    # root, so a request can neither read back other files the user owns nor overwrite them. Symlinks are
+    # resolved first, so they can't point the read or write elsewhere.
+    if os.path.splitext(path)[1].lower() not in extensions:
+        raise ValueError(f"{field} must be a {' or '.join(extensions)} file")
+    root = os.path.realpath(root)
+    if os.path.commonpath([root, os.path.realpath(path)]) != root:
+        raise PermissionError(f"{field} must be inside {root}")
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    # HTTP front end for a ConversionEngine (self.server.engine):
+    #   POST   /jobs              JSON job (see ConversionEngine), optional "wait" seconds -> 202 {"id": ...}
+    #                             or 503 + Retry-After when the queue is full. Needs Content-Type:
+    #                             application/json, which a web page can't send cross-site without a CORS
+    #                             preflight (which we never answer). input_path has to be Markdown inside
+    #                             self.server.input_root and output_path a .pptx inside self.server.output_root.
+    #   GET    /jobs/<id>         job status
+    #   GET    /jobs/<id>/result  the .pptx of a finished job that had no output_path
+    #   DELETE /jobs/<id>         cancel
+    #   GET    /metrics           JSON, or Prometheus text with ?format=prometheus
+    #   GET    /health
+    # Every request has to name this server by a loopback Host (plus self.server.allowed_hosts), so a page that
+    # rebinds its own host name to 127.0.0.1 can't reach it as same-origin.
+    protocol_version = "HTTP/1.1"
+
+    def check_host(self):
+        # False (and a 403 sent) if the Host header isn't one of ours
+        port = self.server.server_address[1]
+        names = SERVICE_LOCAL_HOSTS + tuple(getattr(self.server, "allowed_hosts", ()))
+        allowed = {f"{name}:{port}" for name in names}
+        if port == 80:
+            allowed.update(names)
+        if (self.headers.get("Host") or "").strip().lower() in allowed:
+            return True
+        self.send_json(403, {"error": "Unexpected Host header"})
+        self.close_connection = True
+        return False
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_bytes(self, content_type, body):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def job_path(self):
+        # Returns (job id, sub-resource) for /jobs/<id>[/<sub>]
+        parts = urllib.parse.urlparse(self.path).path.strip("/").split("/")
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            return parts[1], parts[2] if len(parts) == 3 else None
+        return None, None
+
+    def do_POST(self):
+        if not self.check_host():
+            return
+        if urllib.parse.urlparse(self.path).path != "/jobs":
+            self.send_json(404, {"error": "Not found"})
+            return
+
+        content_type = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+        if content_type != "application/json":
+            self.send_json(415, {"error": "Jobs must be sent as application/json"})
+            self.close_connection = True
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length < 0:
+                raise ValueError("it can't be negative")
+        except ValueError as e:
+            self.send_json(400, {"error": f"Bad Content-Length: {e}"})
+            self.close_connection = True
+            return
+        if length > SERVICE_MAX_BODY_BYTES:
+            self.send_json(413, {"error": f"Request body is larger than {SERVICE_MAX_BODY_BYTES} bytes"})
+            self.close_connection = True
+            return
+        try:
+            job = json.loads(self.rfile.read(length) or b"{}")
+            if job.get("input_path"):
+                check_service_path(str(job["input_path"]), self.server.input_root, "input_path",
+                                   MARKDOWN_EXTENSIONS)
+            if job.get("output_path"):
+                check_service_path(str(job["output_path"]), self.server.output_root, "output_path", (".pptx",))
+            job_id = self.server.engine.submit(job, wait=float(job.get("wait", 0)))
+        except EngineBusy as e:
+            self.send_json(503, {"error": str(e)}, {"Retry-After": "1"})
+            return
+        except PermissionError as e:
+            self.send_json(403, {"error": str(e)})
+            return
+        except (ValueError, TypeError, AttributeError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        self.send_json(202, {"id": job_id, "status": "queued"}, {"Location": f"/jobs/{job_id}"})
+
+    def do_GET(self):
+        if not self.check_host():
+            return
+        url = urllib.parse.urlparse(self.path)
+        engine = self.server.engine
+        if url.path == "/health":
+            self.send_json(200, {"ok": True})
+            return
+        if url.path == "/metrics":
+            if urllib.parse.parse_qs(url.query).get("format") == ["prometheus"]:
+                self.send_bytes("text/plain; version=0.0.4", engine.metrics_prometheus().encode("utf-8"))
+            else:
+                self.send_json(200, engine.metrics())
+            return
+
+        job_id, sub = self.job_path()
+        try:
+            if job_id and sub is None:
+                self.send_json(200, engine.status(job_id))
+            elif job_id and sub == "result":
+                try:
+                    data = engine.result(job_id)
+                except ConversionError as e:
+                    self.send_json(409, {"error": str(e)})
+                    return
+                self.send_bytes("application/vnd.openxmlformats-officedocument.presentationml.presentation", data)
+            else:
+                self.send_json(404, {"error": "Not found"})
+        except JobNotFound as e:
+            self.send_json(404, {"error": str(e)})
+
+    def do_DELETE(self):
+        if not self.check_host():
+            return
+        job_id, sub = self.job_path()
+        if not job_id or sub is not None:
+            self.send_json(404, {"error": "Not found"})
+            return
+        try:
+            cancelled = self.server.engine.cancel(job_id)
+        except JobNotFound as e:
+            self.send_json(404, {"error": str(e)})
+            return
+        self.send_json(200, {"id": job_id, "cancelled": cancelled})
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+
+class ConversionServiceClient:
+    # Talks to a `main.py serve` instance, with the same submit/status/result/cancel calls as ConversionEngine
+    def __init__(self, base_url, timeout=10):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def request(self, method, path, payload=None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        request = urllib.request.Request(self.base_url + path, data=body, method=method,
+                                         headers={"Content-Type": "application/json"} if body else {})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.read()
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read())["error"]
+            except (ValueError, KeyError):
+                message = str(e)
+            if e.code == 503:
+                raise EngineBusy(message)
+            if e.code == 404:
+                raise JobNotFound(message)
+            if e.code in (400, 403, 415):
+                raise ValueError(message)
+            raise ConversionError(message)
+        except urllib.error.URLError as e:
+            raise ConversionError(f"Could not reach the conversion service at {self.base_url}: {e.reason}")
+
+    def submit(self, job, wait=0):
+        return json.loads(self.request("POST", "/jobs", dict(job, wait=wait)))["id"]
+
+    def status(self, job_id):
+        return json.loads(self.request("GET", f"/jobs/{job_id}"))
+
+    def result(self, job_id):
+        return self.request("GET", f"/jobs/{job_id}/result")
+
+    def cancel(self, job_id):
+        return json.loads(self.request("DELETE", f"/jobs/{job_id}"))["cancelled"]
+
+    def metrics(self):
+        return json.loads(self.request("GET", "/metrics"))
 
 
 class MarkdownToPPTXConverter:
@@ -13,7 +2798,22 @@ class MarkdownToPPTXConverter:
         self.root.geometry("800x600")
         self.root.resizable(True, True)
 
+        # Conversions go through a ConversionEngine (created on first use) or a remote conversion service.
+        # conversion_job is set while a single-file conversion is running.
+        self.engine = None
+        self.conversion_job = None
+
+        # The file behind the editor content, the load in progress and whether the content was edited since
+        self.editor_source = None
+        self.editor_load = None
+        self.editor_dirty = False
+
+        # Watch mode
+        self.live_converter = None
+        self.file_watcher = None
+
         self.setup_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def setup_ui(self):
         # Create main frame
@@ -62,11 +2862,41 @@ class MarkdownToPPTXConverter:
         self.markdown_editor = scrolledtext.ScrolledText(editor_frame, wrap=tk.WORD, width=80, height=15,
                                                          font=("Courier New", 11))
         self.markdown_editor.pack(fill=tk.BOTH, expand=True)
+        self.markdown_editor.bind("<<Modified>>", self.on_editor_modified)
 
         # Sample markdown button
         sample_button = ttk.Button(editor_frame, text="Insert Sample Markdown", command=self.insert_sample_markdown)
         sample_button.pack(anchor=tk.E, pady=5)
 
+        # Tab 3: Batch folder conversion
+        batch_tab = ttk.Frame(self.notebook, padding=10)
+        self.notebook.add(batch_tab, text="Batch Folder")
+
+        batch_input_frame = ttk.Frame(batch_tab)
+        batch_input_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(batch_input_frame, text="Markdown Folder:").pack(side=tk.LEFT)
+        self.batch_input_var = tk.StringVar()
+        ttk.Entry(batch_input_frame, textvariable=self.batch_input_var, width=40).pack(side=tk.LEFT, padx=5,
+                                                                                       fill=tk.X, expand=True)
+        ttk.Button(batch_input_frame, text="Browse",
+                   command=lambda: self.browse_directory(self.batch_input_var)).pack(side=tk.RIGHT)
+
+        batch_output_frame = ttk.Frame(batch_tab)
+        batch_output_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(batch_output_frame, text="Output Folder:").pack(side=tk.LEFT)
+        self.batch_output_var = tk.StringVar()
+        ttk.Entry(batch_output_frame, textvariable=self.batch_output_var, width=40).pack(side=tk.LEFT, padx=5,
+                                                                                         fill=tk.X, expand=True)
+        ttk.Button(batch_output_frame, text="Browse",
+                   command=lambda: self.browse_directory(self.batch_output_var)).pack(side=tk.RIGHT)
+
+        # Per-file results of the last batch run
+        self.batch_log = scrolledtext.ScrolledText(batch_tab, height=8, font=("Courier New", 10))
+        self.batch_log.pack(fill=tk.BOTH, expand=True, pady=5)
+
+        self.batch_button = ttk.Button(batch_tab, text="Convert Folder", command=self.start_batch_conversion)
+        self.batch_button.pack(anchor=tk.E, pady=5)
+
         # Common settings area (outside the notebook)
         # Output file selection
         output_frame = ttk.Frame(main_frame)
@@ -101,6 +2931,27 @@ class MarkdownToPPTXConverter:
         incremental_check = ttk.Checkbutton(options_frame, text="Incremental bullets", variable=self.incremental_var)
         incremental_check.pack(anchor=tk.W, pady=2)
 
+        self.reuse_slides_var = tk.BooleanVar(value=False)
+        reuse_slides_check = ttk.Checkbutton(options_frame, text="Only rebuild changed slides (large decks)",
+                                             variable=self.reuse_slides_var)
+        reuse_slides_check.pack(anchor=tk.W, pady=2)
+
+        self.native_var = tk.BooleanVar(value=NATIVE_WRITER_ENABLED)
+        native_check = ttk.Checkbutton(options_frame, text="Fast built-in writer for simple decks (pandoc otherwise)",
+                                       variable=self.native_var)
+        native_check.pack(anchor=tk.W, pady=2)
+
+        self.watch_var = tk.BooleanVar(value=False)
+        watch_check = ttk.Checkbutton(options_frame, text="Watch for changes and reconvert automatically",
+                                      variable=self.watch_var, command=self.toggle_watch_mode)
+        watch_check.pack(anchor=tk.W, pady=2)
+
+        service_frame = ttk.Frame(options_frame)
+        service_frame.pack(fill=tk.X, pady=2)
+        ttk.Label(service_frame, text="Conversion service URL (optional):").pack(side=tk.LEFT)
+        self.service_url_var = tk.StringVar(value=os.environ.get("PPTX_SERVICE_URL", ""))
+        ttk.Entry(service_frame, textvariable=self.service_url_var, width=30).pack(side=tk.LEFT, padx=5)
+
         self.slide_level_var = tk.IntVar(value=2)
         slide_level_frame = ttk.Frame(options_frame)
         slide_level_frame.pack(fill=tk.X, pady=2)
@@ -118,9 +2969,14 @@ class MarkdownToPPTXConverter:
         status_label = ttk.Label(main_frame, textvariable=self.status_var, font=("Arial", 10))
         status_label.pack(pady=5)
 
-        # Convert button
-        convert_button = ttk.Button(main_frame, text="Convert to PowerPoint", command=self.start_conversion)
-        convert_button.pack(pady=10)
+        # Convert and cancel buttons
+        button_frame = ttk.Frame(main_frame)
+        button_frame.pack(pady=10)
+        self.convert_button = ttk.Button(button_frame, text="Convert to PowerPoint", command=self.start_conversion)
+        self.convert_button.pack(side=tk.LEFT, padx=5)
+        self.cancel_button = ttk.Button(button_frame, text="Cancel", command=self.cancel_conversion)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+        self.cancel_button.state(["disabled"])
 
     def browse_input_file(self):
         file_path = filedialog.askopenfilename(
@@ -143,6 +2999,11 @@ class MarkdownToPPTXConverter:
         if file_path:
             self.output_path_var.set(file_path)
 
+    def browse_directory(self, variable):
+        directory = filedialog.askdirectory(title="Select Folder")
+        if directory:
+            variable.set(directory)
+
     def load_file_to_editor(self):
         file_path = self.input_path_var.get()
         if not file_path or not os.path.exists(file_path):
@@ -150,16 +3011,79 @@ class MarkdownToPPTXConverter:
             return
 
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-                self.markdown_editor.delete(1.0, tk.END)
-                self.markdown_editor.insert(tk.END, content)
-
-            # Switch to editor tab
-            self.notebook.select(1)  # Index 1 is the editor tab
-            self.status_var.set(f"Loaded file: {file_path}")
+            file = open(file_path, 'rb')
+            stat = os.fstat(file.fileno())
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not load file: {str(e)}")
+            return
+
+        # A load that's still running is abandoned by its next chunk
+        self.editor_load = {"file": file, "path": file_path, "size": stat.st_size, "read": 0,
+                            "decoder": codecs.getincrementaldecoder("utf-8")()}
+        self.editor_source = {"path": file_path, "signature": (stat.st_mtime_ns, stat.st_size)}
+        self.editor_dirty = False
+        self.markdown_editor.delete(1.0, tk.END)
+        # Read-only until it's all there, so typing can't land in the middle of the load
+        self.markdown_editor.config(state=tk.DISABLED)
+
+        # Switch to editor tab
+        self.notebook.select(1)  # Index 1 is the editor tab
+        self.root.after_idle(self.load_editor_chunk, self.editor_load)
+
+    def load_editor_chunk(self, load):
+        # Inserts one chunk per idle callback so the window keeps redrawing and responding while a big file loads
+        if load is not self.editor_load:
+            load["file"].close()
+            return
+
+        try:
+            data = load["file"].read(EDITOR_LOAD_CHUNK_SIZE)
+            text = load["decoder"].decode(data, final=not data)
         except Exception as e:
+            load["file"].close()
+            self.editor_load = None
+            self.editor_source = None
+            self.markdown_editor.config(state=tk.NORMAL)
+            self.status_var.set("Could not load file")
             messagebox.showerror("Error", f"Could not load file: {str(e)}")
+            return
+
+        if text:
+            self.markdown_editor.config(state=tk.NORMAL)
+            self.markdown_editor.insert(tk.END, text)
+            self.markdown_editor.config(state=tk.DISABLED)
+        if data:
+            load["read"] += len(data)
+            percent = 100 * load["read"] / load["size"] if load["size"] else 100
+            self.progress_var.set(percent)
+            self.status_var.set(f"Loading file... {percent:.0f}%")
+            self.root.after_idle(self.load_editor_chunk, load)
+            return
+
+        # Finish in the next idle callback, after the <<Modified>> events from the inserts have been handled
+        load["file"].close()
+        self.root.after_idle(self.finish_editor_load, load)
+
+    def finish_editor_load(self, load):
+        if load is not self.editor_load:
+            return
+        self.editor_load = None
+        self.markdown_editor.config(state=tk.NORMAL)
+        self.progress_var.set(100)
+        self.status_var.set(f"Loaded file: {load['path']}")
+        if self.live_converter is not None and self.file_watcher is None:
+            self.live_converter.submit(self.markdown_editor.get(1.0, tk.END))
+
+    def can_convert_editor_from_disk(self):
+        # True when the editor holds a big file nobody has touched (in the editor or on disk) since it was loaded
+        if self.editor_source is None or self.editor_dirty:
+            return False
+        try:
+            stat = os.stat(self.editor_source["path"])
+        except OSError:
+            return False
+        return (stat.st_size >= EDITOR_DIRECT_CONVERT_BYTES
+                and (stat.st_mtime_ns, stat.st_size) == self.editor_source["signature"])
 
     def insert_sample_markdown(self):
         sample = """# Presentation Title
@@ -202,6 +3126,11 @@ Content for subsection
         # Get current tab
         current_tab = self.notebook.index(self.notebook.select())
 
+        # The batch tab converts a whole folder instead
+        if current_tab == 2:
+            self.start_batch_conversion()
+            return
+
         # Check if output path is specified
         output_path = self.output_path_var.get()
         if not output_path:
@@ -214,99 +3143,285 @@ Content for subsection
             if not input_path or not os.path.exists(input_path):
                 messagebox.showerror("Error", "Please specify a valid input file")
                 return
-            use_temp_file = False
+            markdown_content = None
+        elif self.can_convert_editor_from_disk():  # Editor Tab, unmodified big file
+            # No need to copy megabytes back out of the widget, pandoc gets the file itself
+            input_path = self.editor_source["path"]
+            markdown_content = None
         else:  # Editor Tab
+            if self.editor_load is not None:
+                messagebox.showerror("Error", "The file is still loading into the editor")
+                return
+
             # Get content from the editor
             markdown_content = self.markdown_editor.get(1.0, tk.END)
             if not markdown_content.strip():
                 messagebox.showerror("Error", "Markdown content is empty")
                 return
 
-            # Create a temporary file for the markdown content
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.md', mode='w', encoding='utf-8')
-            temp_file.write(markdown_content)
-            temp_file.close()
-            input_path = temp_file.name
-            use_temp_file = True
+            # Editor content is piped straight into pandoc
+            input_path = None
 
-        # Start conversion in a separate thread to keep UI responsive
-        self.status_var.set("Converting...")
-        self.progress_var.set(10)
+        job = {"theme": self.theme_var.get(), "slide_level": self.slide_level_var.get(),
+               "incremental": self.incremental_var.get(), "reuse_slides": self.reuse_slides_var.get(),
+               "native": self.native_var.get(), "output_path": os.path.abspath(output_path)}
+        if markdown_content is None:
+            job["input_path"] = os.path.abspath(input_path)
+        else:
+            job["markdown"] = markdown_content
 
-        conversion_thread = threading.Thread(target=self.perform_conversion, args=(input_path, use_temp_file))
-        conversion_thread.daemon = True
-        conversion_thread.start()
+        # The conversion runs on the engine's workers (or in the service), the window just polls its status
+        client = self.get_conversion_client()
+        try:
+            job_id = client.submit(job)
+        except EngineBusy:
+            messagebox.showerror("Error", "The conversion service is busy, please try again in a moment")
+            return
+        except (ConversionError, ValueError) as e:
+            messagebox.showerror("Error", str(e))
+            return
 
-    def perform_conversion(self, input_path, use_temp_file=False):
+        self.conversion_job = {"client": client, "id": job_id, "output_path": output_path, "cancelling": False}
+        self.convert_button.state(["disabled"])
+        self.cancel_button.state(["!disabled"])
+        self.status_var.set("Converting...")
+        self.progress_var.set(0)
+        self.root.after(SERVICE_POLL_MS, self.poll_conversion, self.conversion_job)
+
+    def get_conversion_client(self):
+        # With a service URL this window is just another client of `main.py serve`
+        service_url = self.service_url_var.get().strip()
+        if service_url:
+            return ConversionServiceClient(service_url)
+        if self.engine is None:
+            self.engine = ConversionEngine(workers=1)
+        return self.engine
+
+    def poll_conversion(self, job):
+        if job is not self.conversion_job:
+            return
         try:
-            output_path = self.output_path_var.get()
-            theme = self.theme_var.get()
-            slide_level = self.slide_level_var.get()
-            incremental = self.incremental_var.get()
-
-            # Build pandoc command
-            cmd = [
-                "pandoc",
-                input_path,
-                "-o", output_path,
-                "-t", "pptx",
-                "--slide-level", str(slide_level)
-            ]
-
-            # Add theme if not default
-            if theme != "default":
-                cmd.extend(["-V", f"theme={theme}"])
-
-            # Add incremental option if selected
-            if incremental:
-                cmd.extend(["-i"])
-
-            self.progress_var.set(30)
-
-            # Execute pandoc command
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-
-            self.progress_var.set(50)
-            stdout, stderr = process.communicate()
-
-            self.progress_var.set(90)
-
-            # Clean up temp file if used
-            if use_temp_file and os.path.exists(input_path):
-                try:
-                    os.unlink(input_path)
-                except:
-                    pass
+            status = job["client"].status(job["id"])
+        except (ConversionError, JobNotFound) as e:
+            self.finish_conversion(job["output_path"], None, ConversionError(str(e)))
+            return
 
-            # Check for errors
-            if process.returncode != 0:
-                self.root.after(0, lambda: messagebox.showerror("Conversion Error", f"Error: {stderr}"))
-                self.root.after(0, lambda: self.status_var.set("Conversion failed"))
-            else:
-                self.root.after(0, lambda: messagebox.showinfo("Success", f"Successfully converted to {output_path}"))
-                self.root.after(0, lambda: self.status_var.set("Conversion completed"))
+        if status["status"] == "done":
+            self.finish_conversion(job["output_path"], status["slides"], None)
+        elif status["status"] == "failed":
+            self.finish_conversion(job["output_path"], None, ConversionError(status["error"]))
+        elif status["status"] == "cancelled":
+            self.finish_conversion(job["output_path"], None, ConversionCancelled(status["error"]))
+        else:
+            progress = status["progress"]
+            if status["status"] == "queued":
+                self.status_var.set(f"Waiting for the conversion service ({status['queue_position']} ahead)")
+            elif progress["stage"]:
+                self.show_conversion_progress(progress["stage"], progress["done"], progress["total"])
+            self.root.after(SERVICE_POLL_MS, self.poll_conversion, job)
+
+    def cancel_conversion(self):
+        job = self.conversion_job
+        if job is not None:
+            job["cancelling"] = True
+            self.cancel_button.state(["disabled"])
+            self.status_var.set("Cancelling...")
+            try:
+                job["client"].cancel(job["id"])
+            except (ConversionError, JobNotFound):
+                pass
+
+    def toggle_watch_mode(self):
+        if self.watch_var.get():
+            self.start_watch_mode()
+        else:
+            self.stop_watch_mode()
+            self.status_var.set("Watch mode off")
+
+    def start_watch_mode(self):
+        current_tab = self.notebook.index(self.notebook.select())
+        output_path = self.output_path_var.get()
+        if not output_path:
+            messagebox.showerror("Error", "Please specify an output file")
+            self.watch_var.set(False)
+            return
+        if current_tab == 0:
+            input_path = self.input_path_var.get()
+            if not input_path or not os.path.exists(input_path):
+                messagebox.showerror("Error", "Please specify a valid input file")
+                self.watch_var.set(False)
+                return
+            resource_path = os.path.dirname(os.path.abspath(input_path))
+        elif current_tab == 1:
+            input_path = None
+            resource_path = None
+        else:
+            messagebox.showerror("Error", "Watch mode works with a single file or the editor")
+            self.watch_var.set(False)
+            return
+
+        # Options are read once here, the same ones start_conversion uses; toggle watch mode off and on to pick
+        # up new ones
+        self.live_converter = LiveConverter(
+            output_path, self.theme_var.get(), self.slide_level_var.get(), self.incremental_var.get(),
+            resource_path=resource_path,
+            on_result=lambda result: self.root.after(0, self.show_live_result, result),
+            reuse_slides=self.reuse_slides_var.get(), native=self.native_var.get())
+
+        if input_path:
+            self.file_watcher = FileWatcher(input_path, self.live_converter.submit)
+            self.file_watcher.start()
+            self.status_var.set(f"Watching {os.path.basename(input_path)}...")
+        else:
+            self.live_converter.submit(self.markdown_editor.get(1.0, tk.END))
+            self.status_var.set("Watching the editor...")
+
+    def stop_watch_mode(self):
+        if self.file_watcher is not None:
+            self.file_watcher.stop()
+            self.file_watcher = None
+        if self.live_converter is not None:
+            self.live_converter.close()
+            self.live_converter = None
+
+    def on_editor_modified(self, event=None):
+        if not self.markdown_editor.edit_modified():
+            return
+        # Reset the flag so the next keystroke fires <<Modified>> again
+        self.markdown_editor.edit_modified(False)
+        # Inserts made by the file loader aren't edits
+        if self.editor_load is not None:
+            return
+        self.editor_dirty = True
+        if self.live_converter is not None and self.file_watcher is None:
+            self.live_converter.submit(self.markdown_editor.get(1.0, tk.END))
+
+    def show_live_result(self, result):
+        # Results from a converter that has since been stopped don't matter any more
+        if self.live_converter is None or result["status"] == "superseded":
+            return
+        if result["status"] == "converted":
+            self.status_var.set(f"Updated {os.path.basename(result['output'])} "
+                                f"at {time.strftime('%H:%M:%S')} ({result['seconds']:.1f}s)")
+        else:
+            error = result["error"].strip().splitlines()[-1] if result["error"].strip() else "unknown error"
+            self.status_var.set(f"Conversion failed, keeping the last good output: {error}")
+
+    def on_close(self):
+        if self.conversion_job is not None:
+            self.cancel_conversion()
+        if self.engine is not None:
+            self.engine.close()
+        self.stop_watch_mode()
+        close_asset_workers()
+        self.root.destroy()
+
+    def start_batch_conversion(self):
+        input_dir = self.batch_input_var.get()
+        output_dir = self.batch_output_var.get()
+        if not input_dir or not os.path.isdir(input_dir):
+            messagebox.showerror("Error", "Please select a valid Markdown folder")
+            return
+        if not output_dir:
+            messagebox.showerror("Error", "Please select an output folder")
+            return
+
+        # Read the options here, Tk variables shouldn't be touched from the worker thread
+        converter = BatchConverter(input_dir, output_dir, self.theme_var.get(), self.slide_level_var.get(),
+                                   self.incremental_var.get(), reuse_slides=self.reuse_slides_var.get(),
+                                   timeout=CONVERSION_TIMEOUT_SECONDS, native=self.native_var.get())
+
+        self.batch_log.delete(1.0, tk.END)
+        self.batch_button.state(["disabled"])
+        self.status_var.set(f"Converting folder with {converter.workers} workers...")
+        self.progress_var.set(0)
 
-                # Ask if user wants to open the file
-                if messagebox.askyesno("Open File", "Would you like to open the PowerPoint file?"):
-                    self.open_file(output_path)
+        batch_thread = threading.Thread(target=self.perform_batch_conversion, args=(converter,))
+        batch_thread.daemon = True
+        batch_thread.start()
 
-            self.progress_var.set(100)
+    def perform_batch_conversion(self, converter):
+        def on_progress(done, total, result):
+            self.root.after(0, self.show_batch_progress, done, total, result)
 
+        try:
+            summary = converter.run(on_progress)
+            self.root.after(0, self.finish_batch_conversion, summary, None)
         except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("Error", f"An error occurred: {str(e)}"))
-            self.root.after(0, lambda: self.status_var.set("Error occurred"))
+            self.root.after(0, self.finish_batch_conversion, None, e)
+
+    def show_batch_progress(self, done, total, result):
+        self.progress_var.set(100 * done / total)
+        line = f"{result['status']:<9} {result['seconds']:7.2f}s  {result['input']}"
+        if result.get("error"):
+            line += f"  ({result['error'].strip()})"
+        self.batch_log.insert(tk.END, line + "\n")
+        self.batch_log.see(tk.END)
+
+    def finish_batch_conversion(self, summary, error):
+        self.batch_button.state(["!disabled"])
+        if error is not None:
+            self.status_var.set("Error occurred")
+            messagebox.showerror("Error", f"An error occurred: {str(error)}")
+            return
 
-            # Clean up temp file if used
-            if use_temp_file and os.path.exists(input_path):
-                try:
-                    os.unlink(input_path)
-                except:
-                    pass
+        self.progress_var.set(100)
+        self.status_var.set(
+            f"{summary['converted']} converted, {summary['skipped']} unchanged, {summary['failed']} failed "
+            f"in {summary['elapsed_seconds']:.1f}s")
+
+    def show_conversion_progress(self, stage, done, total):
+        if self.conversion_job is None or self.conversion_job["cancelling"]:
+            return
+
+        if stage == "pandoc":
+            # pandoc doesn't report anything while it builds the deck, so just show that it's busy
+            if str(self.progress_bar.cget("mode")) != "indeterminate":
+                self.progress_bar.config(mode="indeterminate")
+                self.progress_bar.start(20)
+            self.status_var.set("Building slides...")
+        elif stage == "slides":
+            self.progress_var.set(80 * done / total)
+            self.status_var.set(f"Parsed {done} of {total} slides")
+        elif stage == "diagrams":
+            self.progress_var.set(20 * done / total if total else 0)
+            self.status_var.set(f"Rendered {done} of {total} diagrams")
+        elif stage == "images":
+            self.progress_var.set(20 * done / total if total else 0)
+            self.status_var.set(f"Prepared {done} of {total} images")
+
+    def finish_conversion(self, output_path, slide_stats, error):
+        self.conversion_job = None
+        self.progress_bar.stop()
+        self.progress_bar.config(mode="determinate")
+        self.convert_button.state(["!disabled"])
+        self.cancel_button.state(["disabled"])
+
+        if isinstance(error, ConversionCancelled):
+            self.progress_var.set(0)
+            self.status_var.set("Conversion cancelled")
+            return
+        if error is not None:
+            self.progress_var.set(0)
+            if isinstance(error, ConversionError):
+                messagebox.showerror("Conversion Error", str(error))
+                self.status_var.set("Conversion failed")
+            else:
+                messagebox.showerror("Error", f"An error occurred: {str(error)}")
+                self.status_var.set("Error occurred")
+            return
+
+        self.progress_var.set(100)
+        if slide_stats and slide_stats["slides"] is not None:
+            self.status_var.set(f"Conversion completed ({slide_stats['parsed']} of {slide_stats['slides']} "
+                                f"slides rebuilt)")
+        else:
+            self.status_var.set("Conversion completed")
+        messagebox.showinfo("Success", f"Successfully converted to {output_path}")
+
+        # Ask if user wants to open the file
+        if messagebox.askyesno("Open File", "Would you like to open the PowerPoint file?"):
+            self.open_file(output_path)
 
     def open_file(self, file_path):
         try:
@@ -319,7 +3434,120 @@ Content for subsection
             messagebox.showerror("Error", f"Could not open file: {str(e)}")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert Markdown into PowerPoint presentations.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    batch_parser = subparsers.add_parser("batch", help="Convert every Markdown file in a folder tree")
+    batch_parser.add_argument("input_dir", help="Folder to search for .md files")
+    batch_parser.add_argument("output_dir", help="Folder to write .pptx files (and the manifest) to")
+    batch_parser.add_argument("--theme", default="default", help="Presentation theme")
+    batch_parser.add_argument("--slide-level", type=int, default=2, help="Heading level that starts a slide")
+    batch_parser.add_argument("--incremental", action="store_true", help="Incremental bullets")
+    batch_parser.add_argument("--workers", type=int, default=None, help="Parallel conversions (default: cores)")
+    batch_parser.add_argument("--force", action="store_true", help="Reconvert even if nothing changed")
+    batch_parser.add_argument("--reuse-slides", action="store_true",
+                              help="Only re-parse slides that changed since the last conversion")
+    batch_parser.add_argument("--timeout", type=float, default=CONVERSION_TIMEOUT_SECONDS,
+                              help="Give up on a single deck after this many seconds")
+    batch_parser.add_argument("--pandoc-only", action="store_true",
+                              help="Always convert with pandoc, even decks the built-in writer could handle")
+
+    watch_parser = subparsers.add_parser("watch", help="Reconvert a Markdown file every time it changes")
+    watch_parser.add_argument("input", help="Markdown file to watch")
+    watch_parser.add_argument("output", help="PowerPoint file to keep up to date")
+    watch_parser.add_argument("--theme", default="default", help="Presentation theme")
+    watch_parser.add_argument("--slide-level", type=int, default=2, help="Heading level that starts a slide")
+    watch_parser.add_argument("--incremental", action="store_true", help="Incremental bullets")
+    watch_parser.add_argument("--debounce", type=float, default=WATCH_DEBOUNCE_SECONDS,
+                              help="Seconds to wait for changes to settle before converting")
+    watch_parser.add_argument("--reuse-slides", action="store_true",
+                              help="Only re-parse slides that changed since the last conversion")
+    watch_parser.add_argument("--pandoc-only", action="store_true",
+                              help="Always convert with pandoc, even decks the built-in writer could handle")
+
+    serve_parser = subparsers.add_parser("serve", help="Run a local conversion service (HTTP + JSON)")
+    serve_parser.add_argument("--host", default=SERVICE_HOST, help="Address to listen on")
+    serve_parser.add_argument("--port", type=int, default=SERVICE_PORT, help="Port to listen on")
+    serve_parser.add_argument("--workers", type=int, default=ENGINE_WORKERS, help="Parallel conversions")
+    serve_parser.add_argument("--queue-size", type=int, default=ENGINE_QUEUE_SIZE,
+                              help="Jobs that can wait for a worker before new ones are rejected with 503")
+    serve_parser.add_argument("--timeout", type=float, default=CONVERSION_TIMEOUT_SECONDS,
+                              help="Give up on a single job after this many seconds")
+    serve_parser.add_argument("--input-dir", default=SERVICE_INPUT_DIR,
+                              help="Jobs may only read Markdown files inside this folder (default: your home folder)")
+    serve_parser.add_argument("--output-dir", default=SERVICE_OUTPUT_DIR,
+                              help="Jobs may only write .pptx files inside this folder (default: your home folder)")
+
+    return parser.parse_args()
+
+
+def run_service(args):
+    # Jobs may name input/output paths, so only expose this beyond localhost if you trust every client
+    engine = ConversionEngine(args.workers, args.queue_size, args.timeout)
+    server = ThreadingHTTPServer((args.host, args.port), ConversionRequestHandler)
+    server.daemon_threads = True
+    server.engine = engine
+    server.input_root = args.input_dir
+    server.output_root = args.output_dir
+    # Clients reaching us by the address we listen on send that as their Host
+    if args.host not in ("", "0.0.0.0", "::"):
+        server.allowed_hosts = (f"[{args.host}]" if ":" in args.host else args.host.lower(),)
+    logger.info("Conversion service on http://%s:%d with %d workers, queue of %d, reading inside %s, writing "
+                "inside %s", args.host, server.server_address[1], args.workers, args.queue_size,
+                os.path.realpath(args.input_dir), os.path.realpath(args.output_dir))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        engine.close()
+        close_asset_workers()
+
+
+def run_watch(args):
+    def on_result(result):
+        if result["status"] == "converted":
+            print(f"{time.strftime('%H:%M:%S')} updated {result['output']} ({result['seconds']:.2f}s)")
+        elif result["status"] == "failed":
+            print(f"{time.strftime('%H:%M:%S')} conversion failed, keeping the last good output\n"
+                  f"{result['error'].strip()}")
+
+    live_converter = LiveConverter(args.output, args.theme, args.slide_level, args.incremental,
+                                   resource_path=os.path.dirname(os.path.abspath(args.input)),
+                                   debounce=args.debounce, on_result=on_result, reuse_slides=args.reuse_slides,
+                                   native=not args.pandoc_only)
+    watcher = FileWatcher(args.input, live_converter.submit)
+    watcher.start()
+    print(f"Watching {args.input}, press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+        live_converter.close()
+
+
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = MarkdownToPPTXConverter(root)
-    root.mainloop()
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = parse_args()
+    if args.command == "batch":
+        converter = BatchConverter(args.input_dir, args.output_dir, args.theme, args.slide_level, args.incremental,
+                                   args.workers, args.force, args.reuse_slides, args.timeout,
+                                   native=not args.pandoc_only)
+        summary = converter.run(lambda done, total, result: print(
+            f"[{done}/{total}] {result['status']:<9} {result['seconds']:7.2f}s  {result['input']}"))
+        print(json.dumps({key: value for key, value in summary.items() if key != "files"}, indent=2))
+    elif args.command == "watch":
+        run_watch(args)
+    elif args.command == "serve":
+        run_service(args)
+    else:
+        if tk is None:
+            raise SystemExit("The window needs tkinter; batch, watch and serve work without it")
+        root = tk.Tk()
+        app = MarkdownToPPTXConverter(root)
+        root.mainloop()
\ No newline at end of file
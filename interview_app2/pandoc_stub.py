@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+### PANDOC STUB ###
+# Stands in for pandoc when timing the Python side of main.py without pandoc installed, e.g. in CI:
+#   PANDOC=/path/to/pandoc_stub.py python main.py batch decks/ out/
+#   python benchmark.py suite --pandoc-stub
+# It takes the arguments main.py passes to pandoc and reads all of its input the way pandoc would, then writes a
+# placeholder zip with one entry per slide instead of a real deck. Slide counts line up with pandoc's for plain
+# decks at --slide-level 2, but its run time, memory and output size say nothing about pandoc itself.
+
+# Imports
+import argparse
+import io
+import re
+import sys
+import zipfile
+
+HEADING_RE = re.compile(r"^ {0,3}(#{1,6})(\s|$)")
+CODE_FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+
+
+def count_slides(markdown_text, slide_level):
+    # A slide (or section title slide) per heading at or above the slide level, plus the title slide
+    lines = markdown_text.splitlines()
+    slides = 0
+    if lines and lines[0].strip() == "---":
+        for index, line in enumerate(lines[1:], 1):
+            if line.strip() in ("---", "..."):
+                lines = lines[index + 1:]
+                break
+            if line.startswith("title:"):
+                slides = 1
+
+    fence = None
+    for line in lines:
+        match = CODE_FENCE_RE.match(line)
+        if match:
+            if fence is None:
+                fence = match.group(1)
+            elif match.group(1).startswith(fence):
+                fence = None
+            continue
+        match = HEADING_RE.match(line)
+        if fence is None and match and len(match.group(1)) <= slide_level:
+            slides += 1
+    return slides
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline stand-in for pandoc's Markdown to PPTX conversion.")
+    parser.add_argument("input", nargs="?", default="-")
+    parser.add_argument("-o", "--output", default="-")
+    parser.add_argument("-f", "--from", dest="input_format", default="markdown")
+    parser.add_argument("-t", "--to", dest="output_format", default="pptx")
+    parser.add_argument("--slide-level", type=int, default=2)
+    parser.add_argument("-i", "--incremental", action="store_true")
+    parser.add_argument("-V", "--variable", action="append", default=[])
+    parser.add_argument("--resource-path")
+    return parser.parse_args()
+
+
+# Run
+if __name__ == "__main__":
+    args = parse_args()
+    if args.output_format != "pptx":
+        sys.stderr.write(f"pandoc stub: only pptx output is supported, not {args.output_format}\n")
+        raise SystemExit(2)
+
+    if args.input == "-":
+        data = sys.stdin.buffer.read()
+    else:
+        with open(args.input, 'rb') as file:
+            data = file.read()
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for index in range(count_slides(data.decode("utf-8", errors="replace"), args.slide_level)):
+            archive.writestr(f"ppt/slides/slide{index + 1}.xml", "<p:sld/>")
+
+    if args.output == "-":
+        sys.stdout.buffer.write(buffer.getvalue())
+    else:
+        with open(args.output, 'wb') as file:
+            file.write(buffer.getvalue())